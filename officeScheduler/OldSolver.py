@@ -1,16 +1,26 @@
 # Time-constrained solver for shift scheduling IP
 import argparse
-from multiprocessing import Process, Manager
+import functools
+from multiprocessing import Process, Manager, Queue
+import queue
 import pulp as pl
 import sys
+import time
 
 import officeScheduler.PeopleAndSets as PAS
 import officeScheduler.Parser as Parser
 from officeScheduler.Schedule import Schedule
+from officeScheduler.Solver import Solver, SolverStatus
+from officeScheduler.checkpoint import Checkpoint, checkpoint_path, read_checkpoint, write_checkpoint
+from officeScheduler.heuristics import HeuristicManager
+from officeScheduler.problem_arrays import ProblemArrays
+from officeScheduler.solution_cache import instance_key
 
 
 # TODO: redesign so Solver is a superclass of specific solver implementations
 
+CANCEL_POLL_INTERVAL = 0.1 # seconds between checks for cancellation in anytime mode
+
 
 class SolverManager(object):
 	"""
@@ -22,15 +32,47 @@ class SolverManager(object):
 		timeLimit - max time, in seconds, to run the algorithm; default is 60 seconds; -1 means no time limit
 		optValue - optimal value found; initially 0 since our objective is nonnegative
 		optSolution - optimal variable assignments found (dictionary of names to values); initially None
-		status - status of LP solver ('Optimal', 'Not Solved', 'Infeasible', 'Unbounded', or 'Undefined')
+		status - status of LP solver ('Optimal', 'Not Solved', 'Infeasible', 'Unbounded', or 'Undefined');
+		         'Feasible' if an anytime run stopped with an incumbent that is not certified optimal
+		anytime - if True, the solver process sends back, through a queue, the initialSolution incumbent 
+		          and then CBC's final result (CBC's own intermediate incumbents and bounds aren't 
+		          streamed, as PuLP only reports them when CBC exits); the best schedule received is 
+		          kept when the time limit is reached
+		initialSolution - optional function returning a (value, solution dictionary) pair, 
+		                  run first in the solver process to provide an early incumbent (anytime mode only)
+		bestBound - best known bound on the optimal value (None if unknown)
+		timedOut - True if the solver process was stopped at the time limit
+		progressCallback - optional function called with (value, bound) for each incumbent received (anytime mode only)
+		cancelEvent - optional threading.Event; when set, an anytime run stops and keeps its best incumbent
+		checkpointFile - optional path of a checkpoint (see checkpoint.Checkpoint) of the incumbent and bound, 
+		                 written in anytime mode whenever the incumbent improves and when the run stops; 
+		                 a later anytime run with the same instanceKey starts from its incumbent (as CBC's warm start)
+		instanceKey - key of the instance being solved (see solution_cache.instance_key()), checked against the checkpoint's
 	"""
-	def __init__(self, problem, timeLimit=60):
+	def __init__(self, problem, timeLimit=60, anytime=False, initialSolution=None, progressCallback=None, cancelEvent=None, 
+	             checkpointFile=None, instanceKey=None):
 		super(SolverManager, self).__init__()
 		self.problem = problem
 		self.timeLimit = timeLimit
+		self.anytime = anytime
+		self.initialSolution = initialSolution
+		self.progressCallback = progressCallback
+		self.cancelEvent = cancelEvent
 		self.optValue = 0
 		self.optSolution = None
 		self.status = None
+		self.bestBound = None
+		self.timedOut = False
+		self.checkpointFile = checkpointFile
+		self.instanceKey = instanceKey
+		self.previousElapsed = 0.0
+
+		if self.anytime and self.checkpointFile is not None:
+			self.resumeFromCheckpoint()
+
+		if self.anytime and self.timeLimit > 0:
+			self.solveAnytime()
+			return
 
 		if self.timeLimit > 0:
 			# Run PuLP solver as a separate process to enforce time limit
@@ -41,6 +83,7 @@ class SolverManager(object):
 			solverProcess.join(timeout=self.timeLimit)
 
 			# Terminate if solver takes too long
+			self.timedOut = solverProcess.is_alive()
 			solverProcess.terminate()
 		else:
 			# Solve with no time limit
@@ -56,6 +99,87 @@ class SolverManager(object):
 			self.status = returnDict['status']
 
 
+	def solveAnytime(self):
+		"""
+		Runs the solver in a separate process that reports incumbents through a queue 
+		(see solveIPAnytime()), keeping the best one received before the time limit. 
+		The final message's status is only taken if it settles the problem 
+		('Optimal', 'Infeasible' or 'Unbounded') or if no incumbent is held, 
+		so that e.g. a CBC timeout doesn't discard the heuristic incumbent. 
+		"""
+		deadline = time.time() + self.timeLimit
+		messages = Queue()
+		solverProcess = Process(target=solveIPAnytime, args=(self.problem, messages, self.timeLimit, self.initialSolution))
+		solverProcess.start()
+
+		finished = False
+		while not finished:
+			remaining = deadline - time.time()
+			if remaining <= 0:
+				break
+			if self.cancelEvent is not None and self.cancelEvent.is_set():
+				break
+			try:
+				message = messages.get(timeout=min(remaining, CANCEL_POLL_INTERVAL))
+			except queue.Empty:
+				continue
+
+			if message.get('bound') is not None:
+				self.bestBound = message['bound']
+			if message['solution'] is not None and (self.optSolution is None or self.isImprovement(message['value'])):
+				self.optValue = message['value']
+				self.optSolution = message['solution']
+				self.status = 'Feasible'
+				if self.progressCallback is not None:
+					self.progressCallback(self.optValue, self.bestBound)
+				self.writeCheckpoint(time.time() - (deadline - self.timeLimit))
+			if message['kind'] == 'final':
+				finished = True
+				if message['status'] in ['Optimal', 'Infeasible', 'Unbounded'] or self.optSolution is None:
+					self.status = message['status']
+
+		self.timedOut = not finished and not (self.cancelEvent is not None and self.cancelEvent.is_set())
+		self.writeCheckpoint(time.time() - (deadline - self.timeLimit))
+		solverProcess.join(timeout=1)
+		if solverProcess.is_alive():
+			solverProcess.terminate()
+
+
+	def resumeFromCheckpoint(self):
+		"""
+		Makes the incumbent of this instance's checkpoint, if there is one, 
+		the first incumbent of the run (unless initialSolution finds a better one). 
+		"""
+		checkpoint = read_checkpoint(self.checkpointFile, self.instanceKey)
+		if checkpoint is None:
+			return
+		self.previousElapsed = checkpoint.elapsed
+		self.bestBound = checkpoint.bound
+		if checkpoint.incumbent is not None:
+			solution = {var.name: checkpoint.incumbent.get(var.name, 0.0) for var in self.problem.variables()}
+			self.initialSolution = functools.partial(bestInitialSolution, self.initialSolution, checkpoint.incumbent_value, solution)
+
+
+	def writeCheckpoint(self, elapsed):
+		"""
+		Writes the incumbent and bound to self.checkpointFile (if set). 
+		"""
+		if self.checkpointFile is None:
+			return
+		checkpoint = Checkpoint(self.instanceKey, self.optValue, Checkpoint.compact_solution(self.optSolution), self.bestBound, 
+		                        elapsed=self.previousElapsed + elapsed)
+		write_checkpoint(self.checkpointFile, checkpoint)
+
+
+	def isImprovement(self, value):
+		"""
+		Returns True if value is strictly better than self.optValue for the problem's sense.
+		"""
+		if self.problem.sense == pl.LpMaximize:
+			return value > self.optValue
+		return value < self.optValue
+
+
 class SolverTimeoutError(Exception):
 	"""
 	Error raised when the solver exceeds the specified time limit.
@@ -106,12 +230,65 @@ def solveIP(problem, returnDict):
 	returnDict['optValue'] = pl.value(problem.objective)
 
 
-def buildSchedulingLP(numDays, people, setConstraints):
+def solveIPAnytime(problem, messages, timeLimit, initialSolution=None):
+	"""
+	Solver process body for SolverManager's anytime mode. 
+	Sends dictionaries with keys 'kind' ('incumbent' or 'final'), 'status', 'value', 
+	'solution' and 'bound' to the messages queue: first the incumbent from 
+	initialSolution (if given), then the result of CBC run with its own time limit, 
+	slightly shorter than timeLimit so that its best incumbent can still be sent back.
+	"""
+	startTime = time.time()
+	if initialSolution is not None:
+		value, solution = initialSolution()
+		if solution is not None:
+			messages.put({'kind': 'incumbent', 'status': 'Feasible', 'value': value, 'solution': solution, 'bound': None})
+
+			# Pass the incumbent to CBC as a warm start
+			for var in problem.variables():
+				if var.name in solution:
+					var.setInitialValue(solution[var.name])
+
+	cbcTimeLimit = max(1, 0.9 * timeLimit - (time.time() - startTime) - 0.5)
+	solver = pl.PULP_CBC_CMD(msg=False, timeLimit=cbcTimeLimit, warmStart=initialSolution is not None)
+	result = problem.solve(solver)
+
+	message = {'kind': 'final', 'status': pl.LpStatus[result], 'value': pl.value(problem.objective), 'solution': None, 'bound': None}
+	if problem.sol_status in [pl.LpSolutionOptimal, pl.LpSolutionIntegerFeasible]:
+		message['solution'] = {var.name: var.value() for var in problem.variables()}
+		if problem.sol_status == pl.LpSolutionIntegerFeasible:
+			message['status'] = 'Feasible'
+		else:
+			message['bound'] = message['value']
+	messages.put(message)
+
+
+def bestInitialSolution(initialSolution, checkpointValue, checkpointSolution):
+	"""
+	Returns the better (value, solution dictionary) pair of initialSolution() (if given) 
+	and a checkpointed incumbent. 
+	"""
+	if initialSolution is not None:
+		value, solution = initialSolution()
+		if solution is not None and value > checkpointValue:
+			return value, solution
+	return checkpointValue, checkpointSolution
+
+
+def buildSchedulingLP(numDays, people, setConstraints, synergyFormulation='aggregated', integer=False):
 	"""
 	Given outputs of Parser.parseCSVs(), 
 	constructs a PuLP LpProblem representing the scheduling problem.
 	The objective is to maximize the number of person-days. 
+
+	synergyFormulation is 'aggregated' (one big-M row per team and day) or 
+	'disaggregated' (one row y_{k,j} <= x_{i,j} per team member and day, 
+	with a tighter LP relaxation). 
+	If integer is True, the variables are binary instead of continuous. 
 	"""
+	if synergyFormulation not in ['aggregated', 'disaggregated']:
+		raise ValueError('Unsupported synergy formulation \'{0}\'.'.format(synergyFormulation))
+
 	prob = pl.LpProblem('Office_Scheduling_Problem', pl.LpMaximize)
 
 	# Find indices of 'synergy' set constraints
@@ -127,11 +304,13 @@ def buildSchedulingLP(numDays, people, setConstraints):
 	DAYS = range(1, numDays + 1)
 
 
+	category = 'Integer' if integer else 'Continuous'
+
 	# Create decision variables x_{i,j} indicating whether person i is scheduled on day j
-	x = pl.LpVariable.dicts('Schedule', (PEOPLE, DAYS), lowBound=0, upBound=1, cat='Continuous')
+	x = pl.LpVariable.dicts('Schedule', (PEOPLE, DAYS), lowBound=0, upBound=1, cat=category)
 
 	# Create decision variables y_{k,j} indicating whether team k is all present on day j
-	y = pl.LpVariable.dicts('AllTeam', (SYNERGY_SETS, DAYS), lowBound=0, upBound=1, cat='Continuous')
+	y = pl.LpVariable.dicts('AllTeam', (SYNERGY_SETS, DAYS), lowBound=0, upBound=1, cat=category)
 
 	# Add objective: sum of all x_{i,j}
 	prob += 1 * pl.lpSum(x)
@@ -152,10 +331,13 @@ def buildSchedulingLP(numDays, people, setConstraints):
 		for personUID in setConstraint.personList:
 			peopleIndices.append(personUIDs.index(personUID) + 1)
 
-		if setConstraint.constraintType is PAS.SetConstraintType.DEPARTMENT and setConstraint.up_bound > -1:
+		if setConstraint.constraintType is PAS.SetConstraintType.DEPARTMENT:
+			# An up_bound of -1 leaves the department unbounded above, i.e. bounded by its size
+			upBound = setConstraint.up_bound if setConstraint.up_bound > -1 else len(peopleIndices)
+
 			# Add upper-bound constraint for each day
 			for j in DAYS:
-				prob += pl.lpSum([x[i][j] for i in peopleIndices]) <= setConstraint.up_bound, 'Set {0} UB for day {1}'.format(setConstraint.sid, j)
+				prob += pl.lpSum([x[i][j] for i in peopleIndices]) <= upBound, 'Set {0} UB for day {1}'.format(setConstraint.sid, j)
 
 			# Add lower-bound constraint for each day
 			for j in DAYS:
@@ -168,41 +350,162 @@ def buildSchedulingLP(numDays, people, setConstraints):
 
 			# Add constraint to enforce all of set k showing up when y_{k,j} is 1
 			for j in DAYS:
+				if synergyFormulation == 'disaggregated':
+					for i in peopleIndices:
+						prob += y[k][j] <= x[i][j], 'Team {0} needs person {1} on day {2}'.format(setConstraint.sid, i, j)
+					continue
+
 				prob += pl.lpSum(x[i][j] for i in peopleIndices) >= len(peopleIndices) * y[k][j], 'Team {0} all present on day {1} if assigned to be'.format(setConstraint.sid, j)
 		
 		else:
 			pass
 			# # Should never reach this case due to type validation in SetConstraint.__init__()
-			# # Wait... Could reach this case if up_bound is -1 for a DEPARTMENT-type constraint
 			# print('Ignoring unsupported set constraint: sid = {0}, type = {1}.'.format(setConstraint.sid, setConstraint.constraintType))
 
 	return prob
 
 
-def optimizeSchedule(numDays, people, setConstraints, timeLimit):
+def optimizeSchedule(numDays, people, setConstraints, timeLimit, synergyFormulation='aggregated', anytime=False, integer=False):
 	"""
 	Constructs the scheduling IP and attempts to solve with PuLP 
 	within the given time limit.
+	With anytime=True, returns the best schedule found by the time limit 
+	even if it is not certified optimal. 
 	"""
-	schedProb = buildSchedulingLP(numDays, people, setConstraints)
-	varNames = [var.name for var in schedProb.variables()]
-
-	# print(schedProb)
-
-	solverManager = SolverManager(problem=schedProb, timeLimit=timeLimit)
+	solverManager = runSolverManager(numDays, people, setConstraints, timeLimit, synergyFormulation, anytime, integer)
 
 	if solverManager.status is None:
-		raise SolverTimeoutError() # TODO: This may not be true. Other errors can cause status to be None.
-	elif solverManager.status != 'Optimal':
-		import pdb; pdb.set_trace()
+		if solverManager.timedOut:
+			raise SolverTimeoutError()
+		raise SolverFailureError('Solver process ended without reporting a status.')
+	elif solverManager.status not in ['Optimal', 'Feasible']:
 		raise SolverFailureError('Solver failed with status \'{0}\'.'.format(solverManager.status))
 
 	print('Best objective value: ', int(solverManager.optValue))
-	print('The following schedule achieves {0:d} person-days:'.format(int(solverManager.optValue)))
+	print('The following {0}schedule achieves {1:d} person-days:'.format('' if solverManager.status == 'Optimal' else 'feasible (not certified optimal) ', int(solverManager.optValue)))
 
-	optSchedule = Schedule(people=people)
-	optSchedule.buildFromSolutionVariables(solverManager.optSolution)
-	return optSchedule
+	return buildSchedule(people, solverManager.optSolution)
+
+
+def runSolverManager(numDays, people, setConstraints, timeLimit, synergyFormulation='aggregated', anytime=False, integer=False, 
+                     progressCallback=None, cancelEvent=None):
+	"""
+	Builds the scheduling problem and runs a SolverManager on it. 
+	In anytime mode, the primal heuristics provide the first incumbent. 
+	"""
+	schedProb = buildSchedulingLP(numDays, people, setConstraints, synergyFormulation, integer)
+
+	initialSolution = None
+	if anytime:
+		initialSolution = functools.partial(heuristicSolution, numDays, people, setConstraints)
+
+	return SolverManager(problem=schedProb, timeLimit=timeLimit, anytime=anytime, initialSolution=initialSolution, 
+	                     progressCallback=progressCallback, cancelEvent=cancelEvent)
+
+
+def heuristicSolution(numDays, people, setConstraints):
+	"""
+	Runs the primal heuristics at the root and returns their best 
+	(value, solution dictionary) pair, using this module's variable names, or (0, None). 
+	"""
+	arrays = ProblemArrays(numDays, people, setConstraints)
+	heuristicManager = HeuristicManager(arrays)
+	heuristicManager.run_root()
+	if heuristicManager.best_x is None:
+		return 0, None
+
+	x = heuristicManager.best_x
+	solution = {}
+	for i in range(len(people)):
+		for j in range(numDays):
+			solution['Schedule_{0}_{1}'.format(i + 1, j + 1)] = float(x[i, j])
+
+	present = arrays.synergy_present(x)
+	for k in range(len(arrays.synergy_sids)):
+		for j in range(numDays):
+			solution['AllTeam_{0}_{1}'.format(k + 1, j + 1)] = float(present[k, j])
+
+	return heuristicManager.best_value, solution
+
+
+def buildSchedule(people, solution):
+	"""
+	Builds a Schedule from a solution dictionary of this module's variables, 
+	whose names use 1-based person indices rather than uids. 
+	"""
+	uidSolution = {}
+	for varName, value in solution.items():
+		if varName.startswith('Schedule_'):
+			nameParts = varName.split('_')
+			uid = people[int(nameParts[1]) - 1].uid
+			uidSolution['Schedule_{0}_{1}'.format(uid, nameParts[2])] = value
+
+	schedule = Schedule(people=people)
+	schedule.buildFromSolutionVariables(uidSolution)
+	return schedule
+
+
+class PulpSolver(Solver):
+	"""
+	Solver that runs the integer version of this module's PuLP model through 
+	a SolverManager in anytime mode, so that the best schedule found by the 
+	time limit is returned (with status FEASIBLE) instead of nothing. 
+
+	With a checkpoint_directory, the incumbent and bound are checkpointed 
+	there under the instance key, and a later run on the same instance 
+	starts from the checkpointed incumbent. 
+	"""
+	def __init__(self, people, set_constraints, time_limit=-1, synergy_formulation='aggregated', checkpoint_directory=None):
+		super(PulpSolver, self).__init__(people, set_constraints, time_limit)
+		self.num_days = -1
+		if people:
+			self.num_days = len(people[0].dateList)
+		self.synergy_formulation = synergy_formulation
+		self.checkpoint_directory = checkpoint_directory
+		self.best_bound = None
+
+
+	def solve(self):
+		with self.metrics.phase('build'):
+			schedProb = buildSchedulingLP(self.num_days, self.people, self.set_constraints, self.synergy_formulation, integer=True)
+		self.metrics.set('num_variables', len(schedProb.variables()))
+		self.metrics.set('num_constraints', len(schedProb.constraints))
+
+		# The solver process runs the primal heuristics (presolve) before CBC, so both count as solve time
+		with self.metrics.phase('solve'):
+			initialSolution = functools.partial(heuristicSolution, self.num_days, self.people, self.set_constraints)
+			checkpointFile = None
+			instanceKey = None
+			if self.checkpoint_directory is not None:
+				instanceKey = instance_key(self.num_days, self.people, self.set_constraints)
+				checkpointFile = checkpoint_path(self.checkpoint_directory, instanceKey)
+			solverManager = SolverManager(problem=schedProb, timeLimit=self.time_limit, anytime=True, initialSolution=initialSolution, 
+			                              progressCallback=self.report_progress, cancelEvent=self._cancel_event, 
+			                              checkpointFile=checkpointFile, instanceKey=instanceKey)
+		self.best_bound = solverManager.bestBound
+		self.metrics.set('bound', self.best_bound)
+
+		if solverManager.status == 'Optimal':
+			self.status = SolverStatus.OPTIMAL
+		elif solverManager.status == 'Feasible':
+			self.status = SolverStatus.FEASIBLE
+		elif solverManager.status == 'Infeasible':
+			self.status = SolverStatus.INFEASIBLE
+		elif solverManager.status == 'Unbounded':
+			self.status = SolverStatus.UNBOUNDED
+		elif solverManager.timedOut:
+			self.status = SolverStatus.OUT_OF_TIME
+		else:
+			self.status = SolverStatus.NOT_SOLVED
+
+		if solverManager.optSolution is None:
+			self.metrics.publish()
+			return None
+		self.metrics.set('objective', solverManager.optValue)
+		with self.metrics.phase('extract'):
+			self.solution = buildSchedule(self.people, solverManager.optSolution)
+		self.metrics.publish()
+		return self.solution
 
 
 if __name__ == '__main__':
@@ -1,7 +1,6 @@
 # Class definition for representation of a partial/full schedule of shifts
 import io
 import numpy as np
-import pulp as pl
 
 import officeScheduler.Parser as Parser
 import officeScheduler.PeopleAndSets as PAS
@@ -17,8 +16,19 @@ class Schedule(object):
 		people - a list of Person objects (the employees)
 		assignments - a len(people) by n numpy array representing each person's shift assignments 
 		              (-1 if undecided, 0 if assigned off, 1 if assigned to work)
+		setConstraints - a list of SetConstraint objects (departments and synergy teams) for the set queries
+
+	Occupancy and coverage queries (attendance(), presentPeople(), dailyHeadcounts(),
+	setHeadcounts(), synergyPresence(), synergyOverlapDays()) answer for all sets
+	and days at once from the assignments matrix and a sparse membership index
+	of setConstraints, built on first use. Their results are cached until the
+	assignments or setConstraints are replaced, or setAssignment() is called;
+	after editing assignments in place, call invalidateQueries().
 	"""
-	def __init__(self, filepath=None, people=[]):
+	def __init__(self, filepath=None, people=[], setConstraints=None):
+		self._queryCache = {}
+		self._membership = None
+		self._setConstraints = setConstraints if setConstraints is not None else []
 		if filepath is not None:
 			self.buildFromCSV(filepath)
 
@@ -90,6 +100,156 @@ class Schedule(object):
 				person_uid = name_parts[1]
 				day_index = int(name_parts[2])
 				self.assignments[person_uids.index(person_uid), day_index - 1] = int(variablesDict[varName])
+		self.invalidateQueries()
+
+
+	@property
+	def assignments(self):
+		return self._assignments
+
+
+	@assignments.setter
+	def assignments(self, assignments):
+		self._assignments = assignments
+		self.invalidateQueries()
+
+
+	@property
+	def setConstraints(self):
+		return self._setConstraints
+
+
+	@setConstraints.setter
+	def setConstraints(self, setConstraints):
+		self._setConstraints = setConstraints if setConstraints is not None else []
+		self._membership = None
+		self.invalidateQueries()
+
+
+	def invalidateQueries(self):
+		"""
+		Drops the cached query results; needed only after
+		editing self.assignments in place.
+		"""
+		self._queryCache.clear()
+
+
+	def setAssignment(self, personIndex, day, value):
+		"""
+		Sets one person's assignment on one (0-based) day
+		and drops the cached query results.
+		"""
+		self._assignments[personIndex, day] = value
+		self.invalidateQueries()
+
+
+	def _buildMembership(self):
+		"""
+		Builds the sparse (compressed row) membership index of self.setConstraints:
+		the members of set s are the people at rows 
+		members[pointers[s]:pointers[s + 1]] of the assignments matrix.
+		Uids that are not in self.people are ignored.
+		"""
+		uidIndex = {person.uid: i for i, person in enumerate(self.people)}
+		members = []
+		pointers = [0]
+		for setConstraint in self.setConstraints:
+			members.extend(sorted(uidIndex[uid] for uid in set(setConstraint.personList) if uid in uidIndex))
+			pointers.append(len(members))
+
+		self._membership = {
+			'sids': [setConstraint.sid for setConstraint in self.setConstraints],
+			'isSynergy': np.array([setConstraint.constraintType.value == PAS.SetConstraintType.SYNERGY.value 
+			                       for setConstraint in self.setConstraints], dtype=bool),
+			'members': np.array(members, dtype=int),
+			'pointers': np.array(pointers, dtype=int),
+			'sizes': np.diff(pointers),
+			'numPeople': len(self.people),
+		}
+
+
+	def _cached(self, key, compute):
+		if self.assignments is None:
+			raise ValueError('The schedule has no assignments to query.')
+		if key not in self._queryCache:
+			self._queryCache[key] = compute()
+		return self._queryCache[key]
+
+
+	def _setRows(self, constraintType):
+		"""Returns the set ids and a boolean mask of the sets of the given type (all sets if None)."""
+		if self._membership is None or self._membership['numPeople'] != len(self.people):
+			self._buildMembership()
+		sids = self._membership['sids']
+		if constraintType is None:
+			return sids, np.ones(len(sids), dtype=bool)
+		mask = self._membership['isSynergy'] == (constraintType.value == PAS.SetConstraintType.SYNERGY.value)
+		return [sid for sid, selected in zip(sids, mask) if selected], mask
+
+
+	def attendance(self):
+		"""
+		Returns a len(people) by n boolean matrix; True iff the person is
+		assigned to work that day (undecided entries count as absent).
+		"""
+		return self._cached('attendance', lambda: self.assignments == 1)
+
+
+	def presentPeople(self, day):
+		"""
+		Returns the uids of the people assigned to work on the given (0-based) day.
+		"""
+		present = np.flatnonzero(self.attendance()[:, day])
+		return [self.people[i].uid for i in present]
+
+
+	def dailyHeadcounts(self):
+		"""
+		Returns the number of people assigned to work on each day.
+		"""
+		return self._cached('dailyHeadcounts', lambda: self.attendance().sum(axis=0))
+
+
+	def setHeadcounts(self, constraintType=None):
+		"""
+		Returns (sids, headcounts), where headcounts is a len(sids) by n matrix
+		of the number of members of each set assigned to work on each day,
+		for the sets of the given SetConstraintType (all sets if None).
+		"""
+		sids, mask = self._setRows(constraintType)
+		headcounts = self._cached('setHeadcounts', self._computeSetHeadcounts)
+		if constraintType is None:
+			return sids, headcounts
+		return sids, self._cached(('setHeadcounts', constraintType.value), lambda: headcounts[mask])
+
+
+	def _computeSetHeadcounts(self):
+		# One pass over all (set, member) pairs: differences of running sums at the set boundaries
+		membership = self._membership
+		rows = self.attendance()[membership['members']]
+		runningSums = np.zeros((len(rows) + 1, rows.shape[1]), dtype=np.int32)
+		np.cumsum(rows, axis=0, dtype=np.int32, out=runningSums[1:])
+		pointers = membership['pointers']
+		return runningSums[pointers[1:]] - runningSums[pointers[:-1]]
+
+
+	def synergyPresence(self):
+		"""
+		Returns (sids, present), where present is a len(sids) by n boolean matrix;
+		True iff every member of the synergy team is assigned to work that day.
+		"""
+		sids, headcounts = self.setHeadcounts(PAS.SetConstraintType.SYNERGY)
+		sizes = self._membership['sizes'][self._setRows(PAS.SetConstraintType.SYNERGY)[1]]
+		return sids, self._cached('synergyPresence', lambda: headcounts >= sizes[:, None])
+
+
+	def synergyOverlapDays(self):
+		"""
+		Returns (sids, days), where days is the number of days on which 
+		every member of each synergy team is assigned to work.
+		"""
+		sids, present = self.synergyPresence()
+		return sids, self._cached('synergyOverlapDays', lambda: present.sum(axis=1))
 
 
 	def __str__(self):
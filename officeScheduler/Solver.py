@@ -1,14 +1,31 @@
 from abc import ABC, abstractmethod
 import enum
+import threading
+import time
+
+from officeScheduler.metrics import SolverMetrics
 
 class Solver(ABC):
-    """Abstract superclass for solvers of the office scheduling problem."""
+    """
+    Abstract superclass for solvers of the office scheduling problem.
+
+    Subclasses implement the blocking solve(). They may call report_progress()
+    when they find a better schedule or bound, and should check is_cancelled()
+    periodically to support cooperative cancellation.
+    solve_async() and progress_events() run solve() off the asyncio event loop.
+    Subclasses time their phases and report counters through self.metrics,
+    which records nothing until enable_metrics() is called.
+    """
     def __init__(self, people=[], set_constraints=[], time_limit=-1):
         self.people = people
         self.set_constraints = set_constraints
         self.time_limit = time_limit
         self.status = SolverStatus.NOT_SOLVED
         self.solution = None
+        self.start_time = None
+        self._progress_listeners = []
+        self._cancel_event = threading.Event()
+        self.metrics = SolverMetrics(type(self).__name__)
 
 
     @abstractmethod
@@ -16,6 +33,133 @@ class Solver(ABC):
         pass
 
 
+    def enable_metrics(self, sinks=None):
+        """
+        Turns on phase timing and counters; the metrics are sent to the given
+        MetricsSinks when solve() finishes. Returns the SolverMetrics object.
+        """
+        self.metrics.enabled = True
+        if sinks is not None:
+            self.metrics.sinks = list(sinks)
+        return self.metrics
+
+
+    def cancel(self):
+        """Requests that solve() stop as soon as possible, returning the best schedule found so far."""
+        self._cancel_event.set()
+
+
+    def is_cancelled(self):
+        """Returns True if cancel() has been called."""
+        return self._cancel_event.is_set()
+
+
+    def add_progress_listener(self, listener):
+        """Registers a function to be called with a ProgressEvent whenever the solver reports progress."""
+        self._progress_listeners.append(listener)
+
+
+    def remove_progress_listener(self, listener):
+        self._progress_listeners.remove(listener)
+
+
+    def report_progress(self, incumbent=None, bound=None):
+        """
+        Notifies the progress listeners of a new incumbent value and/or bound.
+        Called by subclasses from whichever thread runs solve().
+        """
+        if not self._progress_listeners:
+            return
+        if self.start_time is None:
+            self.start_time = time.time()
+
+        event = ProgressEvent(incumbent, bound, time.time() - self.start_time, self.status)
+        for listener in self._progress_listeners:
+            listener(event)
+
+
+    async def solve_async(self, progress_callback=None, executor=None):
+        """
+        Runs solve() in the given concurrent.futures executor (the event loop's
+        default executor if None) and returns its result.
+        progress_callback, if given, is called on the event loop with each ProgressEvent.
+        If the awaiting task is cancelled, the solver is asked to stop via cancel().
+        """
+        import asyncio # Only needed here; importing it costs more than the rest of this module
+        loop = asyncio.get_running_loop()
+        listener = None
+        if progress_callback is not None:
+            listener = lambda event: loop.call_soon_threadsafe(progress_callback, event)
+            self.add_progress_listener(listener)
+
+        self.start_time = time.time()
+        future = loop.run_in_executor(executor, self.solve)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+        finally:
+            if listener is not None:
+                self.remove_progress_listener(listener)
+
+
+    async def progress_events(self, executor=None):
+        """
+        Asynchronous iterator over the ProgressEvents of a solve() run in the
+        given executor. The last event has done set and carries the schedule
+        returned by solve(). Closing the iterator early cancels the solver.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        listener = lambda event: loop.call_soon_threadsafe(events.put_nowait, event)
+        self.add_progress_listener(listener)
+
+        self.start_time = time.time()
+        future = loop.run_in_executor(executor, self.solve)
+        future.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+
+            schedule = future.result()
+            yield ProgressEvent(None, None, time.time() - self.start_time, self.status, done=True, schedule=schedule)
+        finally:
+            self.remove_progress_listener(listener)
+            if not future.done():
+                self.cancel()
+
+
+class ProgressEvent(object):
+    """
+    Progress report from a running solver.
+
+    Fields:
+        incumbent - objective value of the best schedule found so far (None if unknown)
+        bound - best known bound on the optimal objective value (None if unknown)
+        elapsed - seconds since the solve started
+        status - the solver's SolverStatus when the event was created
+        done - True for the final event of Solver.progress_events()
+        schedule - the Schedule returned by solve() (final event only)
+    """
+    def __init__(self, incumbent, bound, elapsed, status, done=False, schedule=None):
+        self.incumbent = incumbent
+        self.bound = bound
+        self.elapsed = elapsed
+        self.status = status
+        self.done = done
+        self.schedule = schedule
+
+
+    def __repr__(self):
+        return 'ProgressEvent(incumbent={0}, bound={1}, elapsed={2:.3f}, status={3}, done={4})'.format(
+            self.incumbent, self.bound, self.elapsed, self.status, self.done)
+
+
 class SolverStatus(enum.Enum):
     """Enumerated constants for solver status."""
     NOT_SOLVED = 0 # Have not tried to solve
@@ -24,4 +168,3 @@ class SolverStatus(enum.Enum):
     INFEASIBLE = -1 # Problem is infeasible (certified)
     OUT_OF_TIME = -2 # Ran out of time before finding a feasible solution or determining infeasible/unbounded
     UNBOUNDED = 3 # Problem objective can be arbitrarily large (if maximizing; arbitrarily small, if minimizing)
-
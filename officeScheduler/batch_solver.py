@@ -0,0 +1,241 @@
+# Batch solving of many scheduling instances over a pool of worker processes
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import importlib
+import os
+import sys
+import time
+
+import numpy as np
+
+from officeScheduler.direct_ilp_solver import DirectILPSolver
+from officeScheduler.Schedule import Schedule
+from officeScheduler.Solver import SolverStatus
+
+# Modules imported by every worker before it receives its first instance
+WARM_MODULES = ['ortools.linear_solver.pywraplp', 'pulp', 'officeScheduler.ortools_utils', 'officeScheduler.pulp_utils',
+                'officeScheduler.Schedule']
+
+
+class BatchResult(object):
+    """
+    Result of solving one instance of a batch.
+
+    Fields:
+        instance_id - the id given with the instance
+        status - the solver's SolverStatus (NOT_SOLVED if the solver failed)
+        value - objective value of the schedule (None if there is none)
+        schedule - the Schedule found, over the instance's people (None if there is none)
+        elapsed - seconds spent solving in the worker (wall time in the pool if the worker died)
+        error - description of the failure, or None if the solver ran to completion
+    """
+    def __init__(self, instance_id, status, value=None, schedule=None, elapsed=0.0, error=None):
+        self.instance_id = instance_id
+        self.status = status
+        self.value = value
+        self.schedule = schedule
+        self.elapsed = elapsed
+        self.error = error
+
+
+    def __repr__(self):
+        return 'BatchResult(instance_id={0!r}, status={1}, value={2}, elapsed={3:.3f}, error={4!r})'.format(
+            self.instance_id, self.status, self.value, self.elapsed, self.error)
+
+
+class BatchStatistics(object):
+    """
+    Aggregate throughput and latency statistics of a batch run.
+
+    Fields:
+        latencies - per-instance solve times in seconds, in completion order
+        status_counts - dictionary of SolverStatus names to counts
+        failures - number of instances whose solver raised or whose worker died
+        start_time, end_time - wall clock bounds of the run
+    """
+    def __init__(self):
+        self.latencies = []
+        self.status_counts = {}
+        self.failures = 0
+        self.start_time = time.time()
+        self.end_time = None
+
+
+    def record(self, result):
+        self.latencies.append(result.elapsed)
+        self.status_counts[result.status.name] = self.status_counts.get(result.status.name, 0) + 1
+        if result.error is not None:
+            self.failures += 1
+        self.end_time = time.time()
+
+
+    @property
+    def count(self):
+        return len(self.latencies)
+
+
+    @property
+    def wall_time(self):
+        return (self.end_time if self.end_time is not None else time.time()) - self.start_time
+
+
+    @property
+    def throughput(self):
+        """Instances completed per second of wall time."""
+        return self.count / self.wall_time if self.wall_time > 0 else 0.0
+
+
+    def summary(self):
+        """Returns a dictionary of the aggregate statistics."""
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {'instances': self.count,
+                'failures': self.failures,
+                'wall_time': self.wall_time,
+                'throughput': self.throughput,
+                'latency_mean': float(np.mean(latencies)),
+                'latency_p50': float(np.percentile(latencies, 50)),
+                'latency_p95': float(np.percentile(latencies, 95)),
+                'latency_max': float(np.max(latencies)),
+                'status_counts': dict(self.status_counts)}
+
+
+def solve_batch(instances, solver_class=DirectILPSolver, solver_kwargs=None, num_workers=None, time_limit=-1,
+                statistics=None, quiet=True):
+    """
+    Solves a stream of instances over a pool of num_workers processes
+    (one per CPU if None) and yields a BatchResult for each one as it finishes,
+    in completion order.
+
+    instances is any iterable of (instance_id, people, set_constraints) or
+    (instance_id, people, set_constraints, time_limit) tuples; it is consumed
+    lazily, keeping at most two instances per worker in flight.
+    Instances without their own time limit get time_limit.
+    A solver exception fails only its own instance. If a worker process dies,
+    the pool is restarted and the instances that were in flight are rerun one
+    at a time, so only the instance that kills a worker on its own is failed.
+    If statistics (a BatchStatistics) is given, every result is recorded in it.
+    quiet silences the solvers' console output in the workers.
+    """
+    solver_kwargs = solver_kwargs if solver_kwargs is not None else {}
+    num_workers = num_workers if num_workers is not None else (os.cpu_count() or 1)
+    max_in_flight = 2 * num_workers
+    warm_modules = WARM_MODULES + [solver_class.__module__]
+
+    executor = _start_pool(num_workers, warm_modules, quiet)
+    pending = {} # future -> (instance, submit time, isolated)
+    suspects = deque() # Instances in flight when a worker died, to be rerun one at a time
+    instance_iterator = iter(instances)
+    exhausted = False
+    try:
+        while pending or suspects or not exhausted:
+            if suspects:
+                # Rerun suspects alone, so a worker death identifies the instance that caused it
+                if not pending:
+                    instance = suspects.popleft()
+                    executor, future = _submit(executor, instance, time_limit, solver_class, solver_kwargs,
+                                               num_workers, warm_modules, quiet)
+                    pending[future] = (instance, time.time(), True)
+            else:
+                while not exhausted and len(pending) < max_in_flight:
+                    try:
+                        instance = next(instance_iterator)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    executor, future = _submit(executor, instance, time_limit, solver_class, solver_kwargs,
+                                               num_workers, warm_modules, quiet)
+                    pending[future] = (instance, time.time(), False)
+
+            if not pending:
+                continue
+
+            done, _ = wait(list(pending.keys()), return_when=FIRST_COMPLETED)
+            pool_broken = False
+            for future in done:
+                instance, submit_time, isolated = pending.pop(future)
+                instance_id, people = instance[0], instance[1]
+                try:
+                    status_value, value, assignments, elapsed, error = future.result()
+                except BrokenProcessPool:
+                    pool_broken = True
+                    if not isolated:
+                        suspects.append(instance)
+                        continue
+                    result = BatchResult(instance_id, SolverStatus.NOT_SOLVED, elapsed=time.time() - submit_time,
+                                         error='worker process died')
+                else:
+                    schedule = None
+                    if assignments is not None:
+                        schedule = Schedule(people=people)
+                        schedule.n = assignments.shape[1]
+                        schedule.assignments = assignments
+                    result = BatchResult(instance_id, SolverStatus(status_value), value, schedule, elapsed, error)
+
+                if statistics is not None:
+                    statistics.record(result)
+                yield result
+
+            if pool_broken:
+                # Every future still pending belongs to the broken pool and will fail the same way
+                for future, (instance, _, _) in pending.items():
+                    suspects.append(instance)
+                pending = {}
+                executor.shutdown(wait=False)
+                executor = _start_pool(num_workers, warm_modules, quiet)
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _submit(executor, instance, time_limit, solver_class, solver_kwargs, num_workers, warm_modules, quiet):
+    """
+    Submits one instance tuple to the pool, restarting the pool first if a worker has died.
+    Returns the (possibly new) executor and the future.
+    """
+    people, set_constraints = instance[1], instance[2]
+    instance_time_limit = instance[3] if len(instance) > 3 else time_limit
+    try:
+        future = executor.submit(_solve_instance, solver_class, solver_kwargs, people, set_constraints, instance_time_limit)
+    except BrokenProcessPool:
+        executor.shutdown(wait=False)
+        executor = _start_pool(num_workers, warm_modules, quiet)
+        future = executor.submit(_solve_instance, solver_class, solver_kwargs, people, set_constraints, instance_time_limit)
+    return executor, future
+
+
+def _start_pool(num_workers, warm_modules, quiet):
+    return ProcessPoolExecutor(max_workers=num_workers, initializer=_warm_worker, initargs=(warm_modules, quiet))
+
+
+def _warm_worker(warm_modules, quiet):
+    """Worker initializer: imports the solver modules up front so the first instance doesn't pay for them."""
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+    for module_name in warm_modules:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass # Warming is only an optimization; the solver reports the error on its first instance
+
+
+def _solve_instance(solver_class, solver_kwargs, people, set_constraints, time_limit):
+    """
+    Worker body: solves one instance and returns
+    (status value, objective value, assignments, elapsed seconds, error).
+    """
+    start_time = time.time()
+    try:
+        solver = solver_class(people, set_constraints, time_limit, **solver_kwargs)
+        schedule = solver.solve()
+        status = solver.status
+    except Exception as e:
+        return SolverStatus.NOT_SOLVED.value, None, None, time.time() - start_time, '{0}: {1}'.format(type(e).__name__, e)
+
+    assignments = None
+    value = None
+    if schedule is not None and schedule.assignments is not None and status in [SolverStatus.OPTIMAL, SolverStatus.FEASIBLE]:
+        assignments = np.asarray(schedule.assignments)
+        value = float(np.sum(assignments))
+    return status.value, value, assignments, time.time() - start_time, None
@@ -0,0 +1,281 @@
+# Scaling benchmark of the solvers on generated instances
+import argparse
+from collections import OrderedDict
+from multiprocessing import Process, Queue
+import json
+import os
+import queue
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pulp as pl
+
+from officeScheduler.instance_generator import generate_instance, write_instance_csvs
+from officeScheduler.OldSolver import buildSchedulingLP, buildSchedule
+from officeScheduler.ortools_utils import (build_scheduling_ilp, extract_solution,
+    ORTOOLS_SOLVER_STATUS_TO_OURS_MAP)
+import officeScheduler.Parser as Parser
+from officeScheduler.registry import BUILTIN_SOLVERS, get_solver
+from officeScheduler.Schedule import Schedule
+from officeScheduler.Solver import SolverStatus
+
+# Default size sweep: keyword arguments of generate_instance()
+DEFAULT_SIZES = [{'num_people': 50, 'num_days': 10},
+                 {'num_people': 200, 'num_days': 20},
+                 {'num_people': 500, 'num_days': 20},
+                 {'num_people': 1000, 'num_days': 40}]
+
+
+# Modules whose start-up import time is measured: lightweight entry points first, then the backends
+IMPORT_TIME_MODULES = ['officeScheduler.Parser', 'officeScheduler.registry', 'officeScheduler.Schedule',
+                       'officeScheduler.Solver', 'officeScheduler.pulp_utils', 'officeScheduler.ortools_utils',
+                       'officeScheduler.direct_ilp_solver', 'officeScheduler.simple_bnb_solver',
+                       'officeScheduler.OldSolver']
+
+
+def measure_import_times(modules=None, repeats=3):
+    """
+    Returns a dictionary of module names to the seconds a fresh interpreter
+    takes to import them (the minimum over repeats runs, to discount disk caching).
+    """
+    modules = modules if modules is not None else IMPORT_TIME_MODULES
+    import_times = {}
+    for module in modules:
+        code = 'import time; start = time.perf_counter(); import {0}; print(time.perf_counter() - start)'.format(module)
+        times = []
+        for _ in range(repeats):
+            output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+            times.append(float(output.strip().splitlines()[-1]))
+        import_times[module] = min(times)
+    return import_times
+
+
+def run_ortools_phases(num_days, people, set_constraints, time_limit):
+    """Solves with OR-Tools directly, timing the build, solve and extract phases separately."""
+    record = {}
+    start_time = time.time()
+    solver, variables, constraints = build_scheduling_ilp(num_days, people, set_constraints)
+    record['build_time'] = time.time() - start_time
+    record['num_variables'] = solver.NumVariables()
+    record['num_constraints'] = solver.NumConstraints()
+
+    if time_limit > 0:
+        solver.SetTimeLimit(int(time_limit * 1000))
+    start_time = time.time()
+    status = ORTOOLS_SOLVER_STATUS_TO_OURS_MAP.get(solver.Solve(), SolverStatus.NOT_SOLVED)
+    record['solve_time'] = time.time() - start_time
+
+    start_time = time.time()
+    schedule = Schedule(people=people)
+    schedule.buildFromSolutionVariables(extract_solution(solver))
+    record['extract_time'] = time.time() - start_time
+
+    record['status'] = status.name
+    if status in [SolverStatus.OPTIMAL, SolverStatus.FEASIBLE]:
+        record['objective'] = solver.Objective().Value()
+        record['bound'] = solver.Objective().BestBound()
+    return record
+
+
+def run_pulp_phases(num_days, people, set_constraints, time_limit):
+    """Solves with PuLP and CBC directly, timing the build, solve and extract phases separately."""
+    record = {}
+    start_time = time.time()
+    problem = buildSchedulingLP(num_days, people, set_constraints, integer=True)
+    record['build_time'] = time.time() - start_time
+    record['num_variables'] = len(problem.variables())
+    record['num_constraints'] = len(problem.constraints)
+
+    start_time = time.time()
+    problem.solve(pl.PULP_CBC_CMD(msg=False, timeLimit=time_limit if time_limit > 0 else None))
+    record['solve_time'] = time.time() - start_time
+
+    start_time = time.time()
+    solution = {var.name: var.varValue for var in problem.variables()}
+    buildSchedule(people, solution)
+    record['extract_time'] = time.time() - start_time
+
+    if problem.sol_status == pl.LpSolutionOptimal:
+        record['status'] = SolverStatus.OPTIMAL.name
+    elif problem.sol_status == pl.LpSolutionIntegerFeasible:
+        record['status'] = SolverStatus.FEASIBLE.name
+    elif problem.status == pl.LpStatusInfeasible:
+        record['status'] = SolverStatus.INFEASIBLE.name
+    else:
+        record['status'] = SolverStatus.NOT_SOLVED.name
+    if record['status'] in [SolverStatus.OPTIMAL.name, SolverStatus.FEASIBLE.name]:
+        record['objective'] = pl.value(problem.objective)
+    return record
+
+
+def solver_class_runner(solver_class, **kwargs):
+    """
+    Returns a benchmark runner for any Solver subclass (or the name it is 
+    registered under, imported when the runner first runs), which records
+    the phase times and counters reported through the solver's metrics.
+    Sub-day schedules (see multi_resolution) are recorded with their 
+    person-block count as block_objective and their day-level objective as objective.
+    """
+    def run(num_days, people, set_constraints, time_limit):
+        cls = get_solver(solver_class) if isinstance(solver_class, str) else solver_class
+        solver = cls(people, set_constraints, time_limit, **kwargs)
+        metrics = solver.enable_metrics()
+        bounds = []
+        solver.add_progress_listener(lambda event: bounds.append(event.bound) if event.bound is not None else None)
+        start_time = time.time()
+        schedule = solver.solve()
+        record = {'solve_time': time.time() - start_time, 'status': solver.status.name}
+        for phase_name, phase in metrics.phases.items():
+            record['{0}_time'.format(phase_name)] = phase['wall']
+            record['{0}_cpu_time'.format(phase_name)] = phase['cpu']
+        for counter_name, value in metrics.counters.items():
+            record.setdefault(counter_name, value)
+        if schedule is not None and schedule.assignments is not None and solver.status in [SolverStatus.OPTIMAL, SolverStatus.FEASIBLE]:
+            record['objective'] = float(schedule.assignments.sum())
+            if schedule.assignments.shape[1] != num_days:
+                record['block_objective'] = record['objective']
+                record['objective'] = metrics.counters.get('day_objective')
+        if bounds:
+            record['bound'] = bounds[-1]
+        return record
+    return run
+
+
+# Solvers run by default: name -> runner(num_days, people, set_constraints, time_limit) returning a record dictionary
+# The phase-level 'ortools' and 'pulp' runners come first, then every built-in registered
+# solver (see registry), with PulpSolver renamed so it doesn't clash with the 'pulp' runner
+RENAMED_SOLVERS = {'pulp': 'pulp-anytime'}
+DEFAULT_SOLVERS = OrderedDict([('ortools', run_ortools_phases),
+                               ('pulp', run_pulp_phases)])
+for solver_name in BUILTIN_SOLVERS:
+    DEFAULT_SOLVERS[RENAMED_SOLVERS.get(solver_name, solver_name)] = solver_class_runner(solver_name)
+
+
+def lp_bound(num_days, people, set_constraints):
+    """Returns the LP relaxation bound of the instance, the reference for every solver's gap."""
+    solver, variables, constraints = build_scheduling_ilp(num_days, people, set_constraints, integer=False)
+    if solver.Solve() != 0:
+        return None
+    return solver.Objective().Value()
+
+
+def run_benchmark(sizes=None, solvers=None, seeds=(0,), time_limit=60, outputFilepath='benchmark_results.jsonl',
+                  generator_options=None, measure_imports=True):
+    """
+    Runs every solver on a generated instance for every size and seed, and appends
+    one JSON record per run to outputFilepath (JSON lines, so repeated runs accumulate).
+    If measure_imports is True, one record per module of IMPORT_TIME_MODULES with its
+    start-up import time (see measure_import_times()) is written first.
+
+    Each instance is written to CSV and parsed back to time parsing. Each solver runs
+    in its own process, so its peak memory (maximum resident set size of the process
+    and any solver processes it starts) is measured in isolation and a crash or hang
+    only loses that run. A run is abandoned after twice its time limit plus 30 seconds.
+    Returns the list of records.
+    """
+    sizes = sizes if sizes is not None else DEFAULT_SIZES
+    solvers = solvers if solvers is not None else DEFAULT_SOLVERS
+    generator_options = generator_options if generator_options is not None else {}
+    records = []
+    if measure_imports:
+        for module, import_time in measure_import_times().items():
+            record = {'module': module, 'import_time': import_time, 'timestamp': time.time()}
+            records.append(record)
+            with open(outputFilepath, 'a') as outputFile:
+                outputFile.write(json.dumps(record) + '\n')
+
+    tempDirectory = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            for seed in seeds:
+                options = dict(generator_options, **size)
+                num_days, people, set_constraints = generate_instance(seed=seed, **options)
+                peopleFilepath = os.path.join(tempDirectory, 'people.csv')
+                setFilepath = os.path.join(tempDirectory, 'sets.csv')
+                write_instance_csvs(num_days, people, set_constraints, peopleFilepath, setFilepath)
+
+                start_time = time.time()
+                with open(peopleFilepath, 'r') as peopleFile, open(setFilepath, 'r') as setFile:
+                    num_days, people, set_constraints = Parser.parseCSVs(num_days, peopleFile, setFile)
+                parse_time = time.time() - start_time
+                bound = lp_bound(num_days, people, set_constraints)
+
+                for name, runner in solvers.items():
+                    record = {'solver': name, 'seed': seed, 'instance': options, 'num_people': len(people),
+                              'num_days': num_days, 'num_sets': len(set_constraints), 'time_limit': time_limit,
+                              'parse_time': parse_time, 'lp_bound': bound, 'timestamp': time.time()}
+                    record.update(_run_isolated(runner, num_days, people, set_constraints, time_limit))
+                    if record.get('objective') and bound is not None:
+                        record['gap'] = (bound - record['objective']) / record['objective']
+                    records.append(record)
+                    with open(outputFilepath, 'a') as outputFile:
+                        outputFile.write(json.dumps(record) + '\n')
+    finally:
+        shutil.rmtree(tempDirectory, ignore_errors=True)
+
+    return records
+
+
+def _run_isolated(runner, num_days, people, set_constraints, time_limit):
+    """Runs one benchmark runner in a child process and returns its record."""
+    results = Queue()
+    process = Process(target=_runner_process, args=(runner, num_days, people, set_constraints, time_limit, results))
+    process.start()
+    timeout = 2 * time_limit + 30 if time_limit > 0 else None
+    try:
+        record = results.get(timeout=timeout)
+    except queue.Empty:
+        record = {'status': SolverStatus.OUT_OF_TIME.name, 'error': 'benchmark timeout'}
+    process.join(timeout=5)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+    return record
+
+
+def _runner_process(runner, num_days, people, set_constraints, time_limit, results):
+    start_time = time.time()
+    try:
+        record = runner(num_days, people, set_constraints, time_limit)
+    except Exception as e:
+        record = {'status': SolverStatus.NOT_SOLVED.name, 'error': '{0}: {1}'.format(type(e).__name__, e)}
+    record['total_time'] = time.time() - start_time
+    # ru_maxrss is in kilobytes on Linux
+    record['peak_memory_kb'] = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    results.put(record)
+
+
+if __name__ == '__main__':
+    commandLineParser = argparse.ArgumentParser(description='Benchmarks the solvers on generated instances of increasing size')
+    commandLineParser.add_argument('--sizes', default=None, help="comma-separated sizes as PEOPLExDAYS, e.g. 50x10,200x20")
+    commandLineParser.add_argument('--solvers', default=None, help="comma-separated solver names (default: all of {0})".format(
+                                   ','.join(DEFAULT_SOLVERS)))
+    commandLineParser.add_argument('--seeds', type=int, default=1, help="number of instances (seeds) per size")
+    commandLineParser.add_argument('--time-limit', type=float, default=60, help="time limit per solve, in seconds")
+    commandLineParser.add_argument('--output', default='benchmark_results.jsonl', help="JSON lines file to append results to")
+    commandLineParser.add_argument('--skip-import-times', action='store_true', help="don't measure module import times")
+
+    args = commandLineParser.parse_args()
+    sizes = None
+    if args.sizes:
+        sizes = []
+        for size in args.sizes.split(','):
+            num_people, num_days = size.lower().split('x')
+            sizes.append({'num_people': int(num_people), 'num_days': int(num_days)})
+    solvers = None
+    if args.solvers:
+        solvers = {name: DEFAULT_SOLVERS[name] for name in args.solvers.split(',')}
+
+    for record in run_benchmark(sizes, solvers, range(args.seeds), args.time_limit, args.output,
+                                measure_imports=not args.skip_import_times):
+        if 'module' in record:
+            print('import {0}: {1:.1f} ms'.format(record['module'], 1000 * record['import_time']))
+            continue
+        print('{0} {1}x{2} seed {3}: {4}, objective {5}, solve {6:.3f} s, peak memory {7} kB'.format(
+            record['solver'], record['num_people'], record['num_days'], record['seed'], record['status'],
+            record.get('objective'), record.get('solve_time', float('nan')), record.get('peak_memory_kb')))
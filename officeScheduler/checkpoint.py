@@ -0,0 +1,91 @@
+# Checkpoints of interrupted solves, resumable by later runs on the same instance
+import gzip
+import os
+import pickle
+import time
+
+from officeScheduler.private_files import check_private_directory, is_private_file, make_private_directory
+
+# Bump when the checkpoint contents change, so stale checkpoints aren't resumed
+CHECKPOINT_FORMAT_VERSION = 1
+
+
+class Checkpoint(object):
+    """
+    State of an interrupted solve, enough for a later run to resume it.
+
+    Fields:
+        instance - instance key (see solution_cache.instance_key()) the checkpoint belongs to
+        incumbent_value - value of the best schedule found (0 if none)
+        incumbent - nonzero entries of the best schedule's solution dictionary (None if none)
+        bound - best known bound on the optimal value (None if unknown)
+        frontier - open branch and bound nodes, as (list of decision tuples, parent LP value) pairs
+        pseudo_costs - branching statistics (see simple_bnb_solver.PseudoCosts.state())
+        nodes - nodes explored by all the runs so far
+        elapsed - seconds spent by all the runs so far
+        timestamp - time the checkpoint was written
+    """
+    def __init__(self, instance, incumbent_value=0, incumbent=None, bound=None, frontier=None, pseudo_costs=None,
+                 nodes=0, elapsed=0.0):
+        self.instance = instance
+        self.incumbent_value = incumbent_value
+        self.incumbent = incumbent
+        self.bound = bound
+        self.frontier = frontier if frontier is not None else []
+        self.pseudo_costs = pseudo_costs if pseudo_costs is not None else {}
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.timestamp = time.time()
+
+
+    @staticmethod
+    def compact_solution(solution):
+        """Returns the nonzero entries of a solution dictionary (None stays None)."""
+        if solution is None:
+            return None
+        return {name: value for name, value in solution.items() if value}
+
+
+def checkpoint_path(directory, instance):
+    """Returns the path of the checkpoint of the given instance key in directory."""
+    return os.path.join(directory, '{0}.checkpoint'.format(instance))
+
+
+def write_checkpoint(filepath, checkpoint):
+    """
+    Atomically writes a gzipped checkpoint to filepath, creating its directory
+    (private, see private_files.make_private_directory()) if needed.
+    """
+    make_private_directory(os.path.dirname(filepath) or os.curdir)
+    checkpoint.timestamp = time.time()
+    temp_filepath = '{0}.{1}.tmp'.format(filepath, os.getpid())
+    with gzip.open(temp_filepath, 'wb') as checkpointFile:
+        pickle.dump((CHECKPOINT_FORMAT_VERSION, checkpoint), checkpointFile, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_filepath, filepath)
+
+
+def read_checkpoint(filepath, instance=None):
+    """
+    Returns the Checkpoint stored at filepath, or None if there is none, it can't be
+    read, it was written by another format version or it belongs to another instance.
+    Since checkpoints are unpickled, their directory must pass
+    private_files.check_private_directory() (UnsafeCacheDirectoryError otherwise),
+    and a checkpoint owned by another user or writable by others is never read.
+    """
+    directory = os.path.dirname(filepath) or os.curdir
+    if not os.path.exists(filepath):
+        return None
+    check_private_directory(directory)
+    try:
+        with open(filepath, 'rb') as rawFile:
+            if not is_private_file(rawFile):
+                return None
+            with gzip.open(rawFile, 'rb') as checkpointFile:
+                version, checkpoint = pickle.load(checkpointFile)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError):
+        return None
+    if version != CHECKPOINT_FORMAT_VERSION:
+        return None
+    if instance is not None and checkpoint.instance != instance:
+        return None
+    return checkpoint
@@ -0,0 +1,390 @@
+# Long-running scheduler service keeping office instances and their models in memory
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from officeScheduler.batch_solver import BatchResult, BatchStatistics
+from officeScheduler.parametric_sweep import ParametricSweep
+import officeScheduler.Parser as Parser
+from officeScheduler.PeopleAndSets import Person, SetConstraint, SetConstraintType
+
+logger = logging.getLogger('officeScheduler.daemon')
+
+DEFAULT_MAX_HISTORY = 100 # Solved points kept per office to warm-start and prune later solves
+
+
+class DaemonBusy(Exception):
+    """
+    Raised when a solve request can't start within the queue timeout
+    because the maximum number of solves are already running.
+
+    Fields:
+        message - explanation of the error
+    """
+    def __init__(self, message):
+        super(DaemonBusy, self).__init__(message)
+        self.message = message
+
+
+class Office(object):
+    """
+    An office instance held by the daemon, with its model kept built between requests.
+
+    Fields:
+        office_id - the office's id
+        num_days, people, set_constraints - the instance (people's dateLists follow updates)
+        sweep - ParametricSweep owning the OR-Tools model, whose max_history most recent
+                solved points warm-start later solves
+        lock - serializes the requests on this office (the model and the last schedule's
+               query caches aren't thread-safe)
+        last_result - SweepResult of the last solve (None before the first one)
+        loaded_at - time the office was loaded
+        solves - number of solves so far
+    """
+    def __init__(self, office_id, num_days, people, set_constraints, max_history=DEFAULT_MAX_HISTORY):
+        self.office_id = office_id
+        self.num_days = num_days
+        self.people = [Person(person.uid, list(person.dateList)) for person in people]
+        self.set_constraints = set_constraints
+        self.sweep = ParametricSweep(num_days, self.people, set_constraints, max_history=max_history)
+        self.lock = threading.Lock()
+        self.last_result = None
+        self.loaded_at = time.time()
+        self.solves = 0
+
+
+class SchedulerDaemon(object):
+    """
+    Keeps office instances and their built models resident by office id
+    and serves solve, update and query requests on them, so interactive
+    clients don't pay for start-up, parsing and model building on every call.
+
+    At most max_concurrent_solves solves run at once; a solve waits up to
+    queue_timeout seconds for a slot before DaemonBusy is raised. Each solve's
+    time limit is capped by latency_target (seconds from the request's arrival,
+    -1 for none), so a solve that can't finish in time returns the best schedule
+    it has (often a warm start from an earlier solve); misses of the target are counted.
+    Each office keeps its max_history most recent solves for those warm starts
+    (see ParametricSweep), so memory and per-solve work stay bounded.
+
+    Fields:
+        offices - dictionary of office ids to Office objects
+        statistics - BatchStatistics of the solves served
+        latency_target_misses - number of solves that took longer than latency_target
+    """
+    def __init__(self, max_concurrent_solves=2, latency_target=-1, queue_timeout=5.0, max_history=DEFAULT_MAX_HISTORY):
+        self.max_concurrent_solves = max_concurrent_solves
+        self.latency_target = latency_target
+        self.queue_timeout = queue_timeout
+        self.max_history = max_history
+        self.offices = {}
+        self.statistics = BatchStatistics()
+        self.latency_target_misses = 0
+        self._solve_slots = threading.BoundedSemaphore(max_concurrent_solves)
+        self._offices_lock = threading.Lock()
+        self._statistics_lock = threading.Lock()
+
+
+    def load_office(self, office_id, num_days, people, set_constraints):
+        """Loads (or replaces) an office instance and builds its model."""
+        office = Office(office_id, num_days, people, set_constraints, self.max_history)
+        with self._offices_lock:
+            self.offices[office_id] = office
+        logger.info('Loaded office %s: %d people, %d days, %d sets', office_id, len(people), num_days, len(set_constraints))
+        return self.describe(office_id)
+
+
+    def unload_office(self, office_id):
+        with self._offices_lock:
+            self._office(office_id)
+            del self.offices[office_id]
+        logger.info('Unloaded office %s', office_id)
+        return {'office_id': office_id, 'unloaded': True}
+
+
+    def solve(self, office_id, changes=None, time_limit=-1):
+        """
+        Solves an office, optionally under temporary bound changes (see ParametricSweep.solve_point()).
+        Returns a dictionary with the status, value, schedule ({uid: list of 0/1 per day}) and timings.
+        """
+        arrival_time = time.time()
+        office = self._office(office_id)
+        if not self._solve_slots.acquire(timeout=self.queue_timeout):
+            raise DaemonBusy('All {0} solve slots are busy.'.format(self.max_concurrent_solves))
+        try:
+            with office.lock:
+                office.sweep.solver.SetTimeLimit(self._time_limit_ms(arrival_time, time_limit))
+                result = office.sweep.solve_point(changes if changes is not None else {})
+                office.last_result = result
+                office.solves += 1
+        finally:
+            self._solve_slots.release()
+
+        latency = time.time() - arrival_time
+        with self._statistics_lock:
+            if 0 < self.latency_target < latency:
+                self.latency_target_misses += 1
+            self.statistics.record(BatchResult(office_id, result.status, result.value, None, latency))
+        response = self._result_dict(office, result)
+        response.update({'latency': latency, 'queue_time': latency - result.elapsed})
+        return response
+
+
+    def update(self, office_id, availability=None, bounds=None):
+        """
+        Permanently changes an office: availability maps uids to {day: bool} (1-based days)
+        or to a full list of bools; bounds maps set ids to (low_bound, up_bound) pairs.
+        """
+        office = self._office(office_id)
+        with office.lock:
+            people = {person.uid: person for person in office.people}
+            for uid, days in (availability or {}).items():
+                if uid not in people:
+                    raise ValueError('Unknown person \'{0}\' in update of office {1}.'.format(uid, office_id))
+                if isinstance(days, list):
+                    days = {day: available for day, available in enumerate(days, start=1)}
+                for day, available in days.items():
+                    day = int(day)
+                    if not 1 <= day <= office.num_days:
+                        raise ValueError('Day {0} is outside the {1}-day horizon of office {2}.'.format(day, office.num_days, office_id))
+                    office.sweep.update_availability(uid, day, bool(available))
+                    people[uid].dateList[day - 1] = bool(available)
+            if bounds:
+                office.sweep.update_bounds({sid: tuple(bound) for sid, bound in bounds.items()})
+        return self.describe(office_id)
+
+
+    def query(self, office_id, uid=None, day=None, view=None):
+        """
+        Returns the last schedule of an office: the whole schedule,
+        one person's days (uid), the people scheduled on one 1-based day,
+        or (view 'coverage') the daily headcounts of the office and of each
+        department, and the days each synergy team is all present.
+        """
+        office = self._office(office_id)
+        with office.lock:
+            return self._query_schedule(office, uid, day, view)
+
+
+    def _query_schedule(self, office, uid, day, view):
+        """Answers query() on an office whose lock is held."""
+        office_id = office.office_id
+        result = office.last_result
+        if result is None or result.schedule is None:
+            raise ValueError('Office {0} has no schedule yet.'.format(office_id))
+
+        schedule = result.schedule
+        if schedule.setConstraints is not office.set_constraints:
+            schedule.setConstraints = office.set_constraints
+        assignments = schedule.assignments
+        if uid is not None:
+            if uid not in office.sweep.arrays.uid_index:
+                raise ValueError('Unknown person \'{0}\' in office {1}.'.format(uid, office_id))
+            return {'office_id': office_id, 'uid': uid,
+                    'days': [int(value) for value in assignments[office.sweep.arrays.uid_index[uid]]]}
+        if day is not None:
+            day = int(day)
+            if not 1 <= day <= office.num_days:
+                raise ValueError('Day {0} is outside the {1}-day horizon of office {2}.'.format(day, office.num_days, office_id))
+            return {'office_id': office_id, 'day': day, 'people': schedule.presentPeople(day - 1)}
+        if view == 'coverage':
+            dept_sids, dept_headcounts = schedule.setHeadcounts(SetConstraintType.DEPARTMENT)
+            synergy_sids, overlap_days = schedule.synergyOverlapDays()
+            return {'office_id': office_id,
+                    'headcounts': [int(count) for count in schedule.dailyHeadcounts()],
+                    'departments': {sid: [int(count) for count in row] for sid, row in zip(dept_sids, dept_headcounts)},
+                    'synergy_overlap_days': {sid: int(days) for sid, days in zip(synergy_sids, overlap_days)}}
+        elif view is not None:
+            raise ValueError('Unknown view \'{0}\'.'.format(view))
+        return self._result_dict(office, result)
+
+
+    def describe(self, office_id):
+        office = self._office(office_id)
+        return {'office_id': office_id, 'num_days': office.num_days, 'num_people': len(office.people),
+                'num_sets': len(office.set_constraints), 'loaded_at': office.loaded_at, 'solves': office.solves,
+                'last_status': office.last_result.status.name if office.last_result is not None else None}
+
+
+    def status(self):
+        """Returns the daemon's offices, limits and latency statistics."""
+        with self._statistics_lock:
+            summary = self.statistics.summary()
+            latency_target_misses = self.latency_target_misses
+        summary.update({'offices': sorted(self.offices), 'max_concurrent_solves': self.max_concurrent_solves,
+                        'latency_target': self.latency_target, 'latency_target_misses': latency_target_misses})
+        return summary
+
+
+    def _office(self, office_id):
+        office = self.offices.get(office_id)
+        if office is None:
+            raise KeyError('Unknown office \'{0}\'.'.format(office_id))
+        return office
+
+
+    def _time_limit_ms(self, arrival_time, time_limit):
+        """Returns the OR-Tools time limit of a solve, capped by what is left of the latency target (0 for none)."""
+        limits = [time_limit] if time_limit is not None and time_limit > 0 else []
+        if self.latency_target > 0:
+            limits.append(max(self.latency_target - (time.time() - arrival_time), 0.001))
+        return int(min(limits) * 1000) if limits else 0
+
+
+    def _result_dict(self, office, result):
+        schedule = None
+        if result.schedule is not None:
+            schedule = {uid: [int(value) for value in result.schedule.assignments[i]]
+                        for i, uid in enumerate(office.sweep.arrays.uids)}
+        return {'office_id': office.office_id, 'status': result.status.name, 'value': result.value,
+                'elapsed': result.elapsed, 'pruned': result.pruned, 'schedule': schedule}
+
+
+def instance_from_json(data):
+    """
+    Builds (num_days, people, set_constraints) from a JSON request body, either
+    {'num_days': n, 'peopleFile': path, 'setFile': path} (read with Parser.parseCSVs()) or
+    {'num_days': n, 'people': [{'uid': ..., 'dateList': [...]}, ...],
+     'set_constraints': [{'sid': ..., 'type': 'DEPARTMENT' or 'SYNERGY', 'people': [...],
+                          'low_bound': ..., 'up_bound': ...}, ...]}.
+    """
+    num_days = int(data['num_days'])
+    if 'peopleFile' in data:
+        with open(data['peopleFile'], 'r') as peopleFile, open(data['setFile'], 'r') as setFile:
+            return Parser.parseCSVs(num_days, peopleFile, setFile)
+
+    people = [Person(person['uid'], [bool(available) for available in person['dateList'][:num_days]])
+              for person in data['people']]
+    set_constraints = []
+    for set_data in data['set_constraints']:
+        constraint_type = set_data['type']
+        if isinstance(constraint_type, str):
+            constraint_type = SetConstraintType[constraint_type.upper()]
+        else:
+            constraint_type = SetConstraintType(constraint_type)
+        set_constraints.append(SetConstraint(set_data['sid'], constraint_type, list(set_data['people']),
+                                             set_data.get('low_bound', 0), set_data.get('up_bound', -1)))
+    return num_days, people, set_constraints
+
+
+def make_request_handler(daemon):
+    """
+    Returns an HTTP request handler class serving the daemon's JSON API:
+        GET    /health                      - liveness check
+        GET    /status                      - offices, limits and latency statistics
+        GET    /offices/<id>[?uid=..|day=..] - last schedule, one person's days or one day's people
+        GET    /offices/<id>?view=coverage  - daily headcounts, per department, and synergy overlap days
+        PUT    /offices/<id>                - load an office (body: see instance_from_json())
+        DELETE /offices/<id>                - unload an office
+        POST   /offices/<id>/solve          - solve; body {'changes': {sid: [low, up]}, 'time_limit': seconds}
+        POST   /offices/<id>/update         - update; body {'availability': {...}, 'bounds': {sid: [low, up]}}
+    """
+    class SchedulerRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split('/') if part]
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if parts == ['health']:
+                self._respond(lambda: {'ok': True})
+            elif parts == ['status']:
+                self._respond(daemon.status)
+            elif len(parts) == 2 and parts[0] == 'offices':
+                self._respond(lambda: daemon.query(parts[1], query.get('uid'), query.get('day'), query.get('view')))
+            else:
+                self._send(404, {'error': 'Not found: {0}'.format(url.path)})
+
+
+        def do_PUT(self):
+            parts = [part for part in urlparse(self.path).path.split('/') if part]
+            if len(parts) == 2 and parts[0] == 'offices':
+                self._respond(lambda: daemon.load_office(parts[1], *instance_from_json(self._body())))
+            else:
+                self._send(404, {'error': 'Not found: {0}'.format(self.path)})
+
+
+        def do_DELETE(self):
+            parts = [part for part in urlparse(self.path).path.split('/') if part]
+            if len(parts) == 2 and parts[0] == 'offices':
+                self._respond(lambda: daemon.unload_office(parts[1]))
+            else:
+                self._send(404, {'error': 'Not found: {0}'.format(self.path)})
+
+
+        def do_POST(self):
+            parts = [part for part in urlparse(self.path).path.split('/') if part]
+            if len(parts) == 3 and parts[0] == 'offices' and parts[2] == 'solve':
+                def solve():
+                    body = self._body()
+                    changes = {sid: tuple(bound) for sid, bound in body.get('changes', {}).items()}
+                    return daemon.solve(parts[1], changes, body.get('time_limit', -1))
+                self._respond(solve)
+            elif len(parts) == 3 and parts[0] == 'offices' and parts[2] == 'update':
+                def update():
+                    body = self._body()
+                    return daemon.update(parts[1], body.get('availability'), body.get('bounds'))
+                self._respond(update)
+            else:
+                self._send(404, {'error': 'Not found: {0}'.format(self.path)})
+
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length', 0))
+            return json.loads(self.rfile.read(length).decode('utf8')) if length > 0 else {}
+
+
+        def _respond(self, handler):
+            try:
+                self._send(200, handler())
+            except KeyError as e:
+                self._send(404, {'error': str(e.args[0]) if e.args else 'Not found'})
+            except DaemonBusy as e:
+                self._send(503, {'error': e.message})
+            except (ValueError, TypeError) as e:
+                self._send(400, {'error': str(e)})
+
+
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode('utf8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return SchedulerRequestHandler
+
+
+def serve(daemon, host='127.0.0.1', port=8765):
+    """Serves the daemon over HTTP until interrupted; returns nothing."""
+    server = ThreadingHTTPServer((host, port), make_request_handler(daemon))
+    server.daemon_threads = True
+    logger.info('Serving on http://%s:%d', host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    commandLineParser = argparse.ArgumentParser(description='Runs the office scheduler as a local HTTP service with warm models')
+    commandLineParser.add_argument('--host', default='127.0.0.1', help="address to listen on (local only by default)")
+    commandLineParser.add_argument('--port', type=int, default=8765, help="port to listen on")
+    commandLineParser.add_argument('--max-concurrent-solves', type=int, default=2, help="solves allowed to run at once")
+    commandLineParser.add_argument('--latency-target', type=float, default=-1, help="seconds a solve may take from its arrival (-1 for none)")
+    commandLineParser.add_argument('--queue-timeout', type=float, default=5.0, help="seconds a solve may wait for a free slot")
+    commandLineParser.add_argument('--max-history', type=int, default=DEFAULT_MAX_HISTORY, help="solved points kept per office for warm starts")
+
+    args = commandLineParser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    serve(SchedulerDaemon(args.max_concurrent_solves, args.latency_target, args.queue_timeout, args.max_history),
+          args.host, args.port)
@@ -2,52 +2,98 @@ import argparse
 import numpy as np
 import time
 
-from officeScheduler.ortools_utils import (build_scheduling_ilp, solve_ilp, 
-    extract_solution, ORTOOLS_SOLVER_STATUS_TO_OURS_MAP)
-import officeScheduler.Parser
+from officeScheduler.ortools_utils import (build_scheduling_ilp, separate_synergy_cuts, add_synergy_cuts, 
+    solve_ilp, extract_solution, ORTOOLS_SOLVER_STATUS_TO_OURS_MAP)
+import officeScheduler.Parser as Parser
 from officeScheduler.Solver import Solver, SolverStatus
 from officeScheduler.Schedule import Schedule
 
 
-DEBUG_PRINT = True
-
 
 class DirectILPSolver(Solver):
-    """docstring for DirectILPSolver"""
-    def __init__(self, people, set_constraints, time_limit=-1):
+    """
+    Solves the whole scheduling ILP with OR-Tools (CBC).
+
+    If model_cache (a model_cache.ModelCache) is given, the built model
+    (including the lazy formulation's separated cuts) is loaded from it
+    when an earlier run, in any process, has built it already.
+    """
+    def __init__(self, people, set_constraints, time_limit=-1, synergy_formulation='aggregated', model_cache=None):
         super(DirectILPSolver, self).__init__(people, set_constraints, time_limit)
         self.num_days = -1
         if people:
             self.num_days = len(people[0].dateList)
+        self.synergy_formulation = synergy_formulation
+        self.model_cache = model_cache
+        self._ortools_solver = None
 
 
-    def solve(self):
-        solver, variables, constraints = build_scheduling_ilp(self.num_days, self.people, self.set_constraints)
+    def cancel(self):
+        """
+        Requests cancellation, interrupting the OR-Tools solve if the backend supports it.
+        """
+        super(DirectILPSolver, self).cancel()
+        if self._ortools_solver is not None:
+            self._ortools_solver.InterruptSolve()
 
-        if DEBUG_PRINT:
-            print('No. variables:', solver.NumVariables())
-            print('No. constraints:', solver.NumConstraints())
+
+    def solve(self):
+        if self.model_cache is not None:
+            with self.metrics.phase('build'):
+                solver, variables, constraints = self.model_cache.ortools_model(
+                    self.num_days, self.people, self.set_constraints, self.synergy_formulation,
+                    builder=self._build_model if self.synergy_formulation == 'lazy' else None)
+        elif self.synergy_formulation == 'lazy':
+            with self.metrics.phase('presolve'):
+                links = separate_synergy_cuts(self.num_days, self.people, self.set_constraints)
+            self.metrics.set('synergy_cuts', len(links))
+            with self.metrics.phase('build'):
+                solver, variables, constraints = build_scheduling_ilp(self.num_days, self.people, self.set_constraints, 'lazy')
+                add_synergy_cuts(solver, variables, constraints, links)
+        else:
+            with self.metrics.phase('build'):
+                solver, variables, constraints = build_scheduling_ilp(self.num_days, self.people, self.set_constraints, 
+                                                                      self.synergy_formulation)
+
+        self.metrics.set('num_variables', solver.NumVariables())
+        self.metrics.set('num_constraints', solver.NumConstraints())
 
         if self.time_limit > 0:
             time_limit_ms = int(self.time_limit * 1000)
             solver.SetTimeLimit(time_limit_ms) # Must pass in an int64
             pass
-        
-        status = solver.Solve()
-        self.status = ORTOOLS_SOLVER_STATUS_TO_OURS_MAP[status]
 
-        if DEBUG_PRINT:
-            print('Status:', self.status)
-            print('Objective value =', solver.Objective().Value())
+        if self.is_cancelled():
+            self.metrics.publish()
+            return None
 
-        solution_dict = extract_solution(solver)
-        best_schedule = Schedule(people=self.people)
-        best_schedule.buildFromSolutionVariables(solution_dict)
+        self._ortools_solver = solver
+        with self.metrics.phase('solve'):
+            status = solver.Solve()
+        self._ortools_solver = None
+        self.status = ORTOOLS_SOLVER_STATUS_TO_OURS_MAP[status]
+        self.metrics.set('nodes', solver.nodes())
+        self.metrics.set('iterations', solver.iterations())
+        if self.status in [SolverStatus.OPTIMAL, SolverStatus.FEASIBLE]:
+            self.metrics.set('objective', solver.Objective().Value())
+            self.metrics.set('bound', solver.Objective().BestBound())
+            self.report_progress(solver.Objective().Value(), solver.Objective().BestBound())
+
+        with self.metrics.phase('extract'):
+            solution_dict = extract_solution(solver)
+            best_schedule = Schedule(people=self.people)
+            best_schedule.buildFromSolutionVariables(solution_dict)
+
+        self.metrics.publish()
+        return best_schedule
 
-        if DEBUG_PRINT:
-            print('Schedule:\n{0}'.format(best_schedule))
 
-        return best_schedule
+    def _build_model(self, num_days, people, set_constraints):
+        """Builds the lazy formulation with its separated synergy cuts (for the model cache)."""
+        links = separate_synergy_cuts(num_days, people, set_constraints)
+        solver, variables, constraints = build_scheduling_ilp(num_days, people, set_constraints, 'lazy')
+        add_synergy_cuts(solver, variables, constraints, links)
+        return solver, variables, constraints
 
 
 if __name__ == '__main__':
@@ -58,7 +104,9 @@ if __name__ == '__main__':
 
     args = commandLineParser.parse_args()
 
+    parse_start_time = time.time()
     num_days, people, set_constraints = Parser.parseCSVs(n=args.numdays, peopleFile=args.peopleFile, setFile=args.setFile)
+    parse_time = time.time() - parse_start_time
     time_limit = 5 # seconds
 
     #TODO: currently converting dictionary to list; should eventually change to actually use the dictionary
@@ -66,8 +114,13 @@ if __name__ == '__main__':
     set_constraints=list(set_constraints.values())
 
     solver = DirectILPSolver(people, set_constraints, time_limit)
+    metrics = solver.enable_metrics()
+    metrics.record_phase('parse', parse_time)
 
     schedule = solver.solve()
+    print('Status:', solver.status)
+    print(metrics)
+    print('Schedule:\n{0}'.format(schedule))
 
     RUN_TIME_EXPERIMENTS = False
     if RUN_TIME_EXPERIMENTS:
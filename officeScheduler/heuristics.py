@@ -0,0 +1,322 @@
+# Primal heuristics for finding feasible schedules quickly
+from abc import ABC, abstractmethod
+import numpy as np
+import time
+
+
+class PrimalHeuristic(ABC):
+    """
+    Abstract superclass for primal heuristics.
+    A heuristic takes a ProblemArrays instance and (optionally) the values of
+    an LP relaxation solution, and returns a feasible 0/1 assignments matrix or None.
+
+    Fields:
+        name - short name used in statistics
+        needs_lp - True if the heuristic can only run with an LP solution available
+    """
+    name = 'heuristic'
+    needs_lp = False
+
+    @abstractmethod
+    def run(self, arrays, lp_x=None, lp_y=None, rng=None):
+        pass
+
+
+class GreedyFillHeuristic(PrimalHeuristic):
+    """
+    Builds a schedule from scratch: picks synergy days with the most department slack,
+    covers department lower bounds, then adds every remaining available person-day
+    that keeps all department upper bounds satisfied.
+    """
+    name = 'greedy_fill'
+
+    def run(self, arrays, lp_x=None, lp_y=None, rng=None):
+        x = np.zeros(arrays.shape, dtype=int)
+        return repair(arrays, x)
+
+
+class SynergyRoundingHeuristic(PrimalHeuristic):
+    """
+    Rounds an LP solution team by team: each synergy set is scheduled on the
+    days with the largest LP synergy values, and the remaining variables
+    are rounded at 0.5 before repairing.
+    """
+    name = 'synergy_rounding'
+    needs_lp = True
+
+    def run(self, arrays, lp_x=None, lp_y=None, rng=None):
+        x = (lp_x >= 0.5).astype(int) * arrays.availability
+
+        for k, members in enumerate(arrays.synergy_members):
+            target = arrays.synergy_target[k]
+            if target <= 0 or len(members) == 0:
+                continue
+
+            days_ok = arrays.availability[members].all(axis=0)
+            if lp_y is not None and lp_y.size:
+                scores = lp_y[k].copy()
+            else:
+                scores = lp_x[members].min(axis=0)
+            scores[~days_ok] = -1
+
+            chosen_days = np.argsort(-scores, kind='stable')[:target]
+            chosen_days = chosen_days[scores[chosen_days] >= 0]
+            x[np.ix_(members, chosen_days)] = 1
+
+        return repair(arrays, x)
+
+
+class DivingHeuristic(PrimalHeuristic):
+    """
+    Fixes variables in decreasing order of their LP values, in batches
+    at thresholds 1.0, 0.9, ..., 0.5, propagating department upper bounds
+    after each fixing so that later batches only use the remaining capacity.
+    """
+    name = 'diving'
+    needs_lp = True
+
+    def __init__(self, thresholds=(1.0, 0.9, 0.8, 0.7, 0.6, 0.5)):
+        self.thresholds = thresholds
+
+
+    def run(self, arrays, lp_x=None, lp_y=None, rng=None):
+        x = np.zeros(arrays.shape, dtype=int)
+        order = np.argsort(-lp_x.sum(axis=1), kind='stable')
+        for threshold in self.thresholds:
+            fill(arrays, x, order=order, candidates=lp_x >= threshold - 1e-6)
+
+        return repair(arrays, x)
+
+
+class FeasibilityPumpHeuristic(PrimalHeuristic):
+    """
+    Feasibility-pump-style rounding on arrays: alternates 0.5-rounding with
+    a projection step that shifts fractional values towards satisfying the
+    violated department and synergy rows, perturbing the point when the
+    rounding cycles. Falls back to repairing the last rounding.
+
+    Fields:
+        max_iterations - maximum number of round/project iterations
+    """
+    name = 'feasibility_pump'
+    needs_lp = True
+
+    def __init__(self, max_iterations=20):
+        self.max_iterations = max_iterations
+
+
+    def run(self, arrays, lp_x=None, lp_y=None, rng=None):
+        if rng is None:
+            rng = np.random.default_rng()
+
+        dept_size = np.maximum(arrays.dept_membership.sum(axis=1), 1)
+        x_frac = np.clip(lp_x, 0, 1) * arrays.availability
+        seen = set()
+
+        for iteration in range(self.max_iterations):
+            x = (x_frac >= 0.5).astype(int)
+            if arrays.is_feasible(x):
+                return fill(arrays, x)
+
+            key = x.tobytes()
+            if key in seen:
+                # Cycling: perturb a random subset of the fractional point
+                flip = rng.random(x_frac.shape) < 0.1
+                x_frac[flip] = rng.random(int(flip.sum()))
+                x_frac *= arrays.availability
+                continue
+            seen.add(key)
+
+            # Projection: spread department violations over the members of each row
+            loads = arrays.dept_loads(x)
+            shortfall = np.maximum(arrays.dept_low[:, None] - loads, 0)
+            excess = np.maximum(loads - arrays.dept_up[:, None], 0)
+            adjustment = arrays.dept_membership.T @ ((shortfall - excess) / dept_size[:, None])
+            x_frac = np.clip(0.5 * (x + x_frac) + adjustment, 0, 1) * arrays.availability
+
+            # Raise every member of a team on its most promising missing days
+            present = arrays.synergy_present(x)
+            for k, members in enumerate(arrays.synergy_members):
+                missing = arrays.synergy_target[k] - present[k].sum()
+                if missing <= 0 or len(members) == 0:
+                    continue
+                scores = x_frac[members].min(axis=0)
+                scores[present[k] | ~arrays.availability[members].all(axis=0)] = -1
+                days = np.argsort(-scores, kind='stable')[:missing]
+                days = days[scores[days] >= 0]
+                x_frac[np.ix_(members, days)] = 1
+
+        return repair(arrays, (x_frac >= 0.5).astype(int))
+
+
+DEFAULT_HEURISTICS = (GreedyFillHeuristic, SynergyRoundingHeuristic, DivingHeuristic, FeasibilityPumpHeuristic)
+
+
+class HeuristicManager(object):
+    """
+    Runs a collection of primal heuristics at the root and periodically in
+    the branch and bound tree, keeping the best feasible schedule found.
+
+    Fields:
+        arrays - the ProblemArrays instance being solved
+        heuristics - list of PrimalHeuristic instances
+        frequency - run the LP-based heuristics every frequency-th node (0 disables)
+        best_value - value of the best schedule found so far (-1 if none)
+        best_x - assignments matrix of the best schedule found so far (None if none)
+        stats - per-heuristic dictionary with 'calls', 'successes', 'improvements' and 'time'
+    """
+    def __init__(self, arrays, heuristics=None, frequency=10, seed=None):
+        self.arrays = arrays
+        if heuristics is None:
+            heuristics = [heuristic_class() for heuristic_class in DEFAULT_HEURISTICS]
+        self.heuristics = heuristics
+        self.frequency = frequency
+        self.rng = np.random.default_rng(seed)
+        self.best_value = -1
+        self.best_x = None
+        self.stats = {h.name: {'calls': 0, 'successes': 0, 'improvements': 0, 'time': 0.0} for h in self.heuristics}
+
+
+    def run_root(self, lp_x=None, lp_y=None):
+        """
+        Runs every heuristic that can run with the given LP values.
+        Returns True iff the incumbent improved.
+        """
+        return self._run(lp_x, lp_y)
+
+
+    def run_node(self, node_count, lp_x, lp_y=None):
+        """
+        Runs the LP-based heuristics if node_count is a multiple of self.frequency.
+        Returns True iff the incumbent improved.
+        """
+        if self.frequency <= 0 or node_count % self.frequency != 0:
+            return False
+        return self._run(lp_x, lp_y, lp_only=True)
+
+
+    def _run(self, lp_x, lp_y, lp_only=False):
+        improved = False
+        for heuristic in self.heuristics:
+            if heuristic.needs_lp and lp_x is None:
+                continue
+            if lp_only and not heuristic.needs_lp:
+                continue
+
+            stats = self.stats[heuristic.name]
+            start_time = time.time()
+            x = heuristic.run(self.arrays, lp_x, lp_y, self.rng)
+            stats['time'] += time.time() - start_time
+            stats['calls'] += 1
+
+            if x is None:
+                continue
+            stats['successes'] += 1
+
+            value = self.arrays.objective(x)
+            if value > self.best_value:
+                self.best_value = value
+                self.best_x = x
+                stats['improvements'] += 1
+                improved = True
+
+        return improved
+
+
+def fill(arrays, x, order=None, candidates=None):
+    """
+    Greedily sets to 1 every available person-day of x (restricted to the
+    candidates mask, if given) that keeps all department upper bounds satisfied.
+    People are processed in the given order (by default, those in fewer
+    departments first), each one vectorized over all days.
+    Modifies and returns x.
+    """
+    loads = arrays.dept_loads(x)
+    if order is None:
+        order = np.argsort([len(depts) for depts in arrays.person_depts], kind='stable')
+
+    for i in order:
+        can_add = arrays.availability[i] & (x[i] == 0)
+        if candidates is not None:
+            can_add &= candidates[i]
+        depts = arrays.person_depts[i]
+        if len(depts):
+            can_add &= np.all(loads[depts] < arrays.dept_up[depts, None], axis=0)
+            loads[depts] += can_add
+        x[i, can_add] = 1
+
+    return x
+
+
+def repair(arrays, x):
+    """
+    Attempts to turn the 0/1 assignments matrix x into a feasible schedule by
+    removing unavailable person-days, completing synergy targets, removing
+    people from over-full departments, covering department lower bounds and
+    finally filling any remaining capacity.
+    Returns the repaired matrix, or None if the repair fails.
+    """
+    x = np.asarray(x, dtype=int) * arrays.availability
+    protected = np.zeros(arrays.shape, dtype=bool)
+    loads = arrays.dept_loads(x)
+    slack = arrays.dept_up[:, None] - loads
+
+    # Synergy targets: keep days the team is already all present, then add the
+    # days needing the fewest extra people among those with department slack
+    present = arrays.synergy_present(x)
+    for k, members in enumerate(arrays.synergy_members):
+        target = arrays.synergy_target[k]
+        if target <= 0 or len(members) == 0:
+            continue
+
+        kept_days = np.flatnonzero(present[k])[:target]
+        protected[np.ix_(members, kept_days)] = True
+        missing = target - len(kept_days)
+        if missing <= 0:
+            continue
+
+        days_ok = arrays.availability[members].all(axis=0) & ~present[k]
+        num_absent = (x[members] == 0).sum(axis=0)
+        team_depts = arrays.dept_membership[:, members] @ np.ones(len(members), dtype=int)
+        day_slack = np.min(np.where(team_depts[:, None] > 0, slack, np.inf), axis=0) if len(slack) else np.zeros(arrays.num_days)
+        order = np.lexsort((-day_slack, num_absent))
+        chosen_days = [j for j in order if days_ok[j]][:missing]
+        if len(chosen_days) < missing:
+            return None
+
+        x[np.ix_(members, chosen_days)] = 1
+        protected[np.ix_(members, chosen_days)] = True
+        loads = arrays.dept_loads(x)
+        slack = arrays.dept_up[:, None] - loads
+
+    # Department upper bounds: drop unprotected people from over-full department-days
+    for d in range(len(arrays.dept_sids)):
+        for j in np.flatnonzero(loads[d] > arrays.dept_up[d]):
+            removable = np.flatnonzero(arrays.dept_membership[d] & x[:, j] & ~protected[:, j])
+            excess = loads[d, j] - arrays.dept_up[d]
+            if len(removable) < excess:
+                return None
+            # Prefer removing people in the most departments, freeing the most capacity
+            removable = removable[np.argsort([-len(arrays.person_depts[i]) for i in removable], kind='stable')]
+            for i in removable[:excess]:
+                x[i, j] = 0
+                loads[arrays.person_depts[i], j] -= 1
+
+    # Department lower bounds: add available members whose other departments have room
+    for d in range(len(arrays.dept_sids)):
+        for j in np.flatnonzero(loads[d] < arrays.dept_low[d]):
+            candidates = np.flatnonzero(arrays.dept_membership[d] & arrays.availability[:, j] & (x[:, j] == 0))
+            for i in candidates:
+                if loads[d, j] >= arrays.dept_low[d]:
+                    break
+                depts = arrays.person_depts[i]
+                if np.all(loads[depts, j] < arrays.dept_up[depts]):
+                    x[i, j] = 1
+                    loads[depts, j] += 1
+            if loads[d, j] < arrays.dept_low[d]:
+                return None
+
+    fill(arrays, x)
+    if not arrays.is_feasible(x):
+        return None
+    return x
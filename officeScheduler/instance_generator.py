@@ -0,0 +1,115 @@
+# Seeded generator of synthetic office scheduling instances
+import argparse
+import random
+
+import officeScheduler.PeopleAndSets as PAS
+
+
+def generate_instance(num_people=100, num_days=20, num_departments=None, nesting_depth=1, overlap=0.0,
+                      synergy_density=0.05, synergy_size=(2, 4), availability_rate=0.7, seed=None):
+    """
+    Generates a random instance in the same form as the outputs of Parser.parseCSVs():
+    a tuple (num_days, list of Person objects, list of SetConstraint objects).
+
+    Arguments:
+        num_people, num_days - instance size
+        num_departments - number of top-level departments (about one per 10 people if None)
+        nesting_depth - levels of departments; each level splits every department of the
+                        previous level into two sub-departments with their own bounds
+        overlap - fraction of people who also belong to a second top-level department
+        synergy_density - number of synergy teams per person
+        synergy_size - (min, max) number of members of a synergy team
+        availability_rate - probability that a person can work on a given day
+        seed - seed of the random number generator, for reproducible instances
+
+    Bounds are chosen from the availability, so that every department can meet
+    its lower bound on every day and every team is available together on at least
+    as many days as its target; the bounds of different sets may still conflict.
+    """
+    rng = random.Random(seed)
+    people = []
+    for i in range(num_people):
+        dateList = [rng.random() < availability_rate for day in range(num_days)]
+        people.append(PAS.Person('Person{0}'.format(i), dateList))
+    uids = [person.uid for person in people]
+    available = {person.uid: person.dateList for person in people}
+
+    if num_departments is None:
+        num_departments = max(1, num_people // 10)
+    num_departments = min(num_departments, num_people)
+
+    # Top-level departments partition a shuffled list of people
+    shuffled = list(uids)
+    rng.shuffle(shuffled)
+    level = [shuffled[d::num_departments] for d in range(num_departments)]
+    for uid in uids:
+        if num_departments > 1 and rng.random() < overlap:
+            second = rng.choice([members for members in level if uid not in members])
+            second.append(uid)
+
+    set_constraints = []
+    for depth in range(nesting_depth):
+        for d, members in enumerate(level):
+            sid = 'Dept{0}_{1}'.format(depth, d)
+            set_constraints.append(_department(sid, members, available, num_days, rng))
+        # Split every department into two halves for the next level
+        level = [half for members in level if len(members) >= 4 for half in (members[::2], members[1::2])]
+        if not level:
+            break
+
+    num_synergies = int(round(synergy_density * num_people))
+    for k in range(num_synergies):
+        size = min(rng.randint(synergy_size[0], synergy_size[1]), num_people)
+        members = rng.sample(uids, size)
+        common_days = sum(all(available[uid][day] for uid in members) for day in range(num_days))
+        target = min(rng.randint(1, 2), common_days)
+        set_constraints.append(PAS.SetConstraint('Team{0}'.format(k), PAS.SetConstraintType.SYNERGY, members, target, -1))
+
+    return num_days, people, set_constraints
+
+
+def _department(sid, members, available, num_days, rng):
+    """Builds a department constraint whose lower bound every day's availability can meet."""
+    min_available = min(sum(available[uid][day] for uid in members) for day in range(num_days))
+    low_bound = min(min_available, int(rng.uniform(0.0, 0.3) * len(members)))
+    up_bound = max(low_bound, int(round(rng.uniform(0.5, 0.9) * len(members))))
+    if rng.random() < 0.2:
+        up_bound = -1
+    return PAS.SetConstraint(sid, PAS.SetConstraintType.DEPARTMENT, list(members), low_bound, up_bound)
+
+
+def write_instance_csvs(num_days, people, set_constraints, peopleFilepath, setFilepath):
+    """
+    Writes an instance in the CSV formats read by Parser.parseCSVs().
+    """
+    with open(peopleFilepath, 'w') as peopleFile:
+        for person in people:
+            peopleFile.write(','.join([person.uid] + ['1' if available else '0' for available in person.dateList[:num_days]]) + '\n')
+
+    with open(setFilepath, 'w') as setFile:
+        for set_constraint in set_constraints:
+            if set_constraint.constraintType.value == PAS.SetConstraintType.DEPARTMENT.value:
+                fields = [set_constraint.sid, '1', str(set_constraint.low_bound), str(set_constraint.up_bound)]
+            else:
+                fields = [set_constraint.sid, '2', str(set_constraint.low_bound)]
+            setFile.write(','.join(fields + list(set_constraint.personList)) + '\n')
+
+
+if __name__ == '__main__':
+    commandLineParser = argparse.ArgumentParser(description='Generates a random office scheduling instance as two csv files')
+    commandLineParser.add_argument('numpeople', type=int, help="the number of people")
+    commandLineParser.add_argument('numdays', type=int, help="the total number of days to schedule for")
+    commandLineParser.add_argument('peopleFile', help="path of the people csv file to write")
+    commandLineParser.add_argument('setFile', help="path of the set constraints csv file to write")
+    commandLineParser.add_argument('--departments', type=int, default=None, help="number of top-level departments")
+    commandLineParser.add_argument('--nesting', type=int, default=1, help="levels of nested departments")
+    commandLineParser.add_argument('--overlap', type=float, default=0.0, help="fraction of people in a second department")
+    commandLineParser.add_argument('--synergy-density', type=float, default=0.05, help="synergy teams per person")
+    commandLineParser.add_argument('--availability', type=float, default=0.7, help="probability that a person can work on a day")
+    commandLineParser.add_argument('--seed', type=int, default=None, help="random seed")
+
+    args = commandLineParser.parse_args()
+    num_days, people, set_constraints = generate_instance(args.numpeople, args.numdays, args.departments, args.nesting,
+                                                          args.overlap, args.synergy_density, availability_rate=args.availability,
+                                                          seed=args.seed)
+    write_instance_csvs(num_days, people, set_constraints, args.peopleFile, args.setFile)
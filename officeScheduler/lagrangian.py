@@ -0,0 +1,247 @@
+# Lagrangian relaxation bounds and heuristics for the scheduling problem
+import argparse
+import math
+import time
+
+import numpy as np
+
+from officeScheduler.heuristics import repair
+import officeScheduler.Parser as Parser
+from officeScheduler.problem_arrays import ProblemArrays
+from officeScheduler.Schedule import Schedule
+from officeScheduler.Solver import Solver, SolverStatus
+
+
+def integral_bound(bound):
+    """Rounds a bound down to the best integer objective it allows (infinite bounds are kept)."""
+    return math.floor(bound + 1e-6) if math.isfinite(bound) else bound
+
+
+class LagrangianRelaxation(object):
+    """
+    Lagrangian relaxation of the scheduling problem, optimized by subgradient steps.
+
+    The department bounds L_d <= sum_{i in d} x_ij <= U_d and the aggregated synergy
+    rows |K| y_kj <= sum_{i in K} x_ij are dualized with nonnegative multipliers,
+    leaving a relaxation that separates by variable: x_ij = 1 iff person i is
+    available and its adjusted profit 1 - sum_d (mu_dj - nu_dj) + sum_k pi_kj is
+    positive, and each team takes the target days with the smallest cost |K| pi_kj
+    among the days its members are all available. Any nonnegative multipliers
+    give a valid upper bound; the subgradient method lowers it with Polyak steps,
+    halving the step scale whenever the bound stalls.
+
+    The relaxation can be restricted to a branch and bound NodeDomain (its variable
+    bounds and department intervals), which gives a valid bound for the node.
+
+    Fields:
+        arrays - the ProblemArrays instance being solved
+        dept_up_multipliers, dept_low_multipliers - departments by days multipliers (mu, nu)
+        synergy_multipliers - synergy sets by days multipliers (pi)
+        best_bound - best (lowest) bound found by optimize() on the whole problem
+        best_value, best_x - value and assignments of the best Lagrangian heuristic schedule (-1 and None if none)
+        iterations - subgradient iterations run so far
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays
+        num_depts = len(arrays.dept_sids)
+        num_synergies = len(arrays.synergy_sids)
+        self.dept_up_multipliers = np.zeros((num_depts, arrays.num_days))
+        self.dept_low_multipliers = np.zeros((num_depts, arrays.num_days))
+        self.synergy_multipliers = np.zeros((num_synergies, arrays.num_days))
+        self.best_bound = math.inf
+        self.best_value = -1
+        self.best_x = None
+        self.iterations = 0
+        # Days each team is all available (a valid restriction of y that tightens the relaxation)
+        self.team_available = (arrays.synergy_membership @ arrays.availability) >= arrays.synergy_size[:, None]
+
+
+    def evaluate(self, multipliers=None, domain=None):
+        """
+        Solves the relaxation for the given (mu, nu, pi) multipliers (the current ones if None),
+        restricted to domain if given. Returns (bound, x, y, subgradients), where subgradients
+        is the (mu, nu, pi) tuple of dualized row slacks; bound is -inf if the restriction is infeasible.
+        """
+        arrays = self.arrays
+        mu, nu, pi = multipliers if multipliers is not None else self.multipliers()
+        dept_low = arrays.dept_low[:, None] if domain is None else domain.dept_low
+        dept_up = arrays.dept_up[:, None] if domain is None else domain.dept_up
+
+        profit = 1.0 - arrays.dept_membership.T @ (mu - nu) + arrays.synergy_membership.T @ pi
+        if domain is None:
+            x = (arrays.availability & (profit > 0)).astype(int)
+        else:
+            x = np.where(domain.x_low == domain.x_up, domain.x_low, (domain.x_up > 0) & (profit > 0)).astype(int)
+
+        cost = arrays.synergy_size[:, None] * pi
+        y = np.zeros(pi.shape, dtype=int)
+        for k in range(len(arrays.synergy_sids)):
+            allowed = self.team_available[k].copy()
+            forced = np.zeros(arrays.num_days, dtype=bool)
+            if domain is not None:
+                allowed &= domain.y_up[k] > 0
+                forced = (domain.y_low[k] > 0) & allowed
+            y[k, forced] = 1
+            needed = arrays.synergy_target[k] - int(forced.sum())
+            if needed <= 0:
+                continue
+            candidates = np.flatnonzero(allowed & ~forced)
+            if len(candidates) < needed:
+                return -math.inf, x, y, None
+            y[k, candidates[np.argsort(cost[k, candidates], kind='stable')[:needed]]] = 1
+
+        loads = arrays.dept_loads(x)
+        bound = (float(np.sum(profit * x)) - float(np.sum(cost * y))
+                 + float(np.sum(mu * dept_up)) - float(np.sum(nu * dept_low)))
+        subgradients = (dept_up - loads, loads - dept_low, arrays.synergy_membership @ x - arrays.synergy_size[:, None] * y)
+        return bound, x, y, subgradients
+
+
+    def multipliers(self):
+        return (self.dept_up_multipliers, self.dept_low_multipliers, self.synergy_multipliers)
+
+
+    def optimize(self, iterations=100, lower_bound=None, domain=None, multipliers=None, time_limit=-1,
+                 heuristic_frequency=10, step_scale=2.0, stall_limit=10):
+        """
+        Runs up to iterations subgradient steps and returns (best bound, multipliers giving it).
+
+        lower_bound is the value of a known schedule, used in the Polyak step and to stop as
+        soon as the bound can't exceed it. Without a domain, the steps update this object's
+        multipliers and best_bound, and every heuristic_frequency-th relaxed solution is
+        repaired into a schedule (see lagrangian_heuristic()); with a domain, they start from
+        a copy of the given (or current) multipliers and only the node's bound is returned.
+        """
+        start_time = time.time()
+        mu, nu, pi = [m.copy() for m in (multipliers if multipliers is not None else self.multipliers())]
+        best_bound = math.inf
+        best_multipliers = (mu.copy(), nu.copy(), pi.copy())
+        stalled = 0
+
+        for iteration in range(iterations):
+            if time_limit > 0 and time.time() - start_time > time_limit:
+                break
+            bound, x, y, subgradients = self.evaluate((mu, nu, pi), domain)
+            if domain is None:
+                self.iterations += 1
+            if bound == -math.inf:
+                return bound, best_multipliers
+            g_up, g_low, g_synergy = subgradients
+
+            if bound < best_bound - 1e-9:
+                best_bound = bound
+                best_multipliers = (mu.copy(), nu.copy(), pi.copy())
+                stalled = 0
+            else:
+                stalled += 1
+                if stalled >= stall_limit:
+                    step_scale /= 2
+                    stalled = 0
+
+            if domain is None and heuristic_frequency > 0 and iteration % heuristic_frequency == 0:
+                self.lagrangian_heuristic(x)
+                lower_bound = max(lower_bound if lower_bound is not None else -1, self.best_value)
+
+            target = lower_bound if lower_bound is not None and lower_bound >= 0 else 0
+            if integral_bound(best_bound) <= target:
+                break # The bound proves the known schedule optimal (or prunes the node)
+
+            # Only rows that are violated, or whose multiplier can still decrease, move
+            g_up = np.where((g_up > 0) & (mu <= 0), 0, g_up)
+            g_low = np.where((g_low > 0) & (nu <= 0), 0, g_low)
+            g_synergy = np.where((g_synergy > 0) & (pi <= 0), 0, g_synergy)
+            norm = float(np.sum(g_up ** 2) + np.sum(g_low ** 2) + np.sum(g_synergy ** 2))
+            if norm == 0 or step_scale < 1e-4:
+                break
+            step = step_scale * (bound - target) / norm
+            mu = np.maximum(mu - step * g_up, 0)
+            nu = np.maximum(nu - step * g_low, 0)
+            pi = np.maximum(pi - step * g_synergy, 0)
+
+        if domain is None:
+            if best_bound < self.best_bound:
+                self.best_bound = best_bound
+            self.dept_up_multipliers, self.dept_low_multipliers, self.synergy_multipliers = best_multipliers
+        return best_bound, best_multipliers
+
+
+    def lagrangian_heuristic(self, x):
+        """
+        Repairs a relaxed solution's assignments into a feasible schedule (see heuristics.repair())
+        and keeps it if it is the best so far. Returns the schedule's value, or -1 if the repair failed.
+        """
+        repaired = repair(self.arrays, x.copy())
+        if repaired is None:
+            return -1
+        value = self.arrays.objective(repaired)
+        if value > self.best_value:
+            self.best_value = value
+            self.best_x = repaired
+        return value
+
+
+class LagrangianSolver(Solver):
+    """
+    Standalone Lagrangian solver: returns the best schedule of the Lagrangian heuristic
+    with status FEASIBLE (OPTIMAL when it meets the bound), without building an LP.
+    The final bound is kept in the bound field and reported through progress events.
+    """
+    def __init__(self, people, set_constraints, time_limit=-1, iterations=500, heuristic_frequency=10):
+        super(LagrangianSolver, self).__init__(people, set_constraints, time_limit)
+        self.num_days = len(people[0].dateList) if people else 0
+        self.iterations = iterations
+        self.heuristic_frequency = heuristic_frequency
+        self.arrays = ProblemArrays(self.num_days, people, set_constraints)
+        self.relaxation = None
+        self.bound = None
+
+
+    def solve(self):
+        with self.metrics.phase('build'):
+            self.relaxation = LagrangianRelaxation(self.arrays)
+        with self.metrics.phase('solve'):
+            self.relaxation.lagrangian_heuristic(np.zeros(self.arrays.shape, dtype=int))
+            self.bound, _ = self.relaxation.optimize(self.iterations, self.relaxation.best_value, time_limit=self.time_limit,
+                                                     heuristic_frequency=self.heuristic_frequency)
+        self.metrics.set('iterations', self.relaxation.iterations)
+        self.metrics.set('bound', self.bound)
+
+        best_x = self.relaxation.best_x
+        if self.bound == -math.inf:
+            self.status = SolverStatus.INFEASIBLE
+        elif best_x is None:
+            self.status = SolverStatus.OUT_OF_TIME if self.time_limit > 0 else SolverStatus.NOT_SOLVED
+        elif self.relaxation.best_value >= integral_bound(self.bound):
+            self.status = SolverStatus.OPTIMAL
+        else:
+            self.status = SolverStatus.FEASIBLE
+
+        if best_x is not None:
+            self.metrics.set('objective', self.relaxation.best_value)
+            self.report_progress(self.relaxation.best_value, self.bound)
+
+        with self.metrics.phase('extract'):
+            best_schedule = Schedule(people=self.people)
+            best_schedule.buildFromSolutionVariables(self.arrays.to_solution_dict(best_x) if best_x is not None else {})
+
+        self.metrics.publish()
+        return best_schedule
+
+
+if __name__ == '__main__':
+    commandLineParser = argparse.ArgumentParser(description='Bounds and heuristically solves a scheduling instance by Lagrangian relaxation')
+    commandLineParser.add_argument('numdays', type=int, help="the total number of days to schedule for")
+    commandLineParser.add_argument('peopleFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the people being scheduled")
+    commandLineParser.add_argument('setFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the department and synergy constraints")
+    commandLineParser.add_argument('--iterations', type=int, default=500, help="subgradient iterations")
+    commandLineParser.add_argument('--time-limit', type=float, default=-1, help="time limit in seconds")
+
+    args = commandLineParser.parse_args()
+    num_days, people, set_constraints = Parser.parseCSVs(n=args.numdays, peopleFile=args.peopleFile, setFile=args.setFile)
+
+    solver = LagrangianSolver(people, set_constraints, args.time_limit, args.iterations)
+    metrics = solver.enable_metrics()
+    schedule = solver.solve()
+    print('Status:', solver.status)
+    print('Bound:', solver.bound)
+    print(metrics)
@@ -0,0 +1,340 @@
+# Large neighbourhood search over the OR-Tools scheduling model
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import math
+import time
+
+import numpy as np
+
+from officeScheduler.heuristics import repair
+from officeScheduler.ortools_utils import (build_scheduling_ilp, ORTOOLS_SOLVER_STATUS_TO_OURS_MAP,
+    SCHEDULE_VAR_PREFIX)
+import officeScheduler.Parser as Parser
+from officeScheduler.problem_arrays import ProblemArrays
+from officeScheduler.rolling_horizon import full_horizon_lp_bound
+from officeScheduler.Schedule import Schedule
+from officeScheduler.Solver import Solver, SolverStatus
+
+NEIGHBOURHOODS = ('department', 'day-block', 'synergy')
+
+MIN_SIZE = 0.01 # Smallest and largest neighbourhood sizes, as fractions of the person-days
+MAX_SIZE = 0.5
+
+# Neighbourhood model of a worker process (see _init_worker())
+_worker_model = None
+
+
+class NeighbourhoodModel(object):
+    """
+    The full OR-Tools scheduling model, built once and re-solved with every
+    Schedule variable outside a neighbourhood fixed to the incumbent.
+    Only the variable bounds that change between solves are updated.
+
+    Fields:
+        solver - the OR-Tools solver holding the model
+        schedule_vars - people by days list of lists of the Schedule variables
+        lower, upper - people by days bounds currently set on them
+    """
+    def __init__(self, num_days, people, set_constraints, synergy_formulation='aggregated'):
+        sets = [copy.copy(set_constraint) for set_constraint in set_constraints] # up_bounds are normalized in place
+        self.solver, variables, constraints = build_scheduling_ilp(num_days, people, sets, synergy_formulation)
+        self.schedule_vars = [[variables['{0}_{1}_{2}'.format(SCHEDULE_VAR_PREFIX, person.uid, day)]
+                               for day in range(1, num_days + 1)] for person in people]
+        self.lower = np.zeros((len(people), num_days), dtype=int)
+        self.upper = np.ones((len(people), num_days), dtype=int)
+
+
+    def solve(self, x, free, time_limit=-1):
+        """
+        Solves the model with the person-days where the boolean matrix free is False fixed
+        to their values in x (hinted with x everywhere). Returns the SolverStatus and the
+        assignments matrix (None unless a schedule was found).
+        """
+        lower = np.where(free, 0, x)
+        upper = np.where(free, 1, x)
+        for i, j in zip(*np.nonzero((lower != self.lower) | (upper != self.upper))):
+            self.schedule_vars[i][j].SetBounds(float(lower[i, j]), float(upper[i, j]))
+        self.lower, self.upper = lower, upper
+
+        flat_vars = [var for row in self.schedule_vars for var in row]
+        self.solver.SetHint(flat_vars, [float(value) for value in np.ravel(x)])
+        self.solver.SetTimeLimit(int(time_limit * 1000) if time_limit > 0 else 0)
+        status = ORTOOLS_SOLVER_STATUS_TO_OURS_MAP.get(self.solver.Solve(), SolverStatus.NOT_SOLVED)
+        if status not in [SolverStatus.OPTIMAL, SolverStatus.FEASIBLE]:
+            return status, None
+        new_x = np.array([[round(var.solution_value()) for var in row] for row in self.schedule_vars], dtype=int)
+        return status, new_x
+
+
+def _init_worker(num_days, people, set_constraints, synergy_formulation):
+    """Worker initializer: builds the worker's NeighbourhoodModel once."""
+    global _worker_model
+    _worker_model = NeighbourhoodModel(num_days, people, set_constraints, synergy_formulation)
+
+
+def _solve_in_worker(x, free, time_limit):
+    status, new_x = _worker_model.solve(x, free, time_limit)
+    return status.value, new_x
+
+
+class NeighbourhoodSelector(object):
+    """
+    Adaptive choice of neighbourhood kinds and sizes. Each kind is picked with
+    probability proportional to its weight, an exponential average of its
+    recent success (1 if a solve improved the incumbent, 0 otherwise) kept
+    above min_weight. Each kind's size grows when its sub-MIPs are solved to
+    optimality without improving (the neighbourhood is too easy) and shrinks
+    when they hit the time limit (too hard).
+
+    Fields:
+        kinds - neighbourhood kinds (see NEIGHBOURHOODS)
+        weights, sizes - dictionaries of kinds to selection weights and sizes (fractions of the person-days)
+        stats - dictionary of kinds to dictionaries with 'calls', 'improvements' and 'time'
+    """
+    def __init__(self, kinds=NEIGHBOURHOODS, initial_size=0.1, reaction=0.3, min_weight=0.05, size_factor=1.25):
+        self.kinds = list(kinds)
+        self.weights = {kind: 1.0 for kind in self.kinds}
+        self.sizes = {kind: initial_size for kind in self.kinds}
+        self.reaction = reaction
+        self.min_weight = min_weight
+        self.size_factor = size_factor
+        self.stats = {kind: {'calls': 0, 'improvements': 0, 'time': 0.0} for kind in self.kinds}
+
+
+    def choose(self, rng):
+        weights = np.array([self.weights[kind] for kind in self.kinds])
+        return self.kinds[rng.choice(len(self.kinds), p=weights / weights.sum())]
+
+
+    def update(self, kind, status, improved, elapsed_time):
+        stats = self.stats[kind]
+        stats['calls'] += 1
+        stats['improvements'] += int(improved)
+        stats['time'] += elapsed_time
+        self.weights[kind] = max((1 - self.reaction) * self.weights[kind] + self.reaction * float(improved), self.min_weight)
+        if status == SolverStatus.OPTIMAL and not improved:
+            self.sizes[kind] = min(self.sizes[kind] * self.size_factor, MAX_SIZE)
+        elif status != SolverStatus.OPTIMAL:
+            self.sizes[kind] = max(self.sizes[kind] / self.size_factor, MIN_SIZE)
+
+
+def neighbourhood(arrays, kind, size, rng):
+    """
+    Returns the people by days boolean matrix of the person-days freed by a random
+    neighbourhood of the given kind covering about size (a fraction) of the person-days:
+        'department' - the members of a random department over a random block of days
+        'day-block' - everybody over a random block of days
+        'synergy' - the members of random synergy teams (until the size is reached) over every day
+    Kinds without any set fall back to 'day-block'.
+    """
+    num_people, num_days = arrays.shape
+    target = max(int(size * num_people * num_days), 1)
+    free = np.zeros(arrays.shape, dtype=bool)
+
+    if kind == 'department' and len(arrays.dept_sids):
+        members = np.flatnonzero(arrays.dept_membership[rng.integers(len(arrays.dept_sids))])
+        width = min(max(target // max(len(members), 1), 1), num_days)
+        start = rng.integers(num_days - width + 1)
+        free[members, start:start + width] = True
+    elif kind == 'synergy' and len(arrays.synergy_sids):
+        for k in rng.permutation(len(arrays.synergy_sids)):
+            free[arrays.synergy_members[k]] = True
+            if free.sum() >= target:
+                break
+    else:
+        width = min(max(target // max(num_people, 1), 1), num_days)
+        start = rng.integers(num_days - width + 1)
+        free[:, start:start + width] = True
+
+    return free & arrays.availability
+
+
+def coupled_dept_days(arrays, free):
+    """Returns the departments by days boolean matrix of the department rows involving a freed person-day."""
+    return (arrays.dept_membership @ free) > 0
+
+
+class LNSSolver(Solver):
+    """
+    Large neighbourhood search for instances on which DirectILPSolver can't
+    close the gap within the time limit. Starting from a repaired greedy
+    schedule (or a short solve of the full model), it repeatedly frees a
+    neighbourhood (see neighbourhood()), fixes every other person-day to the
+    incumbent and re-solves the small sub-MIP with neighbourhood_time_limit,
+    keeping the result if it is at least as good. Neighbourhood kinds and
+    sizes adapt to their recent success (see NeighbourhoodSelector).
+
+    With num_workers > 1, each round draws up to num_workers neighbourhoods
+    sharing no person-day or department-day row and solves them in parallel,
+    in worker processes that each build the model once. Their changes are
+    then merged, best first, as long as the merged schedule stays feasible
+    (the neighbourhoods may still share synergy targets).
+
+    The search stops at the time limit, after max_rounds rounds, or once the
+    incumbent meets the LP bound (status OPTIMAL; FEASIBLE otherwise).
+
+    Fields:
+        selector - the NeighbourhoodSelector (kinds, weights, sizes and per-kind stats)
+        lp_bound - LP relaxation bound of the instance (None if the LP is infeasible)
+        rounds - rounds run by the last solve
+    """
+    def __init__(self, people, set_constraints, time_limit=-1, neighbourhood_time_limit=2.0, max_rounds=200,
+                 num_workers=1, initial_size=0.1, kinds=NEIGHBOURHOODS, seed=None, synergy_formulation='aggregated'):
+        super(LNSSolver, self).__init__(people, set_constraints, time_limit)
+        self.num_days = len(people[0].dateList) if people else 0
+        self.neighbourhood_time_limit = neighbourhood_time_limit
+        self.max_rounds = max_rounds
+        self.num_workers = num_workers
+        self.initial_size = initial_size
+        self.kinds = kinds
+        self.seed = seed
+        self.synergy_formulation = synergy_formulation
+        self.arrays = ProblemArrays(self.num_days, people, set_constraints)
+        self.selector = None
+        self.lp_bound = None
+        self.rounds = 0
+
+
+    def solve(self):
+        start_time = time.time()
+        rng = np.random.default_rng(self.seed)
+        self.selector = NeighbourhoodSelector(self.kinds, self.initial_size)
+        self.rounds = 0
+
+        with self.metrics.phase('presolve'):
+            self.lp_bound = full_horizon_lp_bound(self.num_days, self.people, self.set_constraints)
+        if self.lp_bound is None:
+            self.status = SolverStatus.INFEASIBLE
+            self.metrics.publish()
+            return Schedule(people=self.people)
+        target = math.floor(self.lp_bound + 1e-6)
+        self.metrics.set('lp_bound', self.lp_bound)
+
+        executor = None
+        with self.metrics.phase('build'):
+            model = NeighbourhoodModel(self.num_days, self.people, self.set_constraints, self.synergy_formulation)
+            if self.num_workers > 1:
+                executor = ProcessPoolExecutor(max_workers=self.num_workers, initializer=_init_worker,
+                                               initargs=(self.num_days, self.people, self.set_constraints,
+                                                         self.synergy_formulation))
+
+        try:
+            with self.metrics.phase('solve'):
+                x = repair(self.arrays, np.zeros(self.arrays.shape, dtype=int))
+                if x is None:
+                    time_limit = self._remaining_time(start_time, self.neighbourhood_time_limit * 5)
+                    status = SolverStatus.OUT_OF_TIME
+                    if time_limit != 0: # 0 means the overall time limit is used up, not no limit
+                        status, x = model.solve(np.zeros(self.arrays.shape, dtype=int), self.arrays.availability,
+                                                time_limit)
+                    if status == SolverStatus.INFEASIBLE:
+                        self.status = SolverStatus.INFEASIBLE
+                        self.metrics.publish()
+                        return Schedule(people=self.people)
+                if x is not None:
+                    self.report_progress(self.arrays.objective(x), self.lp_bound)
+                    x = self._search(model, executor, x, target, rng, start_time)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+        self.metrics.set('rounds', self.rounds)
+        for kind, stats in self.selector.stats.items():
+            self.metrics.set('{0}_calls'.format(kind), stats['calls'])
+            self.metrics.set('{0}_improvements'.format(kind), stats['improvements'])
+
+        if x is None:
+            self.status = SolverStatus.OUT_OF_TIME if self.time_limit > 0 else SolverStatus.NOT_SOLVED
+            self.metrics.publish()
+            return Schedule(people=self.people)
+
+        value = self.arrays.objective(x)
+        self.status = SolverStatus.OPTIMAL if value >= target else SolverStatus.FEASIBLE
+        self.metrics.set('objective', value)
+
+        with self.metrics.phase('extract'):
+            best_schedule = Schedule(people=self.people)
+            best_schedule.buildFromSolutionVariables(self.arrays.to_solution_dict(x))
+
+        self.metrics.publish()
+        return best_schedule
+
+
+    def _search(self, model, executor, x, target, rng, start_time):
+        """Runs LNS rounds from the feasible schedule x and returns the best schedule found."""
+        value = self.arrays.objective(x)
+        while self.rounds < self.max_rounds and value < target and not self.is_cancelled():
+            time_limit = self._remaining_time(start_time, self.neighbourhood_time_limit)
+            if time_limit == 0:
+                break
+            self.rounds += 1
+
+            # Draw neighbourhoods disjoint from those already drawn this round
+            drawn = []
+            used_free = np.zeros(self.arrays.shape, dtype=bool)
+            used_dept_days = np.zeros((len(self.arrays.dept_sids), self.num_days), dtype=bool)
+            for _ in range(2 * max(self.num_workers, 1)):
+                if len(drawn) >= max(self.num_workers, 1):
+                    break
+                kind = self.selector.choose(rng)
+                free = neighbourhood(self.arrays, kind, self.selector.sizes[kind], rng)
+                dept_days = coupled_dept_days(self.arrays, free)
+                if np.any(free & used_free) or np.any(dept_days & used_dept_days):
+                    continue
+                used_free |= free
+                used_dept_days |= dept_days
+                drawn.append((kind, free))
+
+            round_start_time = time.time()
+            if executor is None:
+                results = [model.solve(x, free, time_limit) for kind, free in drawn]
+            else:
+                futures = [executor.submit(_solve_in_worker, x, free, time_limit) for kind, free in drawn]
+                results = [(SolverStatus(status_value), new_x) for status_value, new_x in (future.result() for future in futures)]
+            elapsed_time = time.time() - round_start_time
+
+            # Merge the neighbourhoods' changes, best first, while the result stays feasible
+            candidates = []
+            for (kind, free), (status, new_x) in zip(drawn, results):
+                new_value = self.arrays.objective(new_x) if new_x is not None else -1
+                self.selector.update(kind, status, new_value > value, elapsed_time)
+                if new_value >= value:
+                    candidates.append((new_value, free, new_x))
+            combined, combined_value = x, value
+            for new_value, free, new_x in sorted(candidates, key=lambda candidate: -candidate[0]):
+                merged = combined.copy()
+                merged[free] = new_x[free]
+                if self.arrays.is_feasible(merged):
+                    combined, combined_value = merged, self.arrays.objective(merged)
+            if combined_value > value:
+                self.report_progress(combined_value, self.lp_bound)
+            x, value = combined, combined_value
+        return x
+
+
+    def _remaining_time(self, start_time, time_limit):
+        """Returns time_limit capped by what is left of the overall time limit (0 if none is left)."""
+        if self.time_limit <= 0:
+            return time_limit
+        return max(min(time_limit, self.time_limit - (time.time() - start_time)), 0)
+
+
+if __name__ == '__main__':
+    commandLineParser = argparse.ArgumentParser(description='Improves a scheduling instance\'s schedule by large neighbourhood search')
+    commandLineParser.add_argument('numdays', type=int, help="the total number of days to schedule for")
+    commandLineParser.add_argument('peopleFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the people being scheduled")
+    commandLineParser.add_argument('setFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the department and synergy constraints")
+    commandLineParser.add_argument('--time-limit', type=float, default=60, help="time limit in seconds")
+    commandLineParser.add_argument('--neighbourhood-time-limit', type=float, default=2.0, help="time limit of each sub-MIP in seconds")
+    commandLineParser.add_argument('--workers', type=int, default=1, help="number of neighbourhoods solved in parallel")
+
+    args = commandLineParser.parse_args()
+    num_days, people, set_constraints = Parser.parseCSVs(n=args.numdays, peopleFile=args.peopleFile, setFile=args.setFile)
+
+    solver = LNSSolver(people, set_constraints, args.time_limit, args.neighbourhood_time_limit, num_workers=args.workers)
+    metrics = solver.enable_metrics()
+    schedule = solver.solve()
+    print('Status:', solver.status)
+    print('LP bound: {0}'.format(solver.lp_bound))
+    print(metrics)
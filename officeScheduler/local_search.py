@@ -0,0 +1,305 @@
+# Simulated annealing over the assignments matrix, for instances too large for a MIP solve
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import math
+import os
+import time
+
+import numpy as np
+
+from officeScheduler.heuristics import fill, repair
+import officeScheduler.Parser as Parser
+from officeScheduler.problem_arrays import ProblemArrays
+from officeScheduler.Schedule import Schedule
+from officeScheduler.Solver import Solver, SolverStatus
+
+# Padding for the per-person set index arrays: a dummy set whose bounds never bind
+_UNBOUNDED = 10 ** 9
+
+
+class SearchState(object):
+    """
+    Assignments matrix of a local search with its incrementally maintained
+    per-set daily headcounts, so that moves are scored from the counts of the
+    sets of the people they touch only.
+
+    Every person's departments and synergy teams are held in index arrays
+    padded with a dummy set (last row) whose bounds never bind, so batches of
+    moves are scored with NumPy gathers of shape (moves, sets per person).
+    The penalty is the total violation of department bounds and synergy
+    targets (availability is never violated: moves only touch available
+    person-days).
+
+    Fields:
+        arrays - the ProblemArrays instance being solved
+        x - the people by days 0/1 assignments matrix
+        loads - departments (plus the dummy) by days attendance
+        absent - synergy teams (plus the dummy) by days count of absent members
+        synergy_days - number of days each team (plus the dummy) is all present
+        value - number of person-days scheduled
+        penalty - total constraint violation (0 iff x is feasible)
+    """
+    def __init__(self, arrays, x):
+        self.arrays = arrays
+        self.person_depts = _padded(arrays.person_depts, len(arrays.dept_sids))
+        person_synergies = [np.flatnonzero(arrays.synergy_membership[:, i]) for i in range(len(arrays.uids))]
+        self.person_synergies = _padded(person_synergies, len(arrays.synergy_sids))
+        self.dept_low = np.append(arrays.dept_low, -_UNBOUNDED)
+        self.dept_up = np.append(arrays.dept_up, _UNBOUNDED)
+        self.synergy_target = np.append(arrays.synergy_target, 0)
+        self.reset(x)
+
+
+    def reset(self, x):
+        """Replaces the assignments matrix and recomputes every count from scratch."""
+        arrays = self.arrays
+        self.x = np.asarray(x, dtype=np.int8) * arrays.availability
+        self.loads = np.vstack([arrays.dept_loads(self.x), np.zeros((1, arrays.num_days), dtype=int)])
+        absent = arrays.synergy_size[:, None] - arrays.synergy_membership @ self.x
+        self.absent = np.vstack([absent, np.full((1, arrays.num_days), _UNBOUNDED)])
+        self.synergy_days = (self.absent == 0).sum(axis=1)
+        self.value = int(self.x.sum())
+        self.penalty = (int(np.sum(self._dept_violation(self.loads, self.dept_low[:, None], self.dept_up[:, None])))
+                        + int(np.sum(np.maximum(self.synergy_target - self.synergy_days, 0))))
+
+
+    @staticmethod
+    def _dept_violation(loads, low, up):
+        return np.maximum(loads - up, 0) + np.maximum(low - loads, 0)
+
+
+    def flip_scores(self, people, days):
+        """
+        Scores flipping each given person-day (vectorized over the arrays of indices).
+        Returns (value changes, department penalty changes, synergy day count changes),
+        the last one per move and per entry of the person's padded team list.
+        """
+        signs = 1 - 2 * self.x[people, days].astype(int)
+        depts = self.person_depts[people]
+        loads = self.loads[depts, days[:, None]]
+        low, up = self.dept_low[depts], self.dept_up[depts]
+        dept_change = (self._dept_violation(loads + signs[:, None], low, up)
+                       - self._dept_violation(loads, low, up)).sum(axis=1)
+
+        absent = self.absent[self.person_synergies[people], days[:, None]]
+        day_change = np.where((signs[:, None] > 0) & (absent == 1), 1, 0) - np.where((signs[:, None] < 0) & (absent == 0), 1, 0)
+        return signs, dept_change, day_change
+
+
+    def synergy_penalty_change(self, people, day_change):
+        """Returns the change of the synergy penalty of each move, given its team day count changes."""
+        synergies = self.person_synergies[people]
+        days = self.synergy_days[synergies]
+        target = self.synergy_target[synergies]
+        return (np.maximum(target - days - day_change, 0) - np.maximum(target - days, 0)).sum(axis=1)
+
+
+    def flip(self, person, day):
+        """Flips one person-day, updating the counts."""
+        sign = 1 - 2 * int(self.x[person, day])
+        self.x[person, day] += sign
+        depts = self.person_depts[person]
+        synergies = self.person_synergies[person]
+        old_dept_violation = self._dept_violation(self.loads[depts, day], self.dept_low[depts], self.dept_up[depts]).sum()
+        old_synergy_violation = np.maximum(self.synergy_target[synergies] - self.synergy_days[synergies], 0).sum()
+
+        np.add.at(self.loads, (depts, day), sign)
+        was_present = self.absent[synergies, day] == 0
+        np.add.at(self.absent, (synergies, day), -sign)
+        np.add.at(self.synergy_days, synergies, (self.absent[synergies, day] == 0).astype(int) - was_present)
+
+        self.value += sign
+        self.penalty += int(self._dept_violation(self.loads[depts, day], self.dept_low[depts], self.dept_up[depts]).sum()
+                            - old_dept_violation)
+        self.penalty += int(np.maximum(self.synergy_target[synergies] - self.synergy_days[synergies], 0).sum()
+                            - old_synergy_violation)
+
+
+def _padded(index_lists, pad):
+    """Stacks lists of indices into a matrix, padding every row with pad (and at least one column of it)."""
+    width = max([len(indices) for indices in index_lists] + [0]) + 1
+    padded = np.full((len(index_lists), width), pad, dtype=int)
+    for row, indices in enumerate(index_lists):
+        padded[row, :len(indices)] = indices
+    return padded
+
+
+def anneal(arrays, x=None, seed=None, time_limit=-1, iterations=20000, batch_size=64, penalty_weight=2.0,
+           initial_temperature=2.0, final_temperature=0.05):
+    """
+    Runs one simulated annealing search from x (by default, a repaired or
+    greedily filled schedule) and returns (best value, best feasible
+    assignments matrix or None, iterations run).
+
+    Each iteration scores batch_size random moves at once: flips of an
+    available person-day, and swaps of a person's scheduled day for one of
+    their available unscheduled days. The best one is made if it doesn't
+    lower value - penalty_weight * penalty, or otherwise with the usual
+    annealing probability; the temperature decreases geometrically with the
+    fraction of the iterations (or time limit) used.
+    """
+    rng = np.random.default_rng(seed)
+    start_time = time.time()
+    if x is None:
+        x = repair(arrays, np.zeros(arrays.shape, dtype=int))
+        if x is None:
+            x = fill(arrays, np.zeros(arrays.shape, dtype=int), order=rng.permutation(len(arrays.uids)))
+    state = SearchState(arrays, x)
+
+    available_people, available_days = np.nonzero(arrays.availability)
+    if len(available_people) == 0:
+        return (0, state.x.astype(int), 0) if state.penalty == 0 else (-1, None, 0)
+
+    best_value, best_x = -1, None
+    if state.penalty == 0:
+        best_value, best_x = state.value, state.x.astype(int)
+
+    iteration = 0
+    for iteration in range(iterations):
+        progress = iteration / iterations
+        if time_limit > 0:
+            elapsed_time = time.time() - start_time
+            if elapsed_time > time_limit:
+                break
+            progress = max(progress, elapsed_time / time_limit)
+        temperature = initial_temperature * (final_temperature / initial_temperature) ** progress
+
+        # Flips of random available person-days
+        cells = rng.integers(len(available_people), size=batch_size)
+        people, days = available_people[cells], available_days[cells]
+        signs, dept_change, day_change = state.flip_scores(people, days)
+        flip_scores = signs - penalty_weight * (dept_change + state.synergy_penalty_change(people, day_change))
+
+        # Swaps of the same people's days: drop a scheduled day, add an unscheduled one
+        swap_days = rng.integers(arrays.num_days, size=batch_size)
+        swap_days_ok = arrays.availability[people, swap_days] & (state.x[people, swap_days] != state.x[people, days])
+        _, other_dept_change, other_day_change = state.flip_scores(people, swap_days)
+        swap_scores = np.where(swap_days_ok & (swap_days != days),
+                               -penalty_weight * (dept_change + other_dept_change
+                                                  + state.synergy_penalty_change(people, day_change + other_day_change)),
+                               -np.inf)
+
+        best_flip = int(np.argmax(flip_scores))
+        best_swap = int(np.argmax(swap_scores))
+        if swap_scores[best_swap] > flip_scores[best_flip]:
+            score, moves = swap_scores[best_swap], [(people[best_swap], days[best_swap]), (people[best_swap], swap_days[best_swap])]
+        else:
+            score, moves = flip_scores[best_flip], [(people[best_flip], days[best_flip])]
+
+        if score >= 0 or rng.random() < math.exp(score / temperature):
+            for person, day in moves:
+                state.flip(person, day)
+            if state.penalty == 0 and state.value > best_value:
+                best_value, best_x = state.value, state.x.astype(int)
+
+    return best_value, best_x, iteration + 1
+
+
+def _anneal_restart(arrays, seed, time_limit, iterations, batch_size, penalty_weight):
+    """Process body for one restart (module-level so it can be pickled)."""
+    return anneal(arrays, None, seed, time_limit, iterations, batch_size, penalty_weight)
+
+
+def upper_bound(arrays):
+    """
+    Returns a simple bound on the number of person-days: on each day, the
+    available people outside every department plus, for the others, the
+    smaller of their number and the sum of their departments' upper bounds.
+    """
+    in_dept = arrays.dept_membership.sum(axis=0) > 0
+    available = arrays.availability
+    outside = available[~in_dept].sum(axis=0)
+    inside = np.minimum(available[in_dept].sum(axis=0), arrays.dept_up.sum())
+    return int(np.sum(outside + inside))
+
+
+class LocalSearchSolver(Solver):
+    """
+    Simulated annealing solver for instances too large for a MIP solve (see anneal()).
+    Runs restarts independent searches with different seeds, spread over
+    num_workers processes (1 runs them in this process), and returns the best
+    feasible schedule found. Each search stops after its iterations or its
+    share of the time limit, whichever comes first.
+
+    Local search can't prove optimality or infeasibility, so the status is
+    FEASIBLE when a schedule is found (OPTIMAL only if it meets upper_bound()),
+    and NOT_SOLVED (OUT_OF_TIME under a time limit) otherwise.
+
+    Fields:
+        restarts - number of independent searches
+        num_workers - number of processes to run them in (None for one per CPU)
+        iterations, batch_size, penalty_weight - per-search parameters passed to anneal()
+        seed - seed of the first search (the others use the following seeds); None for random seeds
+    """
+    def __init__(self, people, set_constraints, time_limit=-1, restarts=4, num_workers=None, iterations=20000,
+                 batch_size=64, penalty_weight=2.0, seed=None):
+        super(LocalSearchSolver, self).__init__(people, set_constraints, time_limit)
+        self.num_days = len(people[0].dateList) if people else 0
+        self.restarts = restarts
+        self.num_workers = num_workers
+        self.iterations = iterations
+        self.batch_size = batch_size
+        self.penalty_weight = penalty_weight
+        self.seed = seed
+        self.arrays = ProblemArrays(self.num_days, people, set_constraints)
+
+
+    def solve(self):
+        base_seed = self.seed if self.seed is not None else int(np.random.default_rng().integers(2 ** 31))
+        seeds = [base_seed + restart for restart in range(self.restarts)]
+        num_workers = min(self.num_workers or os.cpu_count() or 1, self.restarts)
+        # Restarts run in waves of num_workers, which share the time limit
+        restart_time_limit = self.time_limit * num_workers / self.restarts if self.time_limit > 0 else -1
+        args = (restart_time_limit, self.iterations, self.batch_size, self.penalty_weight)
+
+        with self.metrics.phase('solve'):
+            if num_workers <= 1:
+                results = [_anneal_restart(self.arrays, seed, *args) for seed in seeds]
+            else:
+                with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                    futures = [executor.submit(_anneal_restart, self.arrays, seed, *args) for seed in seeds]
+                    results = [future.result() for future in futures]
+
+        best_value, best_x = -1, None
+        for value, x, _ in results:
+            if x is not None and value > best_value:
+                best_value, best_x = value, x
+        bound = upper_bound(self.arrays)
+        self.metrics.set('iterations', sum(result[2] for result in results))
+        self.metrics.set('restarts', len(results))
+        self.metrics.set('bound', bound)
+
+        if best_x is None:
+            self.status = SolverStatus.OUT_OF_TIME if self.time_limit > 0 else SolverStatus.NOT_SOLVED
+            self.metrics.publish()
+            return Schedule(people=self.people)
+
+        self.status = SolverStatus.OPTIMAL if best_value >= bound else SolverStatus.FEASIBLE
+        self.metrics.set('objective', best_value)
+        self.report_progress(best_value, bound)
+
+        with self.metrics.phase('extract'):
+            best_schedule = Schedule(people=self.people)
+            best_schedule.buildFromSolutionVariables(self.arrays.to_solution_dict(best_x))
+
+        self.metrics.publish()
+        return best_schedule
+
+
+if __name__ == '__main__':
+    commandLineParser = argparse.ArgumentParser(description='Heuristically solves a scheduling instance by simulated annealing')
+    commandLineParser.add_argument('numdays', type=int, help="the total number of days to schedule for")
+    commandLineParser.add_argument('peopleFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the people being scheduled")
+    commandLineParser.add_argument('setFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the department and synergy constraints")
+    commandLineParser.add_argument('--restarts', type=int, default=4, help="number of independent searches")
+    commandLineParser.add_argument('--iterations', type=int, default=20000, help="iterations per search")
+    commandLineParser.add_argument('--time-limit', type=float, default=-1, help="time limit in seconds")
+
+    args = commandLineParser.parse_args()
+    num_days, people, set_constraints = Parser.parseCSVs(n=args.numdays, peopleFile=args.peopleFile, setFile=args.setFile)
+
+    solver = LocalSearchSolver(people, set_constraints, args.time_limit, args.restarts, iterations=args.iterations)
+    metrics = solver.enable_metrics()
+    schedule = solver.solve()
+    print('Status:', solver.status)
+    print(metrics)
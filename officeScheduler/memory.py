@@ -0,0 +1,166 @@
+# Memory estimates, budgets and disk spilling for memory-constrained solving
+import os
+import pickle
+import tempfile
+
+from officeScheduler.PeopleAndSets import SetConstraintType
+
+# Approximate bytes per model element, measured on generated instances of 200-1000 people
+MODEL_BYTES = {'pulp': {'variable': 500, 'constraint': 400, 'nonzero': 100},
+               'ortools': {'variable': 200, 'constraint': 100, 'nonzero': 50}}
+
+
+def model_size(num_days, people, set_constraints):
+    """
+    Returns (variables, constraints, nonzeros) of the aggregated scheduling model,
+    counted from the instance without building it.
+    """
+    num_variables = len(people) * num_days
+    num_constraints = 0
+    num_nonzeros = 0
+    for person in people:
+        unavailable = sum(1 for available in person.dateList[:num_days] if not available)
+        num_constraints += unavailable
+        num_nonzeros += unavailable
+
+    for set_constraint in set_constraints:
+        size = len(set_constraint.personList)
+        if set_constraint.constraintType.value == SetConstraintType.DEPARTMENT.value:
+            num_constraints += num_days
+            num_nonzeros += size * num_days
+        elif set_constraint.constraintType.value == SetConstraintType.SYNERGY.value:
+            num_variables += num_days
+            num_constraints += 1 + num_days
+            num_nonzeros += num_days + (size + 1) * num_days
+
+    num_nonzeros += len(people) * num_days # Objective
+    return num_variables, num_constraints, num_nonzeros
+
+
+def estimate_model_memory(num_days, people, set_constraints, backend='pulp'):
+    """Returns the estimated number of bytes needed to build the model with the given backend ('pulp' or 'ortools')."""
+    num_variables, num_constraints, num_nonzeros = model_size(num_days, people, set_constraints)
+    costs = MODEL_BYTES[backend]
+    return (costs['variable'] * num_variables + costs['constraint'] * num_constraints
+            + costs['nonzero'] * num_nonzeros)
+
+
+def current_rss():
+    """Returns the resident set size of this process in bytes (None if unavailable)."""
+    try:
+        with open('/proc/self/statm', 'r') as statmFile:
+            return int(statmFile.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryBudgetExceeded(Exception):
+    """
+    Raised when an instance's model can't be built within the memory budget.
+
+    Fields:
+        message - explanation of the error
+        estimate - estimated bytes needed
+        budget - the budget in bytes
+    """
+    def __init__(self, message, estimate=None, budget=None):
+        super(MemoryBudgetExceeded, self).__init__(message)
+        self.message = message
+        self.estimate = estimate
+        self.budget = budget
+
+
+class MemoryBudget(object):
+    """
+    A limit in bytes on the memory a solve may use, counted as the growth of
+    this process's resident set size from when the budget was created.
+
+    Fields:
+        limit - the budget in bytes
+        baseline - resident set size when the budget was created
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.baseline = current_rss() or 0
+
+
+    def used(self):
+        rss = current_rss()
+        return 0 if rss is None else max(0, rss - self.baseline)
+
+
+    def remaining(self):
+        return self.limit - self.used()
+
+
+    def exceeded(self):
+        return self.used() > self.limit
+
+
+    def check_model(self, num_days, people, set_constraints, backend='pulp'):
+        """Raises MemoryBudgetExceeded if the estimated model doesn't fit in the remaining budget."""
+        estimate = estimate_model_memory(num_days, people, set_constraints, backend)
+        if estimate > self.remaining():
+            raise MemoryBudgetExceeded('Estimated {0} model memory of {1:.1f} MB exceeds the remaining budget of {2:.1f} MB.'.format(
+                backend, estimate / 1e6, self.remaining() / 1e6), estimate, self.limit)
+        return estimate
+
+
+class SpillFile(object):
+    """
+    Last-in, first-out store of picklable items in a temporary file,
+    for moving open branch and bound nodes out of memory.
+
+    Fields:
+        filepath - the temporary file
+        offsets - file offsets of the stored batches, oldest first
+        count - number of items stored
+    """
+    def __init__(self, directory=None):
+        fileDescriptor, self.filepath = tempfile.mkstemp(prefix='bnb_spill_', suffix='.pkl', dir=directory)
+        self.spillFile = os.fdopen(fileDescriptor, 'w+b')
+        self.offsets = []
+        self.sizes = []
+        self.count = 0
+
+
+    def push(self, items):
+        """Appends a batch of items."""
+        if not items:
+            return
+        self.spillFile.seek(0, os.SEEK_END)
+        self.offsets.append(self.spillFile.tell())
+        self.sizes.append(len(items))
+        pickle.dump(items, self.spillFile, protocol=pickle.HIGHEST_PROTOCOL)
+        self.count += len(items)
+
+
+    def pop(self):
+        """Removes and returns the most recently pushed batch (an empty list if there is none)."""
+        if not self.offsets:
+            return []
+        offset = self.offsets.pop()
+        self.count -= self.sizes.pop()
+        self.spillFile.seek(offset)
+        items = pickle.load(self.spillFile)
+        self.spillFile.truncate(offset)
+        return items
+
+
+    def items(self):
+        """Returns every stored item, oldest batch first, without removing any."""
+        items = []
+        for offset in self.offsets:
+            self.spillFile.seek(offset)
+            items.extend(pickle.load(self.spillFile))
+        return items
+
+
+    def __len__(self):
+        return self.count
+
+
+    def close(self):
+        self.spillFile.close()
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
@@ -0,0 +1,237 @@
+# Phase timings and counters reported by solvers
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import json
+import logging
+import os
+import re
+import time
+
+from officeScheduler.memory import current_rss
+
+
+def current_rss_kb():
+    """Current resident set size of this process, in kilobytes (0 if unavailable)."""
+    return (current_rss() or 0) // 1024
+
+
+def cpu_time():
+    """
+    CPU seconds used by this process and its waited-for children
+    (so CBC runs started by PuLP are included once they finish).
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class SolverMetrics(object):
+    """
+    Wall and CPU time per phase (parse, presolve, build, solve, extract, ...)
+    and named counters (model sizes, node and iteration counts, ...) of one solve.
+    When disabled, phase() returns a shared no-op context and the other
+    methods return immediately, so instrumented code costs almost nothing.
+
+    Fields:
+        solver_name - name of the solver the metrics belong to
+        enabled - whether anything is recorded
+        sinks - list of MetricsSink instances that publish() sends the metrics to
+        phases - ordered dictionary of phase names to
+                 {'wall': seconds, 'cpu': seconds, 'count': n, 'rss_kb': kB, 'rss_delta_kb': kB},
+                 where rss_kb is the highest resident set size of the process at the end of a run
+                 of the phase, and rss_delta_kb the total change of the resident set size over
+                 its runs (the memory the phase kept; transient peaks inside a phase aren't seen)
+        counters - dictionary of counter names to numbers
+    """
+    def __init__(self, solver_name, enabled=False, sinks=None):
+        self.solver_name = solver_name
+        self.enabled = enabled
+        self.sinks = sinks if sinks is not None else []
+        self.phases = OrderedDict()
+        self.counters = {}
+
+
+    def phase(self, name):
+        """Returns a context manager that adds the time spent inside it to the given phase."""
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+
+    def start_phase(self, name):
+        """
+        Starts timing the given phase, for code that doesn't fit in a with block;
+        pass the returned token to end_phase().
+        """
+        if not self.enabled:
+            return None
+        return (name, time.perf_counter(), cpu_time(), current_rss_kb())
+
+
+    def end_phase(self, token):
+        if token is None:
+            return
+        name, start_wall, start_cpu, start_rss = token
+        self.record_phase(name, time.perf_counter() - start_wall, cpu_time() - start_cpu, start_rss)
+
+
+    def record_phase(self, name, wall_time, cpu_time=0.0, start_rss_kb=None):
+        """
+        Adds an externally measured duration (e.g. parsing before the solver existed) to the given phase;
+        start_rss_kb is the resident set size when the phase started (its change isn't recorded if None).
+        """
+        if not self.enabled:
+            return
+        phase = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'count': 0, 'rss_kb': 0, 'rss_delta_kb': 0})
+        rss_kb = current_rss_kb()
+        phase['wall'] += wall_time
+        phase['cpu'] += cpu_time
+        phase['count'] += 1
+        phase['rss_kb'] = max(phase['rss_kb'], rss_kb)
+        if start_rss_kb is not None:
+            phase['rss_delta_kb'] += rss_kb - start_rss_kb
+
+
+    def set(self, name, value):
+        if self.enabled:
+            self.counters[name] = value
+
+
+    def add(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def reset(self):
+        self.phases = OrderedDict()
+        self.counters = {}
+
+
+    def to_dict(self):
+        return {'solver': self.solver_name, 'phases': dict(self.phases), 'counters': dict(self.counters)}
+
+
+    def publish(self):
+        """Sends the metrics to every sink."""
+        if not self.enabled:
+            return
+        for sink in self.sinks:
+            sink.emit(self)
+
+
+    def __str__(self):
+        lines = ['{0} metrics:'.format(self.solver_name)]
+        for name, phase in self.phases.items():
+            lines.append('\t{0}: {1:.4f} s wall, {2:.4f} s CPU, RSS {3} kB ({4:+d} kB)'.format(
+                name, phase['wall'], phase['cpu'], phase['rss_kb'], phase['rss_delta_kb']))
+        for name in sorted(self.counters):
+            lines.append('\t{0} = {1}'.format(name, self.counters[name]))
+        return '\n'.join(lines)
+
+
+class _Phase(object):
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+
+    def __enter__(self):
+        self.start_wall = time.perf_counter()
+        self.start_cpu = cpu_time()
+        self.start_rss = current_rss_kb()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.record_phase(self.name, time.perf_counter() - self.start_wall, cpu_time() - self.start_cpu,
+                                  self.start_rss)
+        return False
+
+
+class _NullPhase(object):
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class MetricsSink(ABC):
+    """Destination for published SolverMetrics."""
+    @abstractmethod
+    def emit(self, metrics):
+        pass
+
+
+class LoggingSink(MetricsSink):
+    """Logs the metrics in readable form."""
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger('officeScheduler.metrics')
+        self.level = level
+
+
+    def emit(self, metrics):
+        self.logger.log(self.level, '%s', metrics)
+
+
+class JsonSink(MetricsSink):
+    """Appends the metrics as one JSON line per solve to a file."""
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+
+    def emit(self, metrics):
+        record = metrics.to_dict()
+        record['timestamp'] = time.time()
+        with open(self.filepath, 'a') as metricsFile:
+            metricsFile.write(json.dumps(record) + '\n')
+
+
+class PrometheusSink(MetricsSink):
+    """
+    Renders the metrics in the Prometheus text exposition format.
+    If filepath is given, the text is written there (atomically, for the
+    node exporter's textfile collector); it is also kept in the text field.
+    """
+    def __init__(self, filepath=None, prefix='office_scheduler'):
+        self.filepath = filepath
+        self.prefix = prefix
+        self.text = ''
+
+
+    def emit(self, metrics):
+        solver = _escape_label(metrics.solver_name)
+        lines = ['# TYPE {0}_phase_wall_seconds gauge'.format(self.prefix)]
+        for name, phase in metrics.phases.items():
+            lines.append('{0}_phase_wall_seconds{{solver="{1}",phase="{2}"}} {3}'.format(
+                self.prefix, solver, _escape_label(name), phase['wall']))
+        lines.append('# TYPE {0}_phase_cpu_seconds gauge'.format(self.prefix))
+        for name, phase in metrics.phases.items():
+            lines.append('{0}_phase_cpu_seconds{{solver="{1}",phase="{2}"}} {3}'.format(
+                self.prefix, solver, _escape_label(name), phase['cpu']))
+        lines.append('# TYPE {0}_phase_rss_bytes gauge'.format(self.prefix))
+        for name, phase in metrics.phases.items():
+            lines.append('{0}_phase_rss_bytes{{solver="{1}",phase="{2}"}} {3}'.format(
+                self.prefix, solver, _escape_label(name), phase['rss_kb'] * 1024))
+        lines.append('# TYPE {0}_phase_rss_delta_bytes gauge'.format(self.prefix))
+        for name, phase in metrics.phases.items():
+            lines.append('{0}_phase_rss_delta_bytes{{solver="{1}",phase="{2}"}} {3}'.format(
+                self.prefix, solver, _escape_label(name), phase['rss_delta_kb'] * 1024))
+        for name in sorted(metrics.counters):
+            metric_name = '{0}_{1}'.format(self.prefix, re.sub('[^a-zA-Z0-9_]', '_', name))
+            lines.append('# TYPE {0} gauge'.format(metric_name))
+            lines.append('{0}{{solver="{1}"}} {2}'.format(metric_name, solver, float(metrics.counters[name])))
+        self.text = '\n'.join(lines) + '\n'
+
+        if self.filepath is not None:
+            temp_filepath = '{0}.{1}.tmp'.format(self.filepath, os.getpid())
+            with open(temp_filepath, 'w') as metricsFile:
+                metricsFile.write(self.text)
+            os.replace(temp_filepath, self.filepath)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,166 @@
+# On-disk cache of built scheduling models, shared across runs and processes
+import copy
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+
+from ortools.linear_solver import linear_solver_pb2, pywraplp
+
+from officeScheduler.ortools_utils import build_scheduling_ilp
+from officeScheduler.private_files import (check_private_directory, is_private_file, make_private_directory,
+                                           UnsafeCacheDirectoryError)
+from officeScheduler.pulp_utils import build_scheduling_lp
+from officeScheduler.solution_cache import instance_key
+
+# Bump when the model builders change, so stale artifacts aren't loaded
+MODEL_FORMAT_VERSION = 1
+
+# Per-user default, since cached models are unpickled and must not be writable by anyone else
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'officeScheduler_models_{0}'.format(os.getuid()))
+
+
+def model_key(num_days, people, set_constraints, backend, **options):
+    """
+    Returns a hex digest identifying a built model: the instance (see
+    solution_cache.instance_key()), the backend and the formulation options.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update('v{0}|{1}|{2}\n'.format(MODEL_FORMAT_VERSION, backend,
+                                          instance_key(num_days, people, set_constraints)).encode('utf8'))
+    for name in sorted(options):
+        digest.update('{0}={1}\n'.format(name, options[name]).encode('utf8'))
+    return digest.hexdigest()
+
+
+class ModelCache(object):
+    """
+    Cache of built models in a directory, one file per model key, shared by
+    every process that uses the same directory. OR-Tools models are stored as
+    serialized MPModelProtos (with the index of each named constraint, since
+    build_scheduling_ilp() leaves some rows unnamed) and loaded straight into a
+    new solver; PuLP models are stored as pickled LpProblems, which load faster
+    than PuLP can read MPS files. Files are written atomically, and a per-key
+    lock file makes concurrent processes wait for one build instead of
+    repeating it.
+
+    Builds work on copies of the set constraints, so the caller's up_bounds
+    are never normalized in place, hit or miss.
+
+    Since cached models are unpickled, the directory is created private 
+    (mode 0o700) and must be owned by the current user and not writable by 
+    anyone else (UnsafeCacheDirectoryError otherwise); model files owned 
+    by other users are ignored. 
+
+    Fields:
+        directory - directory holding the cached models
+        hits, misses - lookup counts of this process
+    """
+    def __init__(self, directory=None):
+        self.directory = directory if directory is not None else DEFAULT_DIRECTORY
+        make_private_directory(self.directory)
+        self.hits = 0
+        self.misses = 0
+
+
+    def ortools_model(self, num_days, people, set_constraints, synergy_formulation='aggregated', integer=True,
+                      builder=None, **options):
+        """
+        Returns (solver, variables, constraints) as build_scheduling_ilp() does, loading the
+        model from the cache if possible. builder, if given, replaces build_scheduling_ilp()
+        (called with num_days, people and a copy of set_constraints); any extra keyword
+        options that change what it builds must be passed so they are part of the key.
+        """
+        key = model_key(num_days, people, set_constraints, 'ortools', synergy_formulation=synergy_formulation,
+                        integer=integer, **options)
+
+        def build():
+            sets = [copy.copy(set_constraint) for set_constraint in set_constraints]
+            if builder is not None:
+                solver, variables, constraints = builder(num_days, people, sets)
+            else:
+                solver, variables, constraints = build_scheduling_ilp(num_days, people, sets, synergy_formulation, integer)
+            proto = linear_solver_pb2.MPModelProto()
+            solver.ExportModelToProto(proto)
+            artifact = {'integer': integer, 'model': proto.SerializeToString(),
+                        'constraints': {name: constraint.index() for name, constraint in constraints.items()}}
+            return artifact, (solver, variables, constraints)
+
+        artifact, model = self._load_or_build(key, 'ortools', build)
+        if model is not None:
+            return model
+
+        if artifact['integer']:
+            solver = pywraplp.Solver('office_scheduling_problem', pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
+        else:
+            solver = pywraplp.Solver('office_scheduling_problem', pywraplp.Solver.GLOP_LINEAR_PROGRAMMING)
+        error = solver.LoadModelFromProtoKeepNames(linear_solver_pb2.MPModelProto.FromString(artifact['model']))
+        if error:
+            raise ValueError('Cached model {0} could not be loaded: {1}'.format(key, error))
+        variables = {var.name(): var for var in solver.variables()}
+        rows = solver.constraints()
+        constraints = {name: rows[index] for name, index in artifact['constraints'].items()}
+        return solver, variables, constraints
+
+
+    def pulp_model(self, num_days, people, set_constraints, synergy_formulation='aggregated'):
+        """
+        Returns the LpProblem built by pulp_utils.build_scheduling_lp(), loading it from the cache if possible.
+        """
+        key = model_key(num_days, people, set_constraints, 'pulp', synergy_formulation=synergy_formulation)
+
+        def build():
+            sets = [copy.copy(set_constraint) for set_constraint in set_constraints]
+            problem = build_scheduling_lp(num_days, people, sets, synergy_formulation)
+            return problem, problem
+
+        artifact, problem = self._load_or_build(key, 'pulp', build)
+        return problem if problem is not None else artifact
+
+
+    def clear(self):
+        """Removes every cached model file."""
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.model') or filename.endswith('.lock'):
+                os.remove(os.path.join(self.directory, filename))
+
+
+    def _load_or_build(self, key, backend, build):
+        """
+        Returns (artifact, None) if the key's artifact could be loaded, or else
+        builds it while holding the key's lock, stores it and returns (artifact, model).
+        """
+        filepath = os.path.join(self.directory, '{0}.{1}.model'.format(key, backend))
+        artifact = self._read(filepath)
+        if artifact is not None:
+            self.hits += 1
+            return artifact, None
+
+        with open(filepath + '.lock', 'w') as lockFile:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+            try:
+                artifact = self._read(filepath) # Another process may have built it while we waited
+                if artifact is not None:
+                    self.hits += 1
+                    return artifact, None
+
+                self.misses += 1
+                artifact, model = build()
+                temp_filepath = '{0}.{1}.tmp'.format(filepath, os.getpid())
+                with open(temp_filepath, 'wb') as modelFile:
+                    pickle.dump(artifact, modelFile, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_filepath, filepath)
+                return artifact, model
+            finally:
+                fcntl.flock(lockFile, fcntl.LOCK_UN)
+
+
+    def _read(self, filepath):
+        try:
+            with open(filepath, 'rb') as modelFile:
+                if not is_private_file(modelFile):
+                    return None # Not written by this user's solvers: never unpickle it
+                return pickle.load(modelFile)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
@@ -0,0 +1,220 @@
+# Hierarchical solving: a day-level schedule refined into sub-day time blocks
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import math
+import os
+import time
+
+import numpy as np
+from ortools.linear_solver import pywraplp
+
+from officeScheduler.ortools_utils import ORTOOLS_SOLVER_STATUS_TO_OURS_MAP
+import officeScheduler.Parser as Parser
+from officeScheduler.problem_arrays import ProblemArrays
+from officeScheduler.rolling_horizon import solve_subhorizon
+from officeScheduler.Schedule import Schedule
+from officeScheduler.Solver import Solver, SolverStatus
+
+
+def refine_day(block_availability, dept_members, dept_low, dept_up, teams, min_blocks=1, max_blocks=None,
+               synergy_blocks=1, time_limit=-1, strict=True):
+    """
+    Solves the sub-day model of one day, for the people the day-level
+    schedule put in the office, maximizing the number of person-blocks:
+    each of them works between min_blocks and max_blocks (all, if None) of
+    their available blocks, every department's headcount stays within its
+    bounds in every block, and every team present that day overlaps on at
+    least synergy_blocks blocks. With strict False, the department lower
+    bounds and team overlaps are dropped (which always leaves a feasible model).
+
+    Arguments:
+        block_availability - people by blocks boolean matrix of the day's scheduled people
+        dept_members, teams - lists of index arrays (rows of block_availability) of each
+                              department's scheduled members and each present team's members
+        dept_low, dept_up - department bounds, in the order of dept_members
+
+    Returns the SolverStatus and the people by blocks 0/1 matrix (None unless a schedule was found).
+    """
+    num_people, num_blocks = block_availability.shape
+    max_blocks = num_blocks if max_blocks is None else max_blocks
+    solver = pywraplp.Solver('day_refinement', pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
+    if time_limit > 0:
+        solver.SetTimeLimit(int(time_limit * 1000))
+
+    z = [[solver.IntVar(0, int(block_availability[s, b]), '') for b in range(num_blocks)] for s in range(num_people)]
+    objective = solver.Objective()
+    for s in range(num_people):
+        constraint = solver.Constraint(min(min_blocks, int(block_availability[s].sum())), max_blocks)
+        for b in range(num_blocks):
+            objective.SetCoefficient(z[s][b], 1)
+            constraint.SetCoefficient(z[s][b], 1)
+    objective.SetMaximization()
+
+    for members, low, up in zip(dept_members, dept_low, dept_up):
+        if len(members) == 0:
+            continue
+        for b in range(num_blocks):
+            constraint = solver.Constraint(int(low) if strict else 0, int(up))
+            for s in members:
+                constraint.SetCoefficient(z[s][b], 1)
+
+    if strict:
+        for members in teams:
+            together = [solver.IntVar(0, 1, '') for b in range(num_blocks)]
+            overlap = solver.Constraint(min(synergy_blocks, num_blocks), num_blocks)
+            for b in range(num_blocks):
+                overlap.SetCoefficient(together[b], 1)
+                for s in members:
+                    link = solver.Constraint(0, 1) # together <= z for every member
+                    link.SetCoefficient(z[s][b], 1)
+                    link.SetCoefficient(together[b], -1)
+
+    status = ORTOOLS_SOLVER_STATUS_TO_OURS_MAP.get(solver.Solve(), SolverStatus.NOT_SOLVED)
+    if status not in [SolverStatus.OPTIMAL, SolverStatus.FEASIBLE]:
+        return status, None
+    return status, np.array([[round(var.solution_value()) for var in row] for row in z], dtype=int).reshape(num_people, num_blocks)
+
+
+def _refine_day_task(args, kwargs):
+    """Process body for one day's refinement: refine_day() strictly, then relaxed if that fails."""
+    status, z = refine_day(*args, **kwargs)
+    strict = True
+    if z is None:
+        kwargs = dict(kwargs, strict=False)
+        status, z = refine_day(*args, **kwargs)
+        strict = False
+    return status.value, z, strict
+
+
+class MultiResolutionSolver(Solver):
+    """
+    Builds shift-level schedules at roughly the cost of a day-level solve.
+    The day-level model is solved first (see rolling_horizon.solve_subhorizon()),
+    over the days on which each person has at least min_blocks available blocks;
+    then each day is refined into blocks_per_day time blocks by a small
+    independent model over that day's scheduled people (see refine_day()),
+    solved in parallel over num_workers processes. A day whose refinement is
+    infeasible (e.g. a department lower bound that no block can meet) is refined
+    without department lower bounds and team overlaps, and counted in relaxed_days.
+
+    The returned Schedule has num_days * blocks_per_day columns (day j's blocks
+    are columns j * blocks_per_day to (j + 1) * blocks_per_day - 1). Its status
+    is FEASIBLE when every day was refined with all of its constraints (the
+    day-level optimum is refined greedily, not certified), and NOT_SOLVED when
+    a day was relaxed or left unrefined: the schedule may then break them.
+
+    Fields:
+        blocks_per_day - number of time blocks per day
+        block_availability - people by days by blocks boolean array (None means every block of an available day)
+        min_blocks, max_blocks, synergy_blocks - per-day refinement parameters (see refine_day())
+        num_workers - processes refining days in parallel (None for one per CPU; 1 refines in this process)
+        day_assignments - people by days assignments of the day-level solve (None if it failed)
+        relaxed_days - 1-based days refined without department lower bounds and team overlaps
+    """
+    def __init__(self, people, set_constraints, time_limit=-1, blocks_per_day=8, block_availability=None, min_blocks=1,
+                 max_blocks=None, synergy_blocks=1, num_workers=None, synergy_formulation='aggregated'):
+        super(MultiResolutionSolver, self).__init__(people, set_constraints, time_limit)
+        self.num_days = len(people[0].dateList) if people else 0
+        self.blocks_per_day = blocks_per_day
+        self.block_availability = block_availability
+        self.min_blocks = min_blocks
+        self.max_blocks = max_blocks
+        self.synergy_blocks = synergy_blocks
+        self.num_workers = num_workers
+        self.synergy_formulation = synergy_formulation
+        self.arrays = ProblemArrays(self.num_days, people, set_constraints)
+        self.day_assignments = None
+        self.relaxed_days = []
+
+
+    def solve(self):
+        start_time = time.time()
+        arrays = self.arrays
+        block_availability = self.block_availability
+        if block_availability is None:
+            block_availability = np.repeat(arrays.availability[:, :, None], self.blocks_per_day, axis=2)
+        block_availability = block_availability & arrays.availability[:, :, None]
+        day_availability = block_availability.sum(axis=2) >= self.min_blocks
+
+        # Day level: half of the time limit
+        status, x = solve_subhorizon(self.people, self.set_constraints, day_availability, arrays.synergy_target,
+                                     self.time_limit / 2 if self.time_limit > 0 else -1, None,
+                                     self.synergy_formulation, self.metrics)
+        self.day_assignments = x
+        self.relaxed_days = []
+        if x is None:
+            self.status = status if status != SolverStatus.NOT_SOLVED or self.time_limit <= 0 else SolverStatus.OUT_OF_TIME
+            self.metrics.publish()
+            return Schedule(people=self.people)
+        self.metrics.set('day_objective', arrays.objective(x))
+
+        # Sub-day level: one independent model per day
+        num_workers = min(self.num_workers or os.cpu_count() or 1, max(self.num_days, 1))
+        day_time_limit = -1
+        if self.time_limit > 0:
+            remaining = max(self.time_limit - (time.time() - start_time), 0.001)
+            day_time_limit = remaining / math.ceil(self.num_days / num_workers)
+        present = arrays.synergy_present(x)
+        tasks = []
+        for j in range(self.num_days):
+            scheduled = np.flatnonzero(x[:, j])
+            position = {i: s for s, i in enumerate(scheduled)}
+            dept_members = [np.array([position[i] for i in members if i in position], dtype=int)
+                            for members in (np.flatnonzero(row) for row in arrays.dept_membership)]
+            teams = [np.array([position[i] for i in arrays.synergy_members[k]], dtype=int) for k in np.flatnonzero(present[:, j])]
+            args = (block_availability[scheduled, j], dept_members, arrays.dept_low, arrays.dept_up, teams)
+            kwargs = {'min_blocks': self.min_blocks, 'max_blocks': self.max_blocks,
+                      'synergy_blocks': self.synergy_blocks, 'time_limit': day_time_limit}
+            tasks.append((scheduled, args, kwargs))
+
+        with self.metrics.phase('refine'):
+            if num_workers <= 1:
+                results = [_refine_day_task(args, kwargs) for scheduled, args, kwargs in tasks]
+            else:
+                with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                    futures = [executor.submit(_refine_day_task, args, kwargs) for scheduled, args, kwargs in tasks]
+                    results = [future.result() for future in futures]
+
+        num_blocks = self.blocks_per_day
+        assignments = np.zeros((len(self.people), self.num_days * num_blocks), dtype=int)
+        unrefined_days = 0
+        for j, ((scheduled, args, kwargs), (status_value, z, strict)) in enumerate(zip(tasks, results)):
+            if z is None:
+                unrefined_days += 1 # Left empty: the day's sub-MIP hit its time limit without a schedule
+                continue
+            if not strict:
+                self.relaxed_days.append(j + 1)
+            assignments[scheduled, j * num_blocks:(j + 1) * num_blocks] = z
+
+        self.metrics.set('relaxed_days', len(self.relaxed_days))
+        self.metrics.set('unrefined_days', unrefined_days)
+        self.metrics.set('objective', int(assignments.sum()))
+        self.status = SolverStatus.FEASIBLE if unrefined_days == 0 and not self.relaxed_days else SolverStatus.NOT_SOLVED
+
+        with self.metrics.phase('extract'):
+            best_schedule = Schedule(people=self.people)
+            best_schedule.n = self.num_days * num_blocks
+            best_schedule.assignments = assignments
+
+        self.metrics.publish()
+        return best_schedule
+
+
+if __name__ == '__main__':
+    commandLineParser = argparse.ArgumentParser(description='Solves a scheduling instance by day, then refines each day into time blocks')
+    commandLineParser.add_argument('numdays', type=int, help="the total number of days to schedule for")
+    commandLineParser.add_argument('peopleFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the people being scheduled")
+    commandLineParser.add_argument('setFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the department and synergy constraints")
+    commandLineParser.add_argument('--blocks', type=int, default=8, help="time blocks per day")
+    commandLineParser.add_argument('--min-blocks', type=int, default=1, help="fewest blocks worked by each person in the office on a day")
+    commandLineParser.add_argument('--time-limit', type=float, default=-1, help="time limit in seconds")
+
+    args = commandLineParser.parse_args()
+    num_days, people, set_constraints = Parser.parseCSVs(n=args.numdays, peopleFile=args.peopleFile, setFile=args.setFile)
+
+    solver = MultiResolutionSolver(people, set_constraints, args.time_limit, args.blocks, min_blocks=args.min_blocks)
+    metrics = solver.enable_metrics()
+    schedule = solver.solve()
+    print('Status:', solver.status)
+    print('Relaxed days:', solver.relaxed_days)
+    print(metrics)
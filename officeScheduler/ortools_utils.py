@@ -16,15 +16,31 @@ ORTOOLS_SOLVER_STATUS_TO_OURS_MAP = {0: SolverStatus.OPTIMAL,
                                      3: SolverStatus.UNBOUNDED,
                                      6: SolverStatus.NOT_SOLVED}
 
-def build_scheduling_ilp(num_days, people, set_constraints):
+# See pulp_utils.SYNERGY_FORMULATIONS
+SYNERGY_FORMULATIONS = ('aggregated', 'disaggregated', 'lazy')
+
+def build_scheduling_ilp(num_days, people, set_constraints, synergy_formulation='aggregated', integer=True):
     """
     Given outputs of Parser.parseCSVs(), 
     constructs a Google OR-Tools Solver representing the scheduling problem.
     The objective is to maximize the number of person-days. 
+
+    The synergy_formulation argument selects how team presence is linked
+    to individual schedules (see SYNERGY_FORMULATIONS); 'lazy' builds the 
+    aggregated rows, to be strengthened with add_synergy_cuts(). 
+    If integer is False, builds the LP relaxation (solved with GLOP) instead. 
     """
-    solver = pywraplp.Solver('office_scheduling_problem', 
-                             # pywraplp.Solver.GLOP_LINEAR_PROGRAMMING)
-                             pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING) # Can use CBC to solve MIPs
+    if synergy_formulation not in SYNERGY_FORMULATIONS:
+        raise ValueError('Unknown synergy formulation \'{0}\'; expected one of {1}.'.format(synergy_formulation, SYNERGY_FORMULATIONS))
+
+    if integer:
+        solver = pywraplp.Solver('office_scheduling_problem', 
+                                 pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING) # Can use CBC to solve MIPs
+        new_var = solver.IntVar
+    else:
+        solver = pywraplp.Solver('office_scheduling_problem', 
+                                 pywraplp.Solver.GLOP_LINEAR_PROGRAMMING)
+        new_var = solver.NumVar
 
     # Find indices of 'synergy' set constraints
     synergy_indices = []
@@ -40,14 +56,14 @@ def build_scheduling_ilp(num_days, people, set_constraints):
     for person in people:
         for day in days:
             var_name = '{2}_{0}_{1}'.format(person.uid, day, SCHEDULE_VAR_PREFIX)
-            person_day_var = solver.IntVar(0, 1, var_name) # Change to IntVar to enforce integer
+            person_day_var = new_var(0, 1, var_name)
             variables[var_name] = person_day_var
 
     # Create relaxed decision variables Synergy_k_j indicating whether team k is all present on day j
     for sid in synergy_sets:
         for day in days:
             var_name = '{2}_{0}_{1}'.format(sid, day, SYNERGY_VAR_PREFIX)
-            synergy_day_var = solver.IntVar(0, 1, var_name) # Change to IntVar to enforce integer
+            synergy_day_var = new_var(0, 1, var_name)
             variables[var_name] = synergy_day_var
 
     # Add objective: sum of all Schedule_i_j variables
@@ -99,6 +115,11 @@ def build_scheduling_ilp(num_days, people, set_constraints):
                 synergy_day_var = variables[var_name]
                 constraint.SetCoefficient(synergy_day_var, 1)
 
+            if synergy_formulation == 'disaggregated':
+                add_synergy_cuts(solver, variables, constraints, 
+                                 [(set_constraint.sid, person_uid, day) for day in days for person_uid in set_constraint.personList])
+                continue
+
             # Add constraint to enforce all of set k showing up when y_{k,j} is 1
             for day in days:
                 constraint_name = 'Synergy_enforced_{0}_day_{1}'.format(set_constraint.sid, day)
@@ -124,6 +145,135 @@ def build_scheduling_ilp(num_days, people, set_constraints):
     return solver, variables, constraints
 
 
+def add_synergy_cuts(solver, variables, constraints, links):
+    """
+    Adds a disaggregated synergy row y_{k,j} <= x_{i,j} to the given solver 
+    for each (sid, person_uid, day) triple in links, skipping rows already present. 
+    Returns the number of rows added. 
+    """
+    num_added = 0
+    for sid, person_uid, day in links:
+        constraint_name = 'Synergy_link_{0}_{1}_day_{2}'.format(sid, person_uid, day)
+        if constraint_name in constraints:
+            continue
+
+        constraint = solver.Constraint(0, solver.infinity(), constraint_name)
+        constraint.SetCoefficient(variables['{2}_{0}_{1}'.format(person_uid, day, SCHEDULE_VAR_PREFIX)], 1)
+        constraint.SetCoefficient(variables['{2}_{0}_{1}'.format(sid, day, SYNERGY_VAR_PREFIX)], -1)
+        constraints[constraint_name] = constraint
+        num_added += 1
+
+    return num_added
+
+
+def find_violated_synergy_links(solution, set_constraints, num_days, tolerance=1e-6):
+    """
+    Given a dictionary of variable names to values (see extract_solution()),
+    returns the (sid, person_uid, day) triples whose disaggregated synergy row 
+    y_{k,j} <= x_{i,j} is violated. 
+    """
+    links = []
+    for set_constraint in set_constraints:
+        if set_constraint.constraintType.value != SetConstraintType.SYNERGY.value:
+            continue
+
+        for day in range(1, num_days + 1):
+            y_value = solution.get('{2}_{0}_{1}'.format(set_constraint.sid, day, SYNERGY_VAR_PREFIX), 0)
+            if y_value <= tolerance:
+                continue
+
+            for person_uid in set_constraint.personList:
+                x_value = solution.get('{2}_{0}_{1}'.format(person_uid, day, SCHEDULE_VAR_PREFIX), 0)
+                if x_value < y_value - tolerance:
+                    links.append((set_constraint.sid, person_uid, day))
+
+    return links
+
+
+def separate_synergy_cuts(num_days, people, set_constraints, max_rounds=10):
+    """
+    Runs a cutting-plane loop on the LP relaxation of the 'lazy' formulation:
+    solves it, adds the violated disaggregated synergy rows, and repeats 
+    until none are violated or max_rounds rounds have been done. 
+    Returns the list of (sid, person_uid, day) links that were added, 
+    to be passed to add_synergy_cuts() on the integer model. 
+    """
+    solver, variables, constraints = build_scheduling_ilp(num_days, people, set_constraints, 'lazy', integer=False)
+
+    added_links = []
+    for round_index in range(max_rounds):
+        if solver.Solve() != pywraplp.Solver.OPTIMAL:
+            break
+        links = find_violated_synergy_links(extract_solution(solver), set_constraints, num_days)
+        if not links:
+            break
+        add_synergy_cuts(solver, variables, constraints, links)
+        added_links += links
+
+    return added_links
+
+
+def build_scheduling_ilp_with_cuts(num_days, people, set_constraints, max_rounds=10):
+    """
+    Builds the integer model with the 'lazy' synergy formulation, 
+    adding only the disaggregated rows found by separate_synergy_cuts(). 
+    Returns the same triple as build_scheduling_ilp(). 
+    """
+    links = separate_synergy_cuts(num_days, people, set_constraints, max_rounds)
+    solver, variables, constraints = build_scheduling_ilp(num_days, people, set_constraints, 'lazy')
+    add_synergy_cuts(solver, variables, constraints, links)
+    return solver, variables, constraints
+
+
+def compare_synergy_formulations(num_days, people, set_constraints, time_limit=-1):
+    """
+    Benchmarks each synergy formulation on the given instance. 
+    For each one, solves the LP relaxation and the integer model, 
+    and reports the LP bound, the integer value, the relative LP bound gap
+    and the build/solve times (in seconds). 
+    Returns a dictionary mapping formulation names to dictionaries of results. 
+    """
+    results = {}
+    for synergy_formulation in SYNERGY_FORMULATIONS:
+        result = {}
+
+        start_time = time.time()
+        if synergy_formulation == 'lazy':
+            links = separate_synergy_cuts(num_days, people, set_constraints)
+            lp_solver, lp_variables, lp_constraints = build_scheduling_ilp(num_days, people, set_constraints, 'lazy', integer=False)
+            add_synergy_cuts(lp_solver, lp_variables, lp_constraints, links)
+            result['num_cuts'] = len(links)
+        else:
+            lp_solver, lp_variables, lp_constraints = build_scheduling_ilp(num_days, people, set_constraints, synergy_formulation, integer=False)
+        lp_solver.Solve()
+        result['lp_bound'] = lp_solver.Objective().Value()
+        result['lp_time'] = time.time() - start_time
+
+        start_time = time.time()
+        if synergy_formulation == 'lazy':
+            solver, variables, constraints = build_scheduling_ilp(num_days, people, set_constraints, 'lazy')
+            add_synergy_cuts(solver, variables, constraints, links)
+        else:
+            solver, variables, constraints = build_scheduling_ilp(num_days, people, set_constraints, synergy_formulation)
+        if time_limit > 0:
+            solver.SetTimeLimit(int(time_limit * 1000))
+        status = solver.Solve()
+        result['status'] = ORTOOLS_SOLVER_STATUS_TO_OURS_MAP.get(status, SolverStatus.NOT_SOLVED)
+        result['ilp_value'] = solver.Objective().Value()
+        result['ilp_time'] = time.time() - start_time
+        result['num_constraints'] = solver.NumConstraints()
+        result['nodes'] = solver.nodes()
+
+        if result['ilp_value'] > 0:
+            result['lp_gap'] = (result['lp_bound'] - result['ilp_value']) / result['ilp_value']
+        else:
+            result['lp_gap'] = float('inf')
+
+        results[synergy_formulation] = result
+
+    return results
+
+
 def solve_ilp(solver):
     """
     Calls the given ILP solver and returns the Google OR-Tools solver status code. 
@@ -179,6 +329,14 @@ if __name__ == '__main__':
     #     print('\t{0}'.format(constraint_name))
 
 
+    COMPARE_SYNERGY_FORMULATIONS = False
+    if COMPARE_SYNERGY_FORMULATIONS:
+        results = compare_synergy_formulations(num_days, people, set_constraints)
+        for synergy_formulation, result in results.items():
+            print('{0}: LP bound {1:.2f}, ILP value {2:.2f}, gap {3:.2%}, LP time {4:.4f} s, ILP time {5:.4f} s, {6} constraints'.format(
+                synergy_formulation, result['lp_bound'], result['ilp_value'], result['lp_gap'], 
+                result['lp_time'], result['ilp_time'], result['num_constraints']))
+
     RUN_TIME_EXPERIMENTS = True
     if RUN_TIME_EXPERIMENTS:
         num_runs = 100
@@ -211,4 +369,4 @@ if __name__ == '__main__':
     elif our_status == SolverStatus.INFEASIBLE:
         print('Infeasible, so will not try to verify solution.')
     else:
-        pass
\ No newline at end of file
+        pass
\ No newline at end of file
@@ -0,0 +1,231 @@
+# What-if sweeps over department bounds and synergy targets
+from collections import deque
+import copy
+import time
+
+import numpy as np
+
+from officeScheduler.ortools_utils import build_scheduling_ilp, ORTOOLS_SOLVER_STATUS_TO_OURS_MAP, SCHEDULE_VAR_PREFIX
+from officeScheduler.problem_arrays import ProblemArrays
+from officeScheduler.Schedule import Schedule
+from officeScheduler.Solver import SolverStatus
+
+
+class SweepResult(object):
+    """
+    Result of one point of a parametric sweep.
+
+    Fields:
+        changes - the dictionary of bound changes defining the point (see ParametricSweep.solve_point())
+        status - SolverStatus of the point
+        value - optimal (or best found) number of person-days; None if no schedule is known
+        schedule - a Schedule achieving value (None if no schedule is known)
+        elapsed - seconds spent on the point
+        pruned - True iff the point was settled from other points' results, without a solve
+    """
+    def __init__(self, changes, status, value=None, schedule=None, elapsed=0.0, pruned=False):
+        self.changes = changes
+        self.status = status
+        self.value = value
+        self.schedule = schedule
+        self.elapsed = elapsed
+        self.pruned = pruned
+
+
+    def __repr__(self):
+        return 'SweepResult(changes={0}, status={1}, value={2}, elapsed={3:.3f}, pruned={4})'.format(
+            self.changes, self.status, self.value, self.elapsed, self.pruned)
+
+
+class ParametricSweep(object):
+    """
+    Re-solves one base instance under many changes to the set constraint bounds,
+    reusing a single OR-Tools model whose bound rows are updated in place.
+
+    Each point is first compared with the points already solved. Loosening
+    bounds can only enlarge the feasible region, so a looser point's optimum
+    bounds the point from above and an infeasible looser point makes it
+    infeasible, while every earlier schedule that still satisfies the point's
+    bounds is a warm start. When the best warm start meets the upper bound, the
+    point is settled without a solve; otherwise the warm start is passed as a
+    hint and as a cutoff on the objective.
+
+    With max_history set, only the max_history most recent points are kept
+    for these comparisons, so a long-lived sweep (e.g. the daemon's) keeps
+    bounded memory and per-point cost; older points are simply forgotten.
+
+    Fields:
+        arrays - ProblemArrays of the base instance
+        time_limit - per-point time limit in seconds (-1 for none)
+        history - deque of (dept_low, dept_up, synergy_target, status, value, x) for the points
+                  solved or settled, oldest first (at most max_history of them; all if None)
+    """
+    def __init__(self, num_days, people, set_constraints, time_limit=-1, synergy_formulation='aggregated',
+                 max_history=None):
+        # build_scheduling_ilp() normalizes unbounded up_bounds in place, so work on copies
+        self.set_constraints = [copy.copy(set_constraint) for set_constraint in set_constraints]
+        self.people = people
+        self.num_days = num_days
+        self.time_limit = time_limit
+        self.arrays = ProblemArrays(num_days, people, self.set_constraints)
+        self.solver, self.variables, self.constraints = build_scheduling_ilp(num_days, people, self.set_constraints,
+                                                                             synergy_formulation)
+        if time_limit > 0:
+            self.solver.SetTimeLimit(int(time_limit * 1000))
+
+        self.schedule_vars = [self.variables['{0}_{1}_{2}'.format(SCHEDULE_VAR_PREFIX, uid, day)]
+                              for uid in self.arrays.uids for day in range(1, num_days + 1)]
+        self.cutoff = self.solver.Constraint(-self.solver.infinity(), self.solver.infinity(), 'Sweep_objective_cutoff')
+        for var in self.schedule_vars:
+            self.cutoff.SetCoefficient(var, 1)
+
+        self.history = deque(maxlen=max_history)
+
+
+    def run(self, grid):
+        """
+        Solves every point of grid (an iterable of change dictionaries) in order
+        and returns the list of SweepResults, i.e. the objective curve.
+        """
+        return [self.solve_point(changes) for changes in grid]
+
+
+    def solve_point(self, changes):
+        """
+        Solves the base instance with the given bound changes, a dictionary of
+        set ids to (low_bound, up_bound) pairs. None keeps the base value,
+        up_bound -1 means unbounded, and synergy sets only use low_bound (the target).
+        """
+        start_time = time.time()
+        dept_low, dept_up, synergy_target = self._point_bounds(changes)
+
+        if np.any(dept_low > dept_up) or np.any(synergy_target > self.num_days):
+            return self._record(changes, dept_low, dept_up, synergy_target, SolverStatus.INFEASIBLE,
+                                None, None, start_time, pruned=True)
+
+        upper_bound = np.inf
+        for low, up, target, status, value, x in self.history:
+            if np.all(low <= dept_low) and np.all(up >= dept_up) and np.all(target <= synergy_target):
+                # That point is at least as loose as this one
+                if status == SolverStatus.INFEASIBLE:
+                    return self._record(changes, dept_low, dept_up, synergy_target, SolverStatus.INFEASIBLE,
+                                        None, None, start_time, pruned=True)
+                if status == SolverStatus.OPTIMAL:
+                    upper_bound = min(upper_bound, value)
+
+        point_arrays = self._point_arrays(dept_low, dept_up, synergy_target)
+        warm_value = None
+        warm_x = None
+        for _, _, _, status, value, x in self.history:
+            if x is not None and (warm_value is None or value > warm_value) and point_arrays.is_feasible(x):
+                warm_value = value
+                warm_x = x
+
+        if warm_value is not None and warm_value >= upper_bound:
+            return self._record(changes, dept_low, dept_up, synergy_target, SolverStatus.OPTIMAL,
+                                warm_value, warm_x, start_time, pruned=True)
+
+        self._set_model_bounds(dept_low, dept_up, synergy_target)
+        if warm_x is not None:
+            self.cutoff.SetLb(warm_value)
+            self.solver.SetHint(self.schedule_vars, [float(v) for v in warm_x.flatten()])
+        else:
+            self.cutoff.SetLb(-self.solver.infinity())
+
+        status = ORTOOLS_SOLVER_STATUS_TO_OURS_MAP.get(self.solver.Solve(), SolverStatus.NOT_SOLVED)
+        value = None
+        x = None
+        if status in [SolverStatus.OPTIMAL, SolverStatus.FEASIBLE]:
+            x = np.array([round(var.solution_value()) for var in self.schedule_vars], dtype=int).reshape(self.arrays.shape)
+            value = self.arrays.objective(x)
+        elif warm_x is not None:
+            # Out of time without beating the warm start
+            status = SolverStatus.FEASIBLE
+            value = warm_value
+            x = warm_x
+
+        return self._record(changes, dept_low, dept_up, synergy_target, status, value, x, start_time)
+
+
+    def update_bounds(self, changes):
+        """
+        Permanently applies bound changes (in the form taken by solve_point()) to the base instance.
+        Points already solved keep their own bounds, so the history stays valid.
+        """
+        dept_low, dept_up, synergy_target = self._point_bounds(changes)
+        self.arrays.dept_low = dept_low
+        self.arrays.dept_up = dept_up
+        self.arrays.synergy_target = synergy_target
+
+
+    def update_availability(self, uid, day, available):
+        """
+        Changes whether the given person can work on the given (1-based) day, in the model
+        and the base instance. Losing availability only shrinks the feasible region, so the
+        history's bounds stay valid (and infeasible warm starts are skipped); gaining it
+        invalidates them, so the history is cleared.
+        """
+        i = self.arrays.uid_index[uid]
+        if bool(self.arrays.availability[i, day - 1]) == bool(available):
+            return
+        self.arrays.availability = self.arrays.availability.copy()
+        self.arrays.availability[i, day - 1] = bool(available)
+        var = self.variables['{0}_{1}_{2}'.format(SCHEDULE_VAR_PREFIX, uid, day)]
+        var.SetUb(1 if available else 0)
+        unavailable_row = self.constraints.get('{0}_can\'t_work_on_day_{1}.'.format(uid, day))
+        if unavailable_row is not None:
+            unavailable_row.SetUb(1 if available else 0)
+        if available:
+            self.history.clear()
+
+
+    def _point_bounds(self, changes):
+        dept_low = self.arrays.dept_low.copy()
+        dept_up = self.arrays.dept_up.copy()
+        synergy_target = self.arrays.synergy_target.copy()
+        for sid, (low_bound, up_bound) in changes.items():
+            if sid in self.arrays.dept_index:
+                d = self.arrays.dept_index[sid]
+                if low_bound is not None:
+                    dept_low[d] = low_bound
+                if up_bound is not None:
+                    dept_up[d] = up_bound if up_bound >= 0 else self.arrays.dept_membership[d].sum()
+            elif sid in self.arrays.synergy_index:
+                if low_bound is not None:
+                    synergy_target[self.arrays.synergy_index[sid]] = low_bound
+            else:
+                raise ValueError('Unknown set constraint id \'{0}\' in sweep point.'.format(sid))
+        return dept_low, dept_up, synergy_target
+
+
+    def _point_arrays(self, dept_low, dept_up, synergy_target):
+        point_arrays = copy.copy(self.arrays)
+        point_arrays.dept_low = dept_low
+        point_arrays.dept_up = dept_up
+        point_arrays.synergy_target = synergy_target
+        return point_arrays
+
+
+    def _set_model_bounds(self, dept_low, dept_up, synergy_target):
+        for d, sid in enumerate(self.arrays.dept_sids):
+            for day in range(1, self.num_days + 1):
+                self.constraints['{0}_bounds_day_{1}'.format(sid, day)].SetBounds(int(dept_low[d]), int(dept_up[d]))
+        for k, sid in enumerate(self.arrays.synergy_sids):
+            self.constraints['Synergy_bound_{0}'.format(sid)].SetLb(int(synergy_target[k]))
+
+
+    def _record(self, changes, dept_low, dept_up, synergy_target, status, value, x, start_time, pruned=False):
+        self.history.append((dept_low, dept_up, synergy_target, status, value, x))
+        schedule = None
+        if x is not None:
+            schedule = Schedule(people=self.people)
+            schedule.n = self.num_days
+            schedule.assignments = x.copy()
+        return SweepResult(changes, status, value, schedule, time.time() - start_time, pruned)
+
+
+def sweep_bounds(num_days, people, set_constraints, grid, time_limit=-1, synergy_formulation='aggregated'):
+    """
+    Convenience wrapper: runs a ParametricSweep over grid and returns the list of SweepResults.
+    """
+    return ParametricSweep(num_days, people, set_constraints, time_limit, synergy_formulation).run(grid)
@@ -0,0 +1,211 @@
+# Detection of periodic availability and solving by tiling a solved period
+import argparse
+import math
+import time
+
+import numpy as np
+
+import officeScheduler.Parser as Parser
+from officeScheduler.problem_arrays import ProblemArrays
+from officeScheduler.rolling_horizon import full_horizon_lp_bound, solve_subhorizon
+from officeScheduler.Schedule import Schedule
+from officeScheduler.Solver import Solver, SolverStatus
+
+
+def detect_period(availability, max_period=None, max_irregular_fraction=0.25):
+    """
+    Looks for the smallest period p (repeated at least twice) such that the
+    people by days boolean availability matrix is the repetition of a p-day
+    pattern, except on at most max_irregular_fraction of the days.
+    The pattern's column for each day of the period is the majority over the
+    days with that remainder; a day is irregular if its column differs from it.
+
+    Returns a tuple (p, pattern, irregular_days) with the people by p pattern
+    and the list of irregular 0-based days, or None if no period qualifies.
+    Department bounds are the same every day, so only availability needs to repeat.
+    """
+    num_days = availability.shape[1]
+    max_period = num_days // 2 if max_period is None else min(max_period, num_days // 2)
+    for period in range(1, max_period + 1):
+        pattern = np.stack([availability[:, r::period].mean(axis=1) >= 0.5 for r in range(period)], axis=1)
+        tiled = pattern[:, np.arange(num_days) % period]
+        irregular_days = [int(day) for day in np.flatnonzero(np.any(availability != tiled, axis=0))]
+        if len(irregular_days) <= max_irregular_fraction * num_days:
+            return period, pattern, irregular_days
+    return None
+
+
+class PeriodicSolver(Solver):
+    """
+    Solves instances whose availability repeats with a short period, such as a
+    weekly pattern over a quarter, without building the full-horizon model.
+
+    The p-day pattern found by detect_period() (the core) is solved once, with
+    each synergy target scaled down to the days it needs per period, and the
+    core schedule is tiled over every regular day. The irregular days (holidays,
+    one-off absences) are then re-optimized together, with the synergy days the
+    tiling doesn't provide as their targets. If no period is found, or the
+    irregular days can't make up the synergy days owed, the full horizon is
+    solved instead (hinted with the tiled schedule).
+
+    The result is compared with the full-horizon LP bound (see rolling_horizon).
+
+    Fields:
+        max_period - longest period tried (None for half the horizon)
+        max_irregular_fraction - largest fraction of irregular days allowed for a period
+        period - period detected by the last solve (None if none was found)
+        irregular_days - 1-based irregular days of the last solve
+        lp_bound - LP relaxation bound of the full horizon (None if it couldn't be solved)
+        gap - (lp_bound - value) / lp_bound of the returned schedule
+    """
+    def __init__(self, people, set_constraints, time_limit=-1, max_period=None, max_irregular_fraction=0.25,
+                 synergy_formulation='aggregated'):
+        super(PeriodicSolver, self).__init__(people, set_constraints, time_limit)
+        self.num_days = len(people[0].dateList) if people else 0
+        self.max_period = max_period
+        self.max_irregular_fraction = max_irregular_fraction
+        self.synergy_formulation = synergy_formulation
+        self.arrays = ProblemArrays(self.num_days, people, set_constraints)
+        self.period = None
+        self.irregular_days = []
+        self.lp_bound = None
+        self.gap = None
+        self._tiled_x = None
+
+
+    def solve(self):
+        start_time = time.time()
+        self.gap = None
+        self._tiled_x = None
+
+        with self.metrics.phase('presolve'):
+            self.lp_bound = full_horizon_lp_bound(self.num_days, self.people, self.set_constraints)
+            detected = None
+            if self.lp_bound is not None:
+                detected = detect_period(self.arrays.availability, self.max_period, self.max_irregular_fraction)
+        self.metrics.set('lp_bound', self.lp_bound)
+        if self.lp_bound is None:
+            self.status = SolverStatus.INFEASIBLE
+            self.metrics.publish()
+            return Schedule(people=self.people)
+
+        x = None
+        if detected is not None:
+            self.period, pattern, irregular_days = detected
+            self.irregular_days = [day + 1 for day in irregular_days]
+            self.metrics.set('period', self.period)
+            self.metrics.set('irregular_days', len(irregular_days))
+            x = self._solve_tiled(pattern, irregular_days, start_time)
+        else:
+            self.period = None
+            self.irregular_days = []
+
+        if x is None:
+            self.metrics.add('full_solves')
+            status, x = solve_subhorizon(self.people, self.set_constraints, self.arrays.availability,
+                                         self.arrays.synergy_target, self._remaining_time(start_time),
+                                         self._tiled_hint(), self.synergy_formulation, self.metrics)
+            self.status = status
+            if status == SolverStatus.NOT_SOLVED and self.time_limit > 0:
+                self.status = SolverStatus.OUT_OF_TIME
+        else:
+            self.status = SolverStatus.FEASIBLE
+
+        if x is None:
+            self.metrics.publish()
+            return Schedule(people=self.people)
+
+        value = self.arrays.objective(x)
+        self.gap = (self.lp_bound - value) / self.lp_bound if self.lp_bound > 0 else 0.0
+        if value >= math.floor(self.lp_bound + 1e-6):
+            self.status = SolverStatus.OPTIMAL
+        self.metrics.set('objective', value)
+        self.metrics.set('gap', self.gap)
+        self.report_progress(value, self.lp_bound)
+
+        with self.metrics.phase('extract'):
+            best_schedule = Schedule(people=self.people)
+            best_schedule.buildFromSolutionVariables(self.arrays.to_solution_dict(x))
+
+        self.metrics.publish()
+        return best_schedule
+
+
+    def _solve_tiled(self, pattern, irregular_days, start_time):
+        """
+        Solves the core pattern, tiles it over the regular days and re-optimizes
+        the irregular days. Returns the assignments matrix, or None if the
+        full horizon must be solved instead.
+        """
+        period = pattern.shape[1]
+        regular = np.ones(self.num_days, dtype=bool)
+        regular[irregular_days] = False
+        # Regular days of each day of the period; the scarcest one limits what the core provides
+        repetitions = np.bincount(np.flatnonzero(regular) % period, minlength=period)
+        min_repetitions = max(int(repetitions.min()), 1)
+        core_target = np.minimum(-(-self.arrays.synergy_target // min_repetitions), period)
+
+        self.metrics.add('core_solves')
+        status, core_x = solve_subhorizon(self.people, self.set_constraints, pattern, core_target,
+                                          self._remaining_time(start_time), None, self.synergy_formulation, self.metrics)
+        if core_x is None:
+            # Leave every synergy day to the irregular days (or the full solve)
+            self.metrics.add('core_solves')
+            status, core_x = solve_subhorizon(self.people, self.set_constraints, pattern, np.zeros_like(core_target),
+                                              self._remaining_time(start_time), None, self.synergy_formulation, self.metrics)
+            if core_x is None:
+                return None
+
+        x = np.zeros(self.arrays.shape, dtype=int)
+        x[:, regular] = core_x[:, np.flatnonzero(regular) % period]
+        self._tiled_x = x
+
+        owed = np.maximum(self.arrays.synergy_target - self.arrays.synergy_present(x).sum(axis=1), 0)
+        if irregular_days:
+            self.metrics.add('irregular_solves')
+            status, irregular_x = solve_subhorizon(self.people, self.set_constraints,
+                                                   self.arrays.availability[:, irregular_days], owed,
+                                                   self._remaining_time(start_time), None,
+                                                   self.synergy_formulation, self.metrics)
+            if irregular_x is None:
+                return None
+            x[:, irregular_days] = irregular_x
+        elif np.any(owed > 0):
+            return None
+
+        return x if self.arrays.is_feasible(x) else None
+
+
+    def _tiled_hint(self):
+        """Returns the tiled regular days of the last solve as a hint matrix (-1 elsewhere), or None."""
+        if self._tiled_x is None:
+            return None
+        hint = self._tiled_x.copy()
+        hint[:, [day - 1 for day in self.irregular_days]] = -1
+        return hint
+
+
+    def _remaining_time(self, start_time):
+        if self.time_limit <= 0:
+            return -1
+        return max(self.time_limit - (time.time() - start_time), 0.001)
+
+
+if __name__ == '__main__':
+    commandLineParser = argparse.ArgumentParser(description='Solves a scheduling instance with periodic availability by tiling one period')
+    commandLineParser.add_argument('numdays', type=int, help="the total number of days to schedule for")
+    commandLineParser.add_argument('peopleFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the people being scheduled")
+    commandLineParser.add_argument('setFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the department and synergy constraints")
+    commandLineParser.add_argument('--max-period', type=int, default=None, help="longest period to try")
+    commandLineParser.add_argument('--time-limit', type=float, default=-1, help="time limit in seconds")
+
+    args = commandLineParser.parse_args()
+    num_days, people, set_constraints = Parser.parseCSVs(n=args.numdays, peopleFile=args.peopleFile, setFile=args.setFile)
+
+    solver = PeriodicSolver(people, set_constraints, args.time_limit, args.max_period)
+    metrics = solver.enable_metrics()
+    schedule = solver.solve()
+    print('Status:', solver.status)
+    print('Period: {0}, irregular days: {1}'.format(solver.period, solver.irregular_days))
+    print('LP bound: {0}, gap: {1}'.format(solver.lp_bound, solver.gap))
+    print(metrics)
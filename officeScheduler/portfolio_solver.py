@@ -0,0 +1,213 @@
+# Solver that races several solver backends on the same instance
+import json
+from multiprocessing import Process, Queue
+import os
+import queue
+import signal
+import time
+
+import numpy as np
+
+from officeScheduler.direct_ilp_solver import DirectILPSolver
+from officeScheduler.OldSolver import PulpSolver
+from officeScheduler.Schedule import Schedule
+from officeScheduler.simple_bnb_solver import SimpleBnbSolver
+from officeScheduler.Solver import Solver, SolverStatus
+
+# Statuses that settle the instance, so the other engines can be cancelled
+CERTIFIED_STATUSES = [SolverStatus.OPTIMAL, SolverStatus.INFEASIBLE, SolverStatus.UNBOUNDED]
+
+CANCEL_POLL_INTERVAL = 0.1 # seconds between checks for cancellation
+
+# Default engines: (name, Solver subclass, extra constructor keyword arguments)
+DEFAULT_ENGINES = [('pulp', PulpSolver, {}),
+                   ('ortools', DirectILPSolver, {}),
+                   ('bnb', SimpleBnbSolver, {})]
+
+
+class PortfolioSolver(Solver):
+    """
+    Runs several configured solver engines concurrently, one process each,
+    on the same instance. Returns the first certified result (optimal,
+    infeasible or unbounded), or the best feasible schedule reported by
+    the deadline, and terminates the remaining engines.
+
+    Fields:
+        engines - list of (name, Solver subclass, keyword arguments) triples
+        statistics - PortfolioStatistics recording which engines win
+        winner - name of the engine whose result was returned (None if no engine reported one)
+        results - dictionary of engine names to (status, objective value, elapsed seconds)
+                  for every engine that reported before the portfolio stopped
+    """
+    def __init__(self, people, set_constraints, time_limit=-1, engines=None, statistics=None, grace_period=2.0):
+        super(PortfolioSolver, self).__init__(people, set_constraints, time_limit)
+        self.engines = engines if engines is not None else DEFAULT_ENGINES
+        self.statistics = statistics if statistics is not None else PortfolioStatistics()
+        self.grace_period = grace_period # Extra seconds allowed for engines to report after the time limit
+        self.winner = None
+        self.results = {}
+
+
+    def solve(self):
+        start_time = time.time()
+        phase = self.metrics.start_phase('solve')
+        results_queue = Queue()
+        processes = {}
+        for name, solver_class, kwargs in self.engines:
+            process = Process(target=_run_engine,
+                              args=(name, solver_class, kwargs, self.people, self.set_constraints, self.time_limit, results_queue))
+            process.start()
+            processes[name] = process
+
+        deadline = None
+        if self.time_limit > 0:
+            deadline = start_time + self.time_limit + self.grace_period
+
+        best = None # (status, value, assignments, name)
+        while len(self.results) < len(processes):
+            if self.is_cancelled():
+                break
+            timeout = CANCEL_POLL_INTERVAL if deadline is None else min(deadline - time.time(), CANCEL_POLL_INTERVAL)
+            if timeout <= 0:
+                break
+            try:
+                name, status, value, assignments, elapsed = results_queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+            self.results[name] = (status, value, elapsed)
+            if status in CERTIFIED_STATUSES:
+                best = (status, value, assignments, name)
+                break
+            if status == SolverStatus.FEASIBLE and assignments is not None and (best is None or value > best[1]):
+                best = (status, value, assignments, name)
+                self.report_progress(value)
+
+        # Cancel the engines that haven't finished
+        for process in processes.values():
+            if process.is_alive():
+                _terminate_engine(process)
+            process.join(timeout=1)
+
+        self.metrics.end_phase(phase)
+        for name, (status, value, elapsed) in self.results.items():
+            self.metrics.set('engine_{0}_time'.format(name), elapsed)
+
+        elapsed_time = time.time() - start_time
+        if best is None:
+            self.status = SolverStatus.OUT_OF_TIME if len(self.results) < len(processes) else SolverStatus.NOT_SOLVED
+            self.statistics.record(None, [name for name, _, _ in self.engines], elapsed_time)
+            self.metrics.publish()
+            return None
+
+        self.status, value, assignments, self.winner = best
+        self.statistics.record(self.winner, [name for name, _, _ in self.engines], elapsed_time)
+        if assignments is None:
+            self.metrics.publish()
+            return None
+
+        self.metrics.set('objective', value)
+        with self.metrics.phase('extract'):
+            self.solution = Schedule(people=self.people)
+            self.solution.n = assignments.shape[1]
+            self.solution.assignments = assignments
+        self.metrics.publish()
+        return self.solution
+
+
+def _run_engine(name, solver_class, kwargs, people, set_constraints, time_limit, results_queue):
+    """
+    Process body for one portfolio engine: solves the instance and sends
+    (name, status, objective value, assignments, elapsed seconds) to results_queue.
+    """
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp() # Own process group, so cancelling also stops any CBC process the engine starts
+
+    start_time = time.time()
+    try:
+        solver = solver_class(people, set_constraints, time_limit, **kwargs)
+        schedule = solver.solve()
+        status = solver.status
+    except Exception as e:
+        print('Portfolio engine {0} failed: {1}'.format(name, e))
+        results_queue.put((name, SolverStatus.NOT_SOLVED, None, None, time.time() - start_time))
+        return
+
+    assignments = None
+    value = None
+    if schedule is not None and schedule.assignments is not None and status in [SolverStatus.OPTIMAL, SolverStatus.FEASIBLE]:
+        assignments = np.asarray(schedule.assignments)
+        value = float(np.sum(assignments))
+    results_queue.put((name, status, value, assignments, time.time() - start_time))
+
+
+def _terminate_engine(process):
+    """
+    Terminates an engine process together with every process it started.
+    """
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            return
+        except OSError:
+            pass # Process group not created yet
+    process.terminate()
+
+
+class PortfolioStatistics(object):
+    """
+    Per-engine win statistics for PortfolioSolver runs,
+    optionally persisted as JSON so they accumulate across runs.
+
+    Fields:
+        path - JSON file the statistics are loaded from and saved to (None to keep them in memory)
+        engines - dictionary of engine names to dictionaries with 'runs' and 'wins' counts
+        runs - total number of portfolio runs
+        no_result_runs - number of runs in which no engine reported a usable result
+        total_time - total elapsed seconds over all runs
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.engines = {}
+        self.runs = 0
+        self.no_result_runs = 0
+        self.total_time = 0.0
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as statisticsFile:
+                data = json.load(statisticsFile)
+            self.engines = data.get('engines', {})
+            self.runs = data.get('runs', 0)
+            self.no_result_runs = data.get('no_result_runs', 0)
+            self.total_time = data.get('total_time', 0.0)
+
+
+    def record(self, winner, engine_names, elapsed_time):
+        """
+        Records one portfolio run among the given engines, won by winner (None if no result).
+        """
+        self.runs += 1
+        self.total_time += elapsed_time
+        for name in engine_names:
+            counts = self.engines.setdefault(name, {'runs': 0, 'wins': 0})
+            counts['runs'] += 1
+            if name == winner:
+                counts['wins'] += 1
+        if winner is None:
+            self.no_result_runs += 1
+
+        if self.path is not None:
+            self.save()
+
+
+    def win_rate(self, name):
+        """Returns the fraction of runs including the given engine that it won."""
+        counts = self.engines.get(name)
+        if not counts or counts['runs'] == 0:
+            return 0.0
+        return counts['wins'] / counts['runs']
+
+
+    def save(self):
+        with open(self.path, 'w') as statisticsFile:
+            json.dump({'engines': self.engines, 'runs': self.runs, 'no_result_runs': self.no_result_runs,
+                       'total_time': self.total_time}, statisticsFile, indent=2)
@@ -0,0 +1,44 @@
+# Checks for directories of files that get unpickled, which must not be writable by other users
+import os
+import stat
+
+
+class UnsafeCacheDirectoryError(Exception):
+    """
+    Raised when a cache directory could be written by other users,
+    who could then plant files that run code when they are unpickled.
+
+    Fields:
+        message - explanation of the error
+        directory - the offending directory
+    """
+    def __init__(self, message, directory=None):
+        super(UnsafeCacheDirectoryError, self).__init__(message)
+        self.message = message
+        self.directory = directory
+
+
+def check_private_directory(directory):
+    """
+    Raises UnsafeCacheDirectoryError unless directory is a real directory
+    (not a symlink) owned by the current user and not writable by its group or others.
+    """
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+        raise UnsafeCacheDirectoryError('Cache {0} is not a directory.'.format(directory), directory)
+    if info.st_uid != os.getuid():
+        raise UnsafeCacheDirectoryError('Cache {0} is owned by another user.'.format(directory), directory)
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise UnsafeCacheDirectoryError('Cache {0} is writable by other users.'.format(directory), directory)
+
+
+def make_private_directory(directory):
+    """Creates directory (mode 0o700) if it doesn't exist, then checks it with check_private_directory()."""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    check_private_directory(directory)
+
+
+def is_private_file(openFile):
+    """Returns True iff the open file is owned by the current user and not writable by its group or others."""
+    info = os.fstat(openFile.fileno())
+    return info.st_uid == os.getuid() and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
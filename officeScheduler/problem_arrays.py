@@ -0,0 +1,149 @@
+# Dense NumPy representation of an office scheduling instance
+import numpy as np
+
+from officeScheduler.PeopleAndSets import SetConstraintType
+
+SCHEDULE_VAR_PREFIX = 'Schedule'
+SYNERGY_VAR_PREFIX = 'Synergy'
+
+
+class ProblemArrays(object):
+    """
+    Array form of the scheduling problem built from the outputs of Parser.parseCSVs().
+    Lets heuristics and other components evaluate candidate schedules
+    without going through a PuLP or OR-Tools model.
+
+    Fields:
+        num_days - the number of days in the schedule
+        uids - list of person uids, in the row order of every person-indexed array
+        availability - len(uids) by num_days boolean array; True iff person i can work on day j
+        dept_sids - list of department set ids
+        dept_membership - len(dept_sids) by len(uids) 0/1 array
+        dept_low - per-department lower bound on daily attendance
+        dept_up - per-department upper bound on daily attendance (department size if unbounded)
+        synergy_sids - list of synergy set ids
+        synergy_membership - len(synergy_sids) by len(uids) 0/1 array
+        synergy_size - number of members of each synergy set
+        synergy_target - minimum number of days each synergy set must be all present
+    """
+    def __init__(self, num_days, people, set_constraints):
+        self.num_days = num_days
+        self.uids = [person.uid for person in people]
+        self.uid_index = {uid: i for i, uid in enumerate(self.uids)}
+
+        self.availability = np.zeros((len(people), num_days), dtype=bool)
+        for i, person in enumerate(people):
+            self.availability[i, :] = [bool(available) for available in person.dateList[:num_days]]
+
+        departments = [s for s in set_constraints if s.constraintType.value == SetConstraintType.DEPARTMENT.value]
+        synergies = [s for s in set_constraints if s.constraintType.value == SetConstraintType.SYNERGY.value]
+
+        self.dept_sids = [s.sid for s in departments]
+        self.dept_index = {sid: d for d, sid in enumerate(self.dept_sids)}
+        self.dept_membership = self._membership_matrix(departments)
+        self.dept_low = np.array([s.low_bound for s in departments], dtype=int)
+        self.dept_up = np.array([s.up_bound if s.up_bound >= 0 else len(s.personList) for s in departments], dtype=int)
+
+        self.synergy_sids = [s.sid for s in synergies]
+        self.synergy_index = {sid: k for k, sid in enumerate(self.synergy_sids)}
+        self.synergy_membership = self._membership_matrix(synergies)
+        self.synergy_size = self.synergy_membership.sum(axis=1)
+        self.synergy_target = np.array([s.low_bound for s in synergies], dtype=int)
+
+        # Department and synergy row indices for each person, for cheap per-person updates
+        self.person_depts = [np.flatnonzero(self.dept_membership[:, i]) for i in range(len(self.uids))]
+        self.synergy_members = [np.flatnonzero(row) for row in self.synergy_membership]
+
+
+    def _membership_matrix(self, set_constraints):
+        membership = np.zeros((len(set_constraints), len(self.uids)), dtype=int)
+        for k, set_constraint in enumerate(set_constraints):
+            for person_uid in set_constraint.personList:
+                membership[k, self.uid_index[person_uid]] = 1
+        return membership
+
+
+    @property
+    def shape(self):
+        """Shape (number of people, number of days) of an assignments matrix."""
+        return self.availability.shape
+
+
+    def dept_loads(self, x):
+        """Returns the len(dept_sids) by num_days matrix of daily department attendance."""
+        return self.dept_membership @ x
+
+
+    def synergy_present(self, x):
+        """Returns a len(synergy_sids) by num_days boolean matrix; True iff team k is all present on day j."""
+        return (self.synergy_membership @ x) >= self.synergy_size[:, None]
+
+
+    def violations(self, x):
+        """
+        Returns the total amount by which the 0/1 assignments matrix x
+        violates availability, department bounds and synergy targets.
+        """
+        x = np.asarray(x, dtype=int)
+        total = int(np.sum(x * ~self.availability))
+
+        loads = self.dept_loads(x)
+        total += int(np.sum(np.maximum(loads - self.dept_up[:, None], 0)))
+        total += int(np.sum(np.maximum(self.dept_low[:, None] - loads, 0)))
+
+        synergy_days = self.synergy_present(x).sum(axis=1)
+        total += int(np.sum(np.maximum(self.synergy_target - synergy_days, 0)))
+        return total
+
+
+    def is_feasible(self, x):
+        """Returns True iff the 0/1 assignments matrix x satisfies every constraint."""
+        return self.violations(x) == 0
+
+
+    def objective(self, x):
+        """Returns the number of person-days scheduled by x."""
+        return int(np.sum(x))
+
+
+    def to_solution_dict(self, x):
+        """
+        Converts a 0/1 assignments matrix into a dictionary of variable names to values,
+        using the same names as pulp_utils and ortools_utils
+        (so it can be passed to Schedule.buildFromSolutionVariables()).
+        """
+        solution = {}
+        for i, uid in enumerate(self.uids):
+            for day in range(1, self.num_days + 1):
+                solution['{0}_{1}_{2}'.format(SCHEDULE_VAR_PREFIX, uid, day)] = float(x[i, day - 1])
+
+        present = self.synergy_present(x)
+        for k, sid in enumerate(self.synergy_sids):
+            for day in range(1, self.num_days + 1):
+                solution['{0}_{1}_{2}'.format(SYNERGY_VAR_PREFIX, sid, day)] = float(present[k, day - 1])
+
+        return solution
+
+
+    def from_solution_dict(self, solution):
+        """
+        Converts a dictionary of variable names to (possibly fractional) values
+        into a pair (x, y) of arrays: x holds the Schedule variables (people by days),
+        y holds the Synergy variables (synergy sets by days).
+        Variables missing from the dictionary are left at 0.
+        """
+        x = np.zeros(self.shape)
+        y = np.zeros((len(self.synergy_sids), self.num_days))
+        for i, uid in enumerate(self.uids):
+            for day in range(1, self.num_days + 1):
+                value = solution.get('{0}_{1}_{2}'.format(SCHEDULE_VAR_PREFIX, uid, day))
+                if value is not None:
+                    x[i, day - 1] = value
+
+        for k, sid in enumerate(self.synergy_sids):
+            for day in range(1, self.num_days + 1):
+                value = solution.get('{0}_{1}_{2}'.format(SYNERGY_VAR_PREFIX, sid, day))
+                if value is not None:
+                    y[k, day - 1] = value
+
+        return x, y
@@ -0,0 +1,213 @@
+# Node-level domain propagation for branch and bound
+import hashlib
+import numpy as np
+
+from officeScheduler.problem_arrays import SCHEDULE_VAR_PREFIX, SYNERGY_VAR_PREFIX
+
+
+class NodeDomain(object):
+    """
+    The variable bounds and department attendance intervals in effect at a
+    branch and bound node, with propagation of the department and synergy
+    constraints to a fixpoint.
+
+    Fields:
+        arrays - the ProblemArrays instance being solved
+        x_low, x_up - people by days 0/1 arrays of bounds on the Schedule variables
+        y_low, y_up - synergy sets by days 0/1 arrays of bounds on the Synergy variables
+        dept_low, dept_up - departments by days arrays of attendance intervals
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.x_low = np.zeros(arrays.shape, dtype=np.int8)
+        self.x_up = arrays.availability.astype(np.int8)
+        self.y_low = np.zeros((len(arrays.synergy_sids), arrays.num_days), dtype=np.int8)
+        self.y_up = np.ones((len(arrays.synergy_sids), arrays.num_days), dtype=np.int8)
+        self.dept_low = np.repeat(arrays.dept_low[:, None], arrays.num_days, axis=1)
+        self.dept_up = np.repeat(arrays.dept_up[:, None], arrays.num_days, axis=1)
+
+
+    def copy(self):
+        domain = NodeDomain.__new__(NodeDomain)
+        domain.arrays = self.arrays
+        for field in ['x_low', 'x_up', 'y_low', 'y_up', 'dept_low', 'dept_up']:
+            setattr(domain, field, getattr(self, field).copy())
+        return domain
+
+
+    def bounds(self):
+        """Returns the tuple of bound arrays that defines this domain (see from_bounds())."""
+        return (self.x_low, self.x_up, self.y_low, self.y_up, self.dept_low, self.dept_up)
+
+
+    @staticmethod
+    def from_bounds(arrays, bounds):
+        """Rebuilds a domain over the given ProblemArrays from the tuple returned by bounds()."""
+        domain = NodeDomain.__new__(NodeDomain)
+        domain.arrays = arrays
+        domain.x_low, domain.x_up, domain.y_low, domain.y_up, domain.dept_low, domain.dept_up = [field.copy() for field in bounds]
+        return domain
+
+
+    def fix_person_day(self, uid, day, value):
+        """Fixes the Schedule variable of the given person on the given (1-based) day."""
+        i = self.arrays.uid_index[uid]
+        self.x_low[i, day - 1] = max(self.x_low[i, day - 1], value)
+        self.x_up[i, day - 1] = min(self.x_up[i, day - 1], value)
+
+
+    def fix_synergy_day(self, sid, day, value):
+        """Fixes the Synergy variable of the given team on the given (1-based) day."""
+        k = self.arrays.synergy_index[sid]
+        self.y_low[k, day - 1] = max(self.y_low[k, day - 1], value)
+        self.y_up[k, day - 1] = min(self.y_up[k, day - 1], value)
+
+
+    def restrict_dept_day(self, sid, day, low=None, up=None):
+        """Intersects the attendance interval of the given department on the given (1-based) day with [low, up]."""
+        d = self.arrays.dept_index[sid]
+        if low is not None:
+            self.dept_low[d, day - 1] = max(self.dept_low[d, day - 1], low)
+        if up is not None:
+            self.dept_up[d, day - 1] = min(self.dept_up[d, day - 1], up)
+
+
+    def propagate(self, max_rounds=100):
+        """
+        Tightens the bounds until nothing changes (or max_rounds rounds):
+        full departments fix their free members to 0, departments that need
+        all their free members fix them to 1, required teams fix their
+        members to 1, teams with an absent member can't count that day, and
+        teams with exactly as many possible days as their target need all of them.
+        Returns False if the domain is found to be empty (the node is infeasible).
+        """
+        arrays = self.arrays
+        dept_membership = arrays.dept_membership.astype(np.int8)
+        synergy_membership = arrays.synergy_membership.astype(np.int8)
+        size = arrays.synergy_size[:, None]
+
+        for round_index in range(max_rounds):
+            if np.any(self.x_low > self.x_up) or np.any(self.y_low > self.y_up) or np.any(self.dept_low > self.dept_up):
+                return False
+            before = int(self.x_up.sum()) - int(self.x_low.sum()) + int(self.y_up.sum()) - int(self.y_low.sum())
+
+            # Department rows
+            if len(arrays.dept_sids):
+                fixed_ones = arrays.dept_membership @ self.x_low
+                free = arrays.dept_membership @ (self.x_up - self.x_low)
+                if np.any(fixed_ones > self.dept_up) or np.any(fixed_ones + free < self.dept_low):
+                    return False
+
+                free_vars = self.x_up > self.x_low
+                full = (fixed_ones >= self.dept_up) & (free > 0)
+                if np.any(full):
+                    close = (dept_membership.T @ full.astype(np.int8) > 0) & free_vars
+                    self.x_up[close] = 0
+
+                tight = (fixed_ones + free <= self.dept_low) & (free > 0)
+                if np.any(tight):
+                    force = (dept_membership.T @ tight.astype(np.int8) > 0) & (self.x_up > self.x_low)
+                    self.x_low[force] = 1
+
+            # Synergy rows
+            if len(arrays.synergy_sids):
+                # A team can only count a day if every member can be present
+                possible = (arrays.synergy_membership @ self.x_up) >= size
+                self.y_up[~possible] = 0
+
+                # Required team days force every member to be present
+                required = synergy_membership.T @ self.y_low > 0
+                self.x_low[required & (self.x_up > 0)] = 1
+                if np.any(required & (self.x_up == 0)):
+                    return False
+
+                possible_days = self.y_up.sum(axis=1)
+                if np.any(possible_days < arrays.synergy_target):
+                    return False
+                exact = possible_days == arrays.synergy_target
+                self.y_low[exact] = self.y_up[exact]
+
+            after = int(self.x_up.sum()) - int(self.x_low.sum()) + int(self.y_up.sum()) - int(self.y_low.sum())
+            if after == before:
+                break
+
+        return not (np.any(self.x_low > self.x_up) or np.any(self.y_low > self.y_up))
+
+
+    def fixed_variables(self):
+        """
+        Returns a dictionary of variable names to values for every
+        Schedule and Synergy variable fixed in this domain.
+        """
+        fixed = {}
+        for i, j in zip(*np.nonzero(self.x_low == self.x_up)):
+            fixed['{0}_{1}_{2}'.format(SCHEDULE_VAR_PREFIX, self.arrays.uids[i], j + 1)] = int(self.x_low[i, j])
+        for k, j in zip(*np.nonzero(self.y_low == self.y_up)):
+            fixed['{0}_{1}_{2}'.format(SYNERGY_VAR_PREFIX, self.arrays.synergy_sids[k], j + 1)] = int(self.y_low[k, j])
+        return fixed
+
+
+    def is_fixed(self, var_name):
+        """Returns True iff the Schedule or Synergy variable with the given name is fixed."""
+        prefix, entity_id, day = _split_var_name(var_name)
+        if prefix == SCHEDULE_VAR_PREFIX:
+            i = self.arrays.uid_index[entity_id]
+            return self.x_low[i, day - 1] == self.x_up[i, day - 1]
+        k = self.arrays.synergy_index[entity_id]
+        return self.y_low[k, day - 1] == self.y_up[k, day - 1]
+
+
+    def fix_variable(self, var_name, value):
+        """Fixes the Schedule or Synergy variable with the given name."""
+        prefix, entity_id, day = _split_var_name(var_name)
+        if prefix == SCHEDULE_VAR_PREFIX:
+            self.fix_person_day(entity_id, day, value)
+        else:
+            self.fix_synergy_day(entity_id, day, value)
+
+
+    def is_dept_day_fixed(self, sid, day):
+        """Returns True iff the attendance interval of the given department on the given (1-based) day is a single value."""
+        d = self.arrays.dept_index[sid]
+        return self.dept_low[d, day - 1] >= self.dept_up[d, day - 1]
+
+
+    def key(self):
+        """
+        Returns a compact digest of every bound and interval in this domain,
+        identical for any two nodes with the same effective subproblem.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for field in [self.x_low, self.x_up, self.y_low, self.y_up, self.dept_low, self.dept_up]:
+            digest.update(np.ascontiguousarray(field).tobytes())
+        return digest.digest()
+
+
+def _split_var_name(var_name):
+    """Splits a name like 'Schedule_[uid]_[day]' into (prefix, uid, day)."""
+    prefix, rest = var_name.split('_', 1)
+    entity_id, day = rest.rsplit('_', 1)
+    return prefix, entity_id, int(day)
+
+
+def reduced_cost_fixings(lp_value, incumbent_value, variables, tolerance=1e-6):
+    """
+    Reduced-cost fixing for a maximization LP with 0/1 bounded variables
+    and an integer-valued objective.
+    Given the LP optimum, the incumbent value and (name, value, reduced cost)
+    triples, returns a dictionary of variable names to the values they can be
+    fixed to without losing any solution strictly better than the incumbent.
+    """
+    fixings = {}
+    for name, value, reduced_cost in variables:
+        if value is None or reduced_cost is None:
+            continue
+        if value >= 1 - tolerance and reduced_cost > tolerance:
+            # Moving to 0 loses at least reduced_cost
+            if np.floor(lp_value - reduced_cost + tolerance) <= incumbent_value:
+                fixings[name] = 1
+        elif value <= tolerance and reduced_cost < -tolerance:
+            # Moving to 1 loses at least -reduced_cost
+            if np.floor(lp_value + reduced_cost + tolerance) <= incumbent_value:
+                fixings[name] = 0
+    return fixings
@@ -4,18 +4,31 @@ import pulp as pl
 
 import time
 
-from PeopleAndSets import SetConstraintType
-import Parser
+from officeScheduler.PeopleAndSets import SetConstraintType
+import officeScheduler.Parser as Parser
 
 SCHEDULE_VAR_PREFIX = 'Schedule'
 SYNERGY_VAR_PREFIX = 'Synergy'
 
-def build_scheduling_lp(num_days, people, set_constraints):
+# Ways of linking synergy variables y_{k,j} to schedule variables x_{i,j}:
+# 'aggregated' uses one row sum_i x_{i,j} >= |K| * y_{k,j} per team and day;
+# 'disaggregated' uses one row y_{k,j} <= x_{i,j} per team member and day (tighter LP relaxation);
+# 'lazy' starts from the aggregated rows and adds violated disaggregated rows as cuts
+SYNERGY_FORMULATIONS = ('aggregated', 'disaggregated', 'lazy')
+
+def build_scheduling_lp(num_days, people, set_constraints, synergy_formulation='aggregated'):
     """
     Given outputs of Parser.parseCSVs(), 
     constructs a PuLP LpProblem representing the scheduling problem.
     The objective is to maximize the number of person-days. 
+
+    The synergy_formulation argument selects how team presence is linked
+    to individual schedules (see SYNERGY_FORMULATIONS). 
+    With 'lazy', call separate_synergy_cuts() after each LP solve.
     """
+    if synergy_formulation not in SYNERGY_FORMULATIONS:
+        raise ValueError('Unknown synergy formulation \'{0}\'; expected one of {1}.'.format(synergy_formulation, SYNERGY_FORMULATIONS))
+
     prob = pl.LpProblem('Office_Scheduling_Problem', pl.LpMaximize)
 
     # Find indices of 'synergy' set constraints
@@ -64,7 +77,11 @@ def build_scheduling_lp(num_days, people, set_constraints):
 
             # Add constraint to enforce all of set k showing up when y_{k,j} is 1
             for j in DAYS:
-                prob += pl.lpSum(x[person_uid][j] for person_uid in set_constraint.personList) >= len(set_constraint.personList) * y[set_constraint.sid][j], 'Team {0} all present on day {1} if assigned to be'.format(set_constraint.sid, j)
+                if synergy_formulation == 'disaggregated':
+                    for person_uid in set_constraint.personList:
+                        prob += y[set_constraint.sid][j] <= x[person_uid][j], synergy_link_name(set_constraint.sid, person_uid, j)
+                else:
+                    prob += pl.lpSum(x[person_uid][j] for person_uid in set_constraint.personList) >= len(set_constraint.personList) * y[set_constraint.sid][j], 'Team {0} all present on day {1} if assigned to be'.format(set_constraint.sid, j)
         
         else:
             raise Exception('Invalid constraintType field for set constraint with id {0}:\n\t{1}'.format(set_constraint.sid, set_constraint.constraintType))
@@ -73,10 +90,66 @@ def build_scheduling_lp(num_days, people, set_constraints):
             # # Wait... Could reach this case if up_bound is -1 for a DEPARTMENT-type constraint
             # print('Ignoring unsupported set constraint: sid = {0}, type = {1}.'.format(set_constraint.sid, set_constraint.constraintType))
 
-    print(prob)
     return prob
 
 
+def synergy_link_name(sid, person_uid, day):
+    """
+    Returns the name of the disaggregated row linking team sid to one of its members on the given day.
+    """
+    return 'Team_{0}_needs_{1}_on_day_{2}'.format(sid, person_uid, day)
+
+
+def separate_synergy_cuts(problem, set_constraints, num_days, tolerance=1e-6):
+    """
+    Adds to the given (solved) LP every disaggregated synergy row 
+    y_{k,j} <= x_{i,j} violated by its current solution. 
+    Returns the number of cuts added. 
+    """
+    values = {var.name: var.value() for var in problem.variables()}
+    variables = {var.name: var for var in problem.variables()}
+
+    num_cuts = 0
+    for set_constraint in set_constraints:
+        if set_constraint.constraintType.value != SetConstraintType.SYNERGY.value:
+            continue
+
+        for j in range(1, num_days + 1):
+            y_name = '{0}_{1}_{2}'.format(SYNERGY_VAR_PREFIX, set_constraint.sid, j)
+            y_value = values.get(y_name)
+            if not y_value or y_value <= tolerance:
+                continue
+
+            for person_uid in set_constraint.personList:
+                x_name = '{0}_{1}_{2}'.format(SCHEDULE_VAR_PREFIX, person_uid, j)
+                cut_name = synergy_link_name(set_constraint.sid, person_uid, j)
+                if (values.get(x_name) or 0) < y_value - tolerance and cut_name not in problem.constraints:
+                    problem += variables[y_name] <= variables[x_name], cut_name
+                    num_cuts += 1
+
+    return num_cuts
+
+
+def solve_lp_with_cuts(problem, set_constraints, num_days, max_rounds=10):
+    """
+    Solves the given LP, then alternates separate_synergy_cuts() and re-solving
+    until no violated synergy rows remain or max_rounds rounds have been done. 
+    Returns the PuLP solver status string and the total number of cuts added. 
+    """
+    status = solve_lp(problem)
+    total_cuts = 0
+    for round_index in range(max_rounds):
+        if status != 'Optimal':
+            break
+        num_cuts = separate_synergy_cuts(problem, set_constraints, num_days)
+        if num_cuts == 0:
+            break
+        total_cuts += num_cuts
+        status = solve_lp(problem)
+
+    return status, total_cuts
+
+
 def solve_lp(problem):
     """
     Solves the given LP relaxation and returns the PuLP solver status code. 
@@ -0,0 +1,95 @@
+# Registry of solver backends by name, imported on first use
+from collections import OrderedDict
+import importlib
+
+# Entry point group through which installed packages can add solvers
+ENTRY_POINT_GROUP = 'officeScheduler.solvers'
+
+# Built-in solvers: name -> 'module:ClassName'
+BUILTIN_SOLVERS = OrderedDict([
+    ('direct-ilp', 'officeScheduler.direct_ilp_solver:DirectILPSolver'),
+    ('pulp', 'officeScheduler.OldSolver:PulpSolver'),
+    ('bnb', 'officeScheduler.simple_bnb_solver:SimpleBnbSolver'),
+    ('portfolio', 'officeScheduler.portfolio_solver:PortfolioSolver'),
+    ('rolling-horizon', 'officeScheduler.rolling_horizon:RollingHorizonSolver'),
+    ('periodic', 'officeScheduler.periodic:PeriodicSolver'),
+    ('lagrangian', 'officeScheduler.lagrangian:LagrangianSolver'),
+    ('local-search', 'officeScheduler.local_search:LocalSearchSolver'),
+    ('lns', 'officeScheduler.lns:LNSSolver'),
+    ('multi-resolution', 'officeScheduler.multi_resolution:MultiResolutionSolver'),
+])
+
+_registry = OrderedDict(BUILTIN_SOLVERS)
+_entry_points_loaded = False
+
+
+class UnknownSolverError(KeyError):
+    """
+    Raised when no solver is registered under a name.
+
+    Fields:
+        message - explanation of the error
+        name - the requested name
+    """
+    def __init__(self, message, name=None):
+        super(UnknownSolverError, self).__init__(message)
+        self.message = message
+        self.name = name
+
+
+def register_solver(name, target, replace=False):
+    """
+    Registers a solver under name. target is either a Solver subclass or a
+    'module:ClassName' string, which is only imported when the solver is first requested.
+    Raises ValueError if name is taken, unless replace is True.
+    """
+    _load_entry_points()
+    if name in _registry and not replace:
+        raise ValueError('A solver is already registered as \'{0}\'.'.format(name))
+    _registry[name] = target
+
+
+def available_solvers():
+    """Returns the names of the registered solvers (without importing any of them)."""
+    _load_entry_points()
+    return list(_registry)
+
+
+def get_solver(name):
+    """Returns the Solver subclass registered under name, importing its module on first use."""
+    _load_entry_points()
+    if name not in _registry:
+        raise UnknownSolverError('Unknown solver \'{0}\'; expected one of {1}.'.format(name, list(_registry)), name)
+
+    target = _registry[name]
+    if isinstance(target, str):
+        module_name, class_name = target.split(':')
+        target = getattr(importlib.import_module(module_name), class_name)
+        _registry[name] = target
+    elif hasattr(target, 'load') and not isinstance(target, type):
+        target = target.load() # Entry point
+        _registry[name] = target
+    return target
+
+
+def create_solver(name, people, set_constraints, time_limit=-1, **kwargs):
+    """Returns an instance of the solver registered under name."""
+    return get_solver(name)(people, set_constraints, time_limit, **kwargs)
+
+
+def _load_entry_points():
+    """Adds the solvers of installed packages' entry points (once; built-in names take precedence)."""
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+    try:
+        discovered = entry_points(group=ENTRY_POINT_GROUP)
+    except TypeError:
+        discovered = entry_points().get(ENTRY_POINT_GROUP, []) # Python < 3.10
+    for entry_point in discovered:
+        _registry.setdefault(entry_point.name, entry_point)
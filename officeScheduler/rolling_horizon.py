@@ -0,0 +1,232 @@
+# Rolling-horizon solving of long scheduling windows
+import argparse
+import copy
+import time
+
+import numpy as np
+
+from officeScheduler.ortools_utils import (build_scheduling_ilp, ORTOOLS_SOLVER_STATUS_TO_OURS_MAP,
+    SCHEDULE_VAR_PREFIX)
+import officeScheduler.Parser as Parser
+from officeScheduler.PeopleAndSets import Person, SetConstraint, SetConstraintType
+from officeScheduler.metrics import SolverMetrics
+from officeScheduler.problem_arrays import ProblemArrays
+from officeScheduler.Schedule import Schedule
+from officeScheduler.Solver import Solver, SolverStatus
+
+
+class RollingHorizonSolver(Solver):
+    """
+    Solves a long horizon as a sequence of overlapping windows of window_size days.
+
+    Each window is solved as its own OR-Tools MIP; its first window_size - overlap
+    days are then fixed (committed) and the next window starts after them, so the
+    overlapping days are re-solved with the following days in view. The last window
+    commits all of its days. Department bounds are per day, so committed days only
+    affect later windows through the synergy targets: each window asks for the
+    synergy days each team still owes (capped by the days in the window when the
+    whole team is available), and if that is infeasible, only for the days that
+    can't be left to later windows.
+
+    The stitched schedule is checked against the full instance and compared
+    with the full-horizon LP bound, whose relative gap is kept in the gap field.
+
+    Fields:
+        window_size - days per window
+        overlap - days each window shares with the next one
+        window_time_limit - time limit per window in seconds (-1 for none; the
+                            remaining overall time_limit also applies)
+        lp_bound - LP relaxation bound of the full horizon (None if it couldn't be solved)
+        gap - (lp_bound - value) / lp_bound of the stitched schedule
+        windows - list of (first day, last day, SolverStatus) of the windows solved, with 1-based days
+    """
+    def __init__(self, people, set_constraints, time_limit=-1, window_size=10, overlap=2, window_time_limit=-1,
+                 synergy_formulation='aggregated'):
+        super(RollingHorizonSolver, self).__init__(people, set_constraints, time_limit)
+        if overlap < 0 or overlap >= window_size:
+            raise ValueError('Window overlap must be at least 0 and less than the window size ({0}).'.format(window_size))
+        self.num_days = len(people[0].dateList) if people else 0
+        self.window_size = window_size
+        self.overlap = overlap
+        self.window_time_limit = window_time_limit
+        self.synergy_formulation = synergy_formulation
+        self.arrays = ProblemArrays(self.num_days, people, set_constraints)
+        self.lp_bound = None
+        self.gap = None
+        self.windows = []
+
+
+    def solve(self):
+        start_time = time.time()
+        self.windows = []
+
+        with self.metrics.phase('presolve'):
+            self.lp_bound = full_horizon_lp_bound(self.num_days, self.people, self.set_constraints)
+        self.metrics.set('lp_bound', self.lp_bound)
+        if self.lp_bound is None:
+            self.status = SolverStatus.INFEASIBLE
+            self.metrics.publish()
+            return Schedule(people=self.people)
+
+        x = np.zeros(self.arrays.shape, dtype=int)
+        common = self._team_available_days()
+        step = self.window_size - self.overlap
+        hint = None
+        first = 0
+        self.status = SolverStatus.FEASIBLE
+        while first < self.num_days:
+            last = min(first + self.window_size, self.num_days)
+            commit = last if last == self.num_days else first + step
+
+            # Synergy days still owed after the committed days
+            owed = np.maximum(self.arrays.synergy_target - self.arrays.synergy_present(x[:, :first]).sum(axis=1), 0)
+            in_window = common[:, first:last].sum(axis=1)
+            after_window = common[:, last:].sum(axis=1)
+            targets = [np.minimum(owed, in_window), np.minimum(np.maximum(owed - after_window, 0), in_window)]
+
+            window_status = SolverStatus.NOT_SOLVED
+            for target in targets:
+                time_limit = self._window_time_limit(start_time)
+                if time_limit == 0 or self.is_cancelled():
+                    break
+                window_status, window_x = self._solve_window(first, last, target, hint, time_limit)
+                if window_status in [SolverStatus.OPTIMAL, SolverStatus.FEASIBLE]:
+                    break
+            self.windows.append((first + 1, last, window_status))
+            if window_status not in [SolverStatus.OPTIMAL, SolverStatus.FEASIBLE]:
+                self.status = SolverStatus.OUT_OF_TIME if time_limit == 0 or self.is_cancelled() else SolverStatus.NOT_SOLVED
+                break
+
+            x[:, first:commit] = window_x[:, :commit - first]
+            hint = (commit, window_x[:, commit - first:])
+            self.report_progress(self.arrays.objective(x), self.lp_bound)
+            first = commit
+
+        self.metrics.set('windows', len(self.windows))
+
+        value = self.arrays.objective(x)
+        if self.status == SolverStatus.FEASIBLE and not self.arrays.is_feasible(x):
+            # The windows couldn't schedule every synergy day owed
+            self.status = SolverStatus.NOT_SOLVED
+        if self.status == SolverStatus.FEASIBLE:
+            self.gap = (self.lp_bound - value) / self.lp_bound if self.lp_bound > 0 else 0.0
+            if value >= np.floor(self.lp_bound + 1e-6):
+                self.status = SolverStatus.OPTIMAL
+            self.metrics.set('objective', value)
+            self.metrics.set('gap', self.gap)
+
+        with self.metrics.phase('extract'):
+            best_schedule = Schedule(people=self.people)
+            best_schedule.buildFromSolutionVariables(self.arrays.to_solution_dict(x))
+
+        self.metrics.publish()
+        return best_schedule
+
+
+    def _team_available_days(self):
+        """Returns the synergy sets by days boolean matrix of days when the whole team is available."""
+        return (self.arrays.synergy_membership @ self.arrays.availability) >= self.arrays.synergy_size[:, None]
+
+
+    def _window_time_limit(self, start_time):
+        """Returns the time limit for the next window solve (-1 for none, 0 if out of time)."""
+        limits = [limit for limit in [self.window_time_limit] if limit > 0]
+        if self.time_limit > 0:
+            limits.append(max(self.time_limit - (time.time() - start_time), 0))
+        return min(limits) if limits else -1
+
+
+    def _solve_window(self, first, last, synergy_target, hint=None, time_limit=-1):
+        """
+        Solves the window of days first, ..., last - 1 (0-based) with the given
+        synergy targets. hint is a pair (first day, assignments) of a previous
+        window's uncommitted days, used as a solution hint.
+        Returns the window's SolverStatus and its assignments matrix (or None).
+        """
+        hint_x = None
+        if hint is not None:
+            hint_first, hint_values = hint
+            hint_x = -np.ones((len(self.people), last - first), dtype=int)
+            num_hinted = min(hint_values.shape[1], last - hint_first)
+            hint_x[:, hint_first - first:hint_first - first + num_hinted] = hint_values[:, :num_hinted]
+        self.metrics.add('window_solves')
+        return solve_subhorizon(self.people, self.set_constraints, self.arrays.availability[:, first:last], synergy_target,
+                                time_limit, hint_x, self.synergy_formulation, self.metrics)
+
+
+def solve_subhorizon(people, set_constraints, availability, synergy_target, time_limit=-1, hint=None,
+                     synergy_formulation='aggregated', metrics=None):
+    """
+    Solves the instance restricted to the days given by the columns of the
+    people by days boolean availability matrix (e.g. a slice of ProblemArrays.availability),
+    with synergy_target[k] days required of the k-th synergy set (in set_constraints order).
+    hint is an optional people by days matrix of 0/1 values to hint (-1 entries are not hinted).
+    Returns the SolverStatus and the assignments matrix (None unless a schedule was found).
+    """
+    metrics = metrics if metrics is not None else SolverMetrics('solve_subhorizon')
+    num_days = availability.shape[1]
+    sub_people = [Person(person.uid, [bool(available) for available in availability[i]]) for i, person in enumerate(people)]
+    sub_sets = []
+    k = 0
+    for set_constraint in set_constraints:
+        if set_constraint.constraintType.value == SetConstraintType.SYNERGY.value:
+            sub_sets.append(SetConstraint(set_constraint.sid, SetConstraintType.SYNERGY,
+                                          set_constraint.personList, int(synergy_target[k]), -1))
+            k += 1
+        else:
+            # build_scheduling_ilp() normalizes unbounded up_bounds in place
+            sub_sets.append(copy.copy(set_constraint))
+
+    with metrics.phase('build'):
+        solver, variables, constraints = build_scheduling_ilp(num_days, sub_people, sub_sets, synergy_formulation)
+        if time_limit > 0:
+            solver.SetTimeLimit(int(time_limit * 1000))
+        if hint is not None:
+            hint_vars = []
+            hint_values = []
+            for i, person in enumerate(people):
+                for j in np.flatnonzero(hint[i] >= 0):
+                    hint_vars.append(variables['{0}_{1}_{2}'.format(SCHEDULE_VAR_PREFIX, person.uid, j + 1)])
+                    hint_values.append(float(hint[i, j]))
+            solver.SetHint(hint_vars, hint_values)
+
+    with metrics.phase('solve'):
+        status = ORTOOLS_SOLVER_STATUS_TO_OURS_MAP.get(solver.Solve(), SolverStatus.NOT_SOLVED)
+    if status not in [SolverStatus.OPTIMAL, SolverStatus.FEASIBLE]:
+        return status, None
+
+    x = np.zeros((len(people), num_days), dtype=int)
+    for i, person in enumerate(people):
+        for day in range(1, num_days + 1):
+            x[i, day - 1] = round(variables['{0}_{1}_{2}'.format(SCHEDULE_VAR_PREFIX, person.uid, day)].solution_value())
+    return status, x
+
+
+def full_horizon_lp_bound(num_days, people, set_constraints):
+    """Returns the LP relaxation bound of the whole horizon, or None if the LP is infeasible."""
+    set_constraints = [copy.copy(set_constraint) for set_constraint in set_constraints]
+    solver, variables, constraints = build_scheduling_ilp(num_days, people, set_constraints, integer=False)
+    if solver.Solve() != 0:
+        return None
+    return solver.Objective().Value()
+
+
+if __name__ == '__main__':
+    commandLineParser = argparse.ArgumentParser(description='Solves a long scheduling horizon as a sequence of overlapping windows')
+    commandLineParser.add_argument('numdays', type=int, help="the total number of days to schedule for")
+    commandLineParser.add_argument('peopleFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the people being scheduled")
+    commandLineParser.add_argument('setFile', type=argparse.FileType('r', encoding='utf8'), help="A csv file specifying all of the department and synergy constraints")
+    commandLineParser.add_argument('--window', type=int, default=10, help="days per window")
+    commandLineParser.add_argument('--overlap', type=int, default=2, help="days shared by consecutive windows")
+    commandLineParser.add_argument('--time-limit', type=float, default=-1, help="overall time limit in seconds")
+
+    args = commandLineParser.parse_args()
+    num_days, people, set_constraints = Parser.parseCSVs(n=args.numdays, peopleFile=args.peopleFile, setFile=args.setFile)
+
+    solver = RollingHorizonSolver(people, set_constraints, args.time_limit, args.window, args.overlap)
+    metrics = solver.enable_metrics()
+    schedule = solver.solve()
+    print('Status:', solver.status)
+    print('Windows:', solver.windows)
+    print('LP bound: {0}, gap: {1}'.format(solver.lp_bound, solver.gap))
+    print(metrics)
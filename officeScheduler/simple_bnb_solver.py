@@ -1,5 +1,5 @@
 import argparse
-from collections import deque 
+from collections import deque, OrderedDict
 import enum
 import math
 import numpy as np
@@ -8,35 +8,138 @@ import pulp as pl
 import random
 import time
 
-import Parser
-from PeopleAndSets import SetConstraint, SetConstraintType
-import pulp_utils
-from Solver import Solver, SolverStatus
-from Schedule import Schedule
+from officeScheduler.checkpoint import Checkpoint, checkpoint_path, read_checkpoint, write_checkpoint
+from officeScheduler.heuristics import HeuristicManager
+from officeScheduler.lagrangian import integral_bound, LagrangianRelaxation
+from officeScheduler.memory import MemoryBudget, MemoryBudgetExceeded, model_size, SpillFile
+import officeScheduler.Parser as Parser
+from officeScheduler.PeopleAndSets import SetConstraint, SetConstraintType
+from officeScheduler.problem_arrays import ProblemArrays
+from officeScheduler.propagation import NodeDomain, reduced_cost_fixings
+import officeScheduler.pulp_utils as pulp_utils
+from officeScheduler.Schedule import Schedule
+from officeScheduler.solution_cache import instance_key
+from officeScheduler.Solver import Solver, SolverStatus
+
+
+MAX_CUT_ROUNDS = 5 # Maximum number of synergy cut separation rounds per node
+MIN_OPEN_NODES = 64 # Open nodes always kept in memory under a memory budget
+MEMORY_CHECK_INTERVAL = 100 # Explored nodes between checks of the memory budget
+LAGRANGIAN_NODE_ITERATIONS = 10 # Subgradient iterations per node, warm-started from the root multipliers
+CHECKPOINT_INTERVAL = 300 # Default seconds between checkpoints
+CONFLICT_LP_SOLVES = 20 # Maximum LP solves spent minimizing the conflict of one infeasible LP
+PSEUDO_COST_EPSILON = 1e-6 # Floor on each direction's degradation in a pseudo-cost score
 
 
 class SimpleBnbSolver(Solver):
-    """Simple Branch and Bound solver."""
-    def __init__(self, people, set_constraints, time_limit=-1):
+    """
+    Simple Branch and Bound solver.
+
+    Primal heuristics (see heuristics.HeuristicManager) run once at the root,
+    before the first LP is solved, and then on the LP solution of every
+    heuristic_frequency-th node.
+
+    synergy_formulation is passed to pulp_utils.build_scheduling_lp(); 
+    with 'lazy', violated synergy rows are separated as cuts at every node
+    and inherited by the node's children.
+
+    Subproblems reached along different paths are detected with a 
+    TranspositionTable of at most transposition_table_size entries 
+    (0 disables it).
+
+    Each node carries a NodeDomain of variable bounds and department intervals, 
+    propagated before its LP is solved and tightened afterwards by 
+    reduced-cost fixing against the incumbent; children inherit it. 
+
+    With a memory_budget (in bytes), the model's memory is estimated before it
+    is built; if it can't fit, the root heuristics' schedule is returned with
+    status FEASIBLE instead. Otherwise, at most max_open_nodes open nodes (by
+    default, as many as the budget left after the model allows) are kept in
+    memory: the oldest (shallowest) ones are spilled to a temporary file and
+    reloaded, with their LPs rebuilt from their decisions, once the in-memory
+    stack runs out. Exceeding the budget during the search spills more nodes
+    and shrinks the transposition table.
+
+    If model_cache (a model_cache.ModelCache) is given, the root LP is 
+    loaded from it when it has been built before, by any process. 
+
+    With lagrangian_iterations > 0, the Lagrangian relaxation (see 
+    lagrangian.LagrangianRelaxation) is optimized for that many subgradient 
+    iterations at the root, where its heuristic also gives an incumbent, and 
+    then bounds every node over its domain before its LP is solved, pruning 
+    the node without an LP solve when the bound can't beat the incumbent. 
+
+    With a checkpoint_directory, the open nodes (as decision lists), the 
+    incumbent, the global bound and the pseudo-cost statistics are written 
+    to a checkpoint file named after the instance key every 
+    checkpoint_interval seconds and when the search stops; a later run on 
+    the same instance resumes from that frontier instead of the root; 
+    the resumed open nodes wait in the spill file as decision lists, and 
+    each one's LP and domain are only rebuilt when it is popped. 
+
+    Infeasible nodes (by propagation or by their LP) are analyzed into 
+    nogoods: minimal subsets of their branching decisions that are infeasible 
+    on their own (see NogoodStore). At most max_nogoods of them are kept 
+    (0 disables learning); before a node's LP is solved, a node that meets 
+    every literal of a nogood is pruned, and one that meets all but one 
+    has the remaining literal negated in its domain. 
+    """
+    def __init__(self, people, set_constraints, time_limit=-1, heuristics=None, heuristic_frequency=10, seed=None,
+                 synergy_formulation='aggregated', transposition_table_size=100000, memory_budget=None,
+                 max_open_nodes=None, spill_directory=None, model_cache=None, lagrangian_iterations=0,
+                 checkpoint_directory=None, checkpoint_interval=CHECKPOINT_INTERVAL, max_nogoods=10000):
         super(SimpleBnbSolver, self).__init__(people, set_constraints, time_limit)
         self.num_days = len(people[0].dateList)
         self.best_value = 0
         self.best_solution = None
         self.nodes = []
-        self.status = SolverStatus.UNSOLVED
+        self.status = SolverStatus.NOT_SOLVED
+        self.arrays = ProblemArrays(self.num_days, people, set_constraints)
+        self.heuristic_manager = HeuristicManager(self.arrays, heuristics, heuristic_frequency, seed)
+        self.synergy_formulation = synergy_formulation
+        self.transposition_table = TranspositionTable(transposition_table_size)
+        self.memory_budget = memory_budget
+        self.max_open_nodes = max_open_nodes
+        self.spill_directory = spill_directory
+        self.model_cache = model_cache
+        self.lagrangian_iterations = lagrangian_iterations
+        self.lagrangian = None
+        self.checkpoint_directory = checkpoint_directory
+        self.checkpoint_interval = checkpoint_interval
+        self.pseudo_costs = PseudoCosts()
+        self.resumed = False
+        self.nogoods = NogoodStore(self.arrays, max_nogoods) if max_nogoods > 0 else None
+        self.base_domain = None
+        self.base_lp = None
+        self.conflict_lp_solves = 0
 
 
     def solve(self):
         start_time = time.time()
         total_lp_solve_time = 0
 
+        budget = None
+        max_open_nodes = self.max_open_nodes
+        if self.memory_budget is not None:
+            budget = MemoryBudget(self.memory_budget)
+            try:
+                model_estimate = budget.check_model(self.num_days, self.people, self.set_constraints, backend='pulp')
+            except MemoryBudgetExceeded as e:
+                self.metrics.set('model_memory_estimate', e.estimate)
+                return self._solve_without_model()
+            self.metrics.set('model_memory_estimate', model_estimate)
+            if max_open_nodes is None:
+                max_open_nodes = max(MIN_OPEN_NODES, (budget.remaining() - model_estimate) // self._node_memory_estimate())
+
+        phase = self.metrics.start_phase('build')
+
         # Create branching options for root
         branching_options = []
         for person in self.people:
             for day in range(1, self.num_days + 1):
                 branching_options.append(BranchingOption(DecisionType.PERSON_DAY, person.uid, day))
 
-        for set_constraint in set_constraints:
+        for set_constraint in self.set_constraints:
             if set_constraint.constraintType.value == SetConstraintType.DEPARTMENT.value:
                 lower_bound = set_constraint.low_bound
                 upper_bound = set_constraint.up_bound
@@ -55,31 +158,161 @@ class SimpleBnbSolver(Solver):
 
 
         root = BnbNode(None, branching_options)
-        root.lp = pulp_utils.build_scheduling_lp(num_days, people, set_constraints)
-
+        root.domain = NodeDomain(self.arrays)
+        if self.model_cache is not None:
+            root.lp = self.model_cache.pulp_model(self.num_days, self.people, self.set_constraints, self.synergy_formulation)
+        else:
+            root.lp = pulp_utils.build_scheduling_lp(self.num_days, self.people, self.set_constraints, self.synergy_formulation)
+        if self.synergy_formulation == 'lazy':
+            root.cut_separator = lambda problem: pulp_utils.separate_synergy_cuts(problem, self.set_constraints, self.num_days)
+        self.metrics.end_phase(phase)
+        self.metrics.set('num_variables', len(root.lp.variables()))
+        self.metrics.set('num_constraints', len(root.lp.constraints))
+
+        phase = self.metrics.start_phase('presolve')
+        root.domain_feasible = root.domain.propagate()
+        if self.nogoods is not None:
+            # Conflicts are explained against the propagated root, before any reduced-cost fixing
+            self.base_domain = root.domain.copy()
+            self.base_lp = root.lp.copy()
+
+        # Root heuristics that don't need an LP solution give an early incumbent
+        self.heuristic_manager.run_root()
+        self._update_incumbent_from_heuristics()
+
+        if self.lagrangian_iterations > 0:
+            self.lagrangian = LagrangianRelaxation(self.arrays)
+            lagrangian_bound, _ = self.lagrangian.optimize(self.lagrangian_iterations, self.best_value)
+            self.metrics.set('lagrangian_bound', lagrangian_bound)
+            if self.lagrangian.best_value > self.best_value:
+                self.best_value = self.lagrangian.best_value
+                self.best_solution = self.arrays.to_solution_dict(self.lagrangian.best_x)
+                self.report_progress(self.best_value, lagrangian_bound)
+            root.parent_lp_value = integral_bound(lagrangian_bound) # Prunes the root if already proven optimal
+
+        # Resume from the frontier of an earlier run's checkpoint, if there is one
+        checkpoint_file = None
+        previous = None
+        if self.checkpoint_directory is not None:
+            instance = instance_key(self.num_days, self.people, self.set_constraints)
+            checkpoint_file = checkpoint_path(self.checkpoint_directory, instance)
+            previous = read_checkpoint(checkpoint_file, instance)
+        self.metrics.end_phase(phase)
+
+        phase = self.metrics.start_phase('solve')
         stack = deque()
-        stack.append(root)
+        self.resumed = previous is not None
+        if previous is not None:
+            if previous.incumbent is not None and previous.incumbent_value > self.best_value:
+                self.best_value = previous.incumbent_value
+                x, _ = self.arrays.from_solution_dict(previous.incumbent)
+                self.best_solution = self.arrays.to_solution_dict(x)
+                self.report_progress(self.best_value, previous.bound)
+            self.pseudo_costs = PseudoCosts.from_state(previous.pseudo_costs)
+            self.metrics.set('resumed_open_nodes', len(previous.frontier))
+        else:
+            stack.append(root)
+            self.transposition_table.store(root.canonical_key(), math.inf)
+        previous_nodes = previous.nodes if previous is not None else 0
+        previous_elapsed = previous.elapsed if previous is not None else 0.0
+        last_checkpoint_time = time.time()
+        spill = SpillFile(self.spill_directory) if max_open_nodes is not None or previous is not None else None
+        spilled_bound = -math.inf # Best parent LP value among spilled nodes
+        if previous is not None and previous.frontier:
+            # Resumed nodes are only rebuilt when popped, so the search starts right away
+            frontier = [PendingNode.from_decisions(decisions, parent_lp_value)
+                        for decisions, parent_lp_value in previous.frontier]
+            for start in range(0, len(frontier), MIN_OPEN_NODES):
+                spill.push([pending.spill_state() for pending in frontier[start:start + MIN_OPEN_NODES]])
+            spilled_bound = max(pending.parent_lp_value for pending in frontier)
 
         count_explored_nodes = 0
-
-        while stack: # implicit condition: stack is not empty
+        count_duplicate_nodes = 0
+        count_bound_pruned_nodes = 0
+        count_propagation_pruned_nodes = 0
+        count_lagrangian_pruned_nodes = 0
+        count_nogood_pruned_nodes = 0
+        count_spilled_nodes = 0
+
+        while stack or spill: # implicit condition: stack or spill file is not empty
             elapsed_time = time.time() - start_time
-            if elapsed_time > time_limit:
+            if self.time_limit > 0 and elapsed_time > self.time_limit:
+                break
+            if self.is_cancelled():
                 break
+            if checkpoint_file is not None and time.time() - last_checkpoint_time >= self.checkpoint_interval:
+                self._write_checkpoint(checkpoint_file, instance, stack, spill, previous_nodes + count_explored_nodes,
+                                       previous_elapsed + time.time() - start_time)
+                last_checkpoint_time = time.time()
+
+            if not stack:
+                # Reload the most recently spilled batch, keeping its depth-first order
+                for state in spill.pop():
+                    stack.append(PendingNode(state))
+                if not spill:
+                    spilled_bound = -math.inf
+                continue
 
             node = stack.pop()
+            if isinstance(node, PendingNode):
+                if node.parent_lp_value <= self.best_value:
+                    count_bound_pruned_nodes += 1
+                    continue
+                node = node.rebuild(root, self.arrays)
+
+            # Reuse the best known bound for this subproblem (the parent's LP value,
+            # unless an equivalent node has been solved since) to prune without an LP solve
+            key = node.canonical_key()
+            bound = self.transposition_table.lookup(key)
+            if bound is None:
+                bound = node.parent_lp_value
+            if bound <= self.best_value:
+                count_bound_pruned_nodes += 1
+                continue
+
+            if not node.domain_feasible:
+                count_propagation_pruned_nodes += 1 # Infeasible without solving the LP
+                self._learn_nogood(node.decisions)
+                continue
+
+            if self.nogoods is not None and not self.nogoods.propagate(node.domain):
+                count_nogood_pruned_nodes += 1 # A learned conflict rules the node out without an LP solve
+                self.transposition_table.store(key, -math.inf)
+                continue
+
+            if self.lagrangian is not None and node.depth > 0:
+                node_bound, _ = self.lagrangian.optimize(LAGRANGIAN_NODE_ITERATIONS, self.best_value, node.domain)
+                if integral_bound(node_bound) <= self.best_value:
+                    count_lagrangian_pruned_nodes += 1
+                    self.transposition_table.store(key, node_bound)
+                    continue
+
             count_explored_nodes += 1
 
             # print(node)
 
-            children, lp_solve_time = node.branch()
+            children, lp_solve_time = node.branch(self.best_value, self.pseudo_costs)
             total_lp_solve_time += lp_solve_time
+            self.transposition_table.store(key, node.lp_value if node.lp_solution is not None else -math.inf)
+            if node.lp_status == 'Infeasible':
+                self._learn_nogood(node.decisions, lp_infeasible=True)
+            if node.decisions and node.lp_solution is not None and math.isfinite(node.parent_lp_value):
+                self.pseudo_costs.record(node.decisions[-1], node.parent_lp_value - node.lp_value)
 
             # print('Node at depth {0}:\n\tLP value: {1:.2f}'.format(node.depth, node.lp_value))
 
             if node.feasible_value > self.best_value:
                 self.best_value = node.feasible_value
                 self.best_solution = node.feasible_solution
+                self.report_progress(self.best_value, max(spilled_bound, self._global_bound(stack, node)))
+
+            if node.lp_solution is not None:
+                lp_x, lp_y = self.arrays.from_solution_dict(node.lp_solution)
+                if node.depth == 0:
+                    self.heuristic_manager.run_root(lp_x, lp_y)
+                else:
+                    self.heuristic_manager.run_node(count_explored_nodes, lp_x, lp_y)
+                self._update_incumbent_from_heuristics()
 
             # Pruning: Don't need to add children if LP relaxation has 
             # opt value no better than best feasible integer solution seen so far
@@ -87,34 +320,454 @@ class SimpleBnbSolver(Solver):
                 continue
 
             for child in children:
+                if not child.domain_feasible:
+                    count_propagation_pruned_nodes += 1
+                    self._learn_nogood(child.decisions)
+                    continue
+                child_key = child.canonical_key()
+                if child_key in self.transposition_table:
+                    count_duplicate_nodes += 1 # Equivalent subproblem already explored or queued
+                    continue
+                self.transposition_table.store(child_key, node.lp_value)
                 stack.append(child) # Push children onto stack for DFS
 
-
-        # Print summary stats
-        print('Explored {0:d} nodes.'.format(count_explored_nodes))
-        print('Elapsed time: {0:.3f} s'.format(elapsed_time))
-        print('Total LP solve time: {0:.3f} s'.format(total_lp_solve_time))
-        print('Best value: {0:d}'.format(int(self.best_value)))
+            if spill is not None:
+                over_budget = (budget is not None and count_explored_nodes % MEMORY_CHECK_INTERVAL == 0
+                               and budget.exceeded())
+                if over_budget:
+                    max_open_nodes = max(MIN_OPEN_NODES, max_open_nodes // 2)
+                    self.transposition_table.shrink(self.transposition_table.max_entries // 2)
+                if max_open_nodes is not None and len(stack) > max_open_nodes:
+                    # Spill the shallowest nodes, which DFS will revisit last
+                    num_spilled = len(stack) - max_open_nodes // 2
+                    spilled = [stack.popleft() for _ in range(num_spilled)]
+                    spill.push([spilled_node.spill_state() for spilled_node in spilled])
+                    spilled_bound = max([spilled_bound] + [spilled_node.parent_lp_value for spilled_node in spilled])
+                    count_spilled_nodes += num_spilled
+
+        num_open_nodes = len(stack) + (len(spill) if spill is not None else 0)
+        if checkpoint_file is not None:
+            self._write_checkpoint(checkpoint_file, instance, stack, spill, previous_nodes + count_explored_nodes,
+                                   previous_elapsed + time.time() - start_time)
+        if spill is not None:
+            spill.close()
+        self.metrics.end_phase(phase)
+
+        # Summary stats
+        self.metrics.set('nodes', count_explored_nodes)
+        self.metrics.set('duplicate_nodes', count_duplicate_nodes)
+        self.metrics.set('bound_pruned_nodes', count_bound_pruned_nodes)
+        self.metrics.set('propagation_pruned_nodes', count_propagation_pruned_nodes)
+        self.metrics.set('lagrangian_pruned_nodes', count_lagrangian_pruned_nodes)
+        if self.nogoods is not None:
+            self.metrics.set('nogoods', self.nogoods.learned)
+            self.metrics.set('nogood_pruned_nodes', count_nogood_pruned_nodes)
+            self.metrics.set('nogood_fixings', self.nogoods.fixings)
+            self.metrics.set('conflict_lp_solves', self.conflict_lp_solves)
+        self.metrics.set('open_nodes', num_open_nodes)
+        self.metrics.set('spilled_nodes', count_spilled_nodes)
+        self.metrics.set('lp_solve_time', total_lp_solve_time)
+        self.metrics.set('objective', self.best_value)
 
         # Update solver status
-        if elapsed_time > time_limit and time_limit > 0:
-            if self.best_value <= 0:
+        if num_open_nodes > 0 and (self.time_limit > 0 or self.is_cancelled()):
+            if self.best_solution is None:
                 self.status = SolverStatus.OUT_OF_TIME
             else:
                 self.status = SolverStatus.FEASIBLE
         else:
-            if self.best_value <= 0:
+            if self.best_solution is None:
                 self.status = SolverStatus.INFEASIBLE
             else:
                 self.status = SolverStatus.OPTIMAL
 
         # Build and return best Schedule
-        best_schedule = Schedule(people=self.people)
-        best_schedule.buildFromSolutionVariables(self.best_solution)
+        with self.metrics.phase('extract'):
+            best_schedule = Schedule(people=self.people)
+            best_schedule.buildFromSolutionVariables(self.best_solution)
+
+        self.metrics.publish()
+
+        return best_schedule
+
+
+    def _update_incumbent_from_heuristics(self):
+        """
+        Copies the heuristic manager's best schedule into the incumbent if it is better
+        (or if there is no incumbent yet, even when the schedule's value is 0).
+        """
+        manager = self.heuristic_manager
+        if manager.best_value > self.best_value or (self.best_solution is None and manager.best_x is not None):
+            self.best_value = manager.best_value
+            self.best_solution = self.arrays.to_solution_dict(manager.best_x)
+            self.report_progress(self.best_value)
+
+
+    def _solve_without_model(self):
+        """
+        Fallback when the model doesn't fit in the memory budget: 
+        returns the best schedule of the root heuristics, which only need the problem arrays. 
+        """
+        with self.metrics.phase('presolve'):
+            self.heuristic_manager.run_root()
+            self._update_incumbent_from_heuristics()
+        self.metrics.set('objective', self.best_value)
+        self.status = SolverStatus.FEASIBLE if self.best_solution is not None else SolverStatus.NOT_SOLVED
+
+        with self.metrics.phase('extract'):
+            best_schedule = Schedule(people=self.people)
+            best_schedule.buildFromSolutionVariables(self.best_solution if self.best_solution is not None else {})
 
+        self.metrics.publish()
         return best_schedule
 
 
+    def _node_memory_estimate(self):
+        """
+        Returns the estimated bytes held by one open node: its LP's constraint 
+        dictionary (the constraints themselves are shared), domain and branching options. 
+        """
+        num_variables, num_constraints, num_nonzeros = model_size(self.num_days, self.people, self.set_constraints)
+        domain = NodeDomain(self.arrays)
+        domain_bytes = sum(field.nbytes for field in domain.bounds())
+        return 100 * num_constraints + domain_bytes + 8 * num_variables + 1000
+
+
+    def _write_checkpoint(self, filepath, instance, stack, spill, nodes, elapsed):
+        """
+        Writes the open nodes of the stack and spill file (as decision tuples with 
+        their parents' LP values), the incumbent and the pseudo-costs to filepath. 
+        """
+        frontier = [([decision.to_tuple() for decision in node.decisions], node.parent_lp_value) for node in stack]
+        if spill is not None:
+            frontier += [([decision.to_tuple() for decision in state['decisions']], state['parent_lp_value'])
+                         for state in spill.items()]
+        bound = max([parent_lp_value for decisions, parent_lp_value in frontier] + [self.best_value])
+        write_checkpoint(filepath, Checkpoint(instance, self.best_value, Checkpoint.compact_solution(self.best_solution),
+                                              bound, frontier, self.pseudo_costs.state(), nodes, elapsed))
+        self.metrics.add('checkpoints')
+
+
+    def _learn_nogood(self, decisions, lp_infeasible=False):
+        """
+        Stores a nogood for an infeasible node, given its branching decisions: 
+        the decisions are replayed on the propagated root domain (and, for an 
+        infeasible LP, on the root LP) and dropped one at a time, oldest first, 
+        while the rest stay infeasible. Nothing is learned when the decisions 
+        alone are feasible, i.e. when the node was ruled out by reduced-cost 
+        fixings inherited from its ancestors. 
+        """
+        if self.nogoods is None or not decisions:
+            return
+
+        lp_solve_limit = self.conflict_lp_solves + CONFLICT_LP_SOLVES
+
+        def conflicting(subset):
+            domain = self.base_domain.copy()
+            for decision in subset:
+                decision.apply_to_domain(domain)
+            if not domain.propagate():
+                return True
+            if not lp_infeasible or self.conflict_lp_solves >= lp_solve_limit:
+                return False
+            self.conflict_lp_solves += 1
+            lp = self.base_lp.copy()
+            for decision in subset:
+                lp = decision.add_constraint_to_problem(lp)
+            return pulp_utils.solve_lp(lp) == 'Infeasible'
+
+        if not conflicting(decisions):
+            return
+        conflict = list(decisions)
+        for decision in decisions:
+            if self.conflict_lp_solves >= lp_solve_limit and lp_infeasible:
+                break # Out of LP solves: the rest of the decisions stay in the nogood
+            remaining = [other for other in conflict if other is not decision]
+            if remaining and conflicting(remaining):
+                conflict = remaining
+        self.nogoods.add(conflict)
+
+
+    def _global_bound(self, stack, node):
+        """
+        Returns the best bound over the open nodes and the current node.
+        """
+        bounds = [open_node.parent_lp_value for open_node in stack]
+        bounds.append(node.lp_value if node.lp_solution is not None else node.parent_lp_value)
+        return max(bounds)
+
+
+class PseudoCosts(object):
+    """
+    Average degradation of the LP value caused by each branching direction 
+    of each branching option (its pseudo-costs), recorded when a child's LP 
+    is solved. They choose the option each node branches on (see select()), 
+    and are kept across resumed runs (see checkpoint). 
+
+    Fields:
+    costs - dictionary of (decision type value, entity id, day) to 
+            [sum of down degradations, down count, sum of up degradations, up count]
+    """
+    def __init__(self):
+        self.costs = {}
+
+
+    def record(self, decision, degradation):
+        option = decision.branching_option
+        entry = self.costs.setdefault((option.decision_type.value, option.entity_id, option.day), [0.0, 0, 0.0, 0])
+        offset = 2 * decision.direction
+        entry[offset] += max(degradation, 0.0)
+        entry[offset + 1] += 1
+
+
+    def estimate(self, option, direction):
+        """Returns the average degradation of branching option in direction (None if never recorded)."""
+        entry = self.costs.get((option.decision_type.value, option.entity_id, option.day))
+        if entry is None or entry[2 * direction + 1] == 0:
+            return None
+        return entry[2 * direction] / entry[2 * direction + 1]
+
+
+    def select(self, options):
+        """
+        Returns the option with the highest score, the product of its average 
+        down and up degradations; a direction never recorded for an option is 
+        estimated by the average over the options recorded in that direction. 
+        Ties are broken, and options chosen while a direction has no statistics 
+        at all, at random. 
+        """
+        averages = []
+        for direction in [0, 1]:
+            degradations = [entry[2 * direction] / entry[2 * direction + 1]
+                            for entry in self.costs.values() if entry[2 * direction + 1] > 0]
+            averages.append(sum(degradations) / len(degradations) if degradations else None)
+        if None in averages:
+            return random.choice(options)
+
+        scores = []
+        for option in options:
+            score = 1.0
+            for direction in [0, 1]:
+                degradation = self.estimate(option, direction)
+                score *= max(averages[direction] if degradation is None else degradation, PSEUDO_COST_EPSILON)
+            scores.append(score)
+        best_score = max(scores)
+        return random.choice([option for option, score in zip(options, scores) if score == best_score])
+
+
+    def state(self):
+        return {key: list(entry) for key, entry in self.costs.items()}
+
+
+    @staticmethod
+    def from_state(state):
+        pseudo_costs = PseudoCosts()
+        pseudo_costs.costs = {key: list(entry) for key, entry in state.items()}
+        return pseudo_costs
+
+
+class NogoodStore(object):
+    """
+    Bounded store of nogoods learned from infeasible nodes, with oldest-first 
+    eviction. A nogood is a set of literals, each one branching decision 
+    (person or team fixed to a direction on a day, or a department's 
+    attendance on a day bounded by a threshold), that no schedule satisfies 
+    together. The literals of all nogoods are kept in flat arrays, so that 
+    propagate() checks every nogood against a node's domain in one vectorized pass. 
+
+    Fields:
+    arrays - the ProblemArrays instance being solved
+    max_nogoods - maximum number of stored nogoods
+    nogoods - OrderedDict of frozensets of literal tuples 
+              (decision type value, entity id, day, direction, threshold), oldest first
+    learned - number of nogoods added so far
+    fixings - number of literals negated in node domains by propagate() so far
+    """
+    def __init__(self, arrays, max_nogoods=10000):
+        self.arrays = arrays
+        self.max_nogoods = max_nogoods
+        self.nogoods = OrderedDict()
+        self.learned = 0
+        self.fixings = 0
+        self._literals = None # Flat literal arrays, rebuilt after the store changes
+
+
+    def __len__(self):
+        return len(self.nogoods)
+
+
+    def add(self, decisions):
+        """
+        Stores the nogood made of the given BranchingDecisions, evicting the oldest nogood if the store is full.
+        """
+        nogood = frozenset((decision.branching_option.decision_type.value, decision.branching_option.entity_id,
+                            decision.branching_option.day, decision.direction, decision.threshold)
+                           for decision in decisions)
+        if not nogood or nogood in self.nogoods:
+            return
+        self.nogoods[nogood] = True
+        self.learned += 1
+        if len(self.nogoods) > self.max_nogoods:
+            self.nogoods.popitem(last=False)
+        self._literals = None
+
+
+    def _build_literals(self):
+        """
+        Flattens the stored nogoods into arrays of literal kinds, rows, 0-based days, 
+        directions, thresholds (-1 if none) and owning nogood indices. 
+        """
+        arrays = self.arrays
+        index = {DecisionType.PERSON_DAY.value: arrays.uid_index, DecisionType.SYNERGY_DAY.value: arrays.synergy_index,
+                 DecisionType.DEPT_DAY.value: arrays.dept_index}
+        literals = [(decision_type, index[decision_type][entity_id], day - 1, direction, -1 if threshold is None else threshold, n)
+                    for n, nogood in enumerate(self.nogoods)
+                    for decision_type, entity_id, day, direction, threshold in nogood]
+        kind, row, col, direction, threshold, owner = [np.array(field, dtype=int) for field in zip(*literals)]
+        self._literals = {'kind': kind, 'row': row, 'col': col, 'direction': direction, 'threshold': threshold,
+                          'owner': owner, 'sizes': np.bincount(owner, minlength=len(self.nogoods))}
+
+
+    def _evaluate(self, domain):
+        """
+        Returns two boolean arrays over the flat literals: 
+        whether the domain implies each literal, and whether it rules it out. 
+        """
+        literals = self._literals
+        kind, row, col, direction = literals['kind'], literals['row'], literals['col'], literals['direction']
+        implied = np.zeros(len(kind), dtype=bool)
+        excluded = np.zeros(len(kind), dtype=bool)
+        for decision_type, low, up in [(DecisionType.PERSON_DAY, domain.x_low, domain.x_up),
+                                       (DecisionType.SYNERGY_DAY, domain.y_low, domain.y_up)]:
+            selected = kind == decision_type.value
+            value_low = low[row[selected], col[selected]]
+            value_up = up[row[selected], col[selected]]
+            up_direction = direction[selected] == 1
+            implied[selected] = np.where(up_direction, value_low == 1, value_up == 0)
+            excluded[selected] = np.where(up_direction, value_up == 0, value_low == 1)
+
+        selected = kind == DecisionType.DEPT_DAY.value
+        dept_low = domain.dept_low[row[selected], col[selected]]
+        dept_up = domain.dept_up[row[selected], col[selected]]
+        threshold = literals['threshold'][selected]
+        up_direction = direction[selected] == 1 # attendance >= threshold + 1; otherwise attendance <= threshold
+        implied[selected] = np.where(up_direction, dept_low > threshold, dept_up <= threshold)
+        excluded[selected] = np.where(up_direction, dept_up <= threshold, dept_low > threshold)
+        return implied, excluded
+
+
+    def propagate(self, domain, max_rounds=10):
+        """
+        Checks the stored nogoods against the given NodeDomain: 
+        returns False if the domain implies every literal of one of them. 
+        Otherwise, for every nogood with all but one literal implied, negates 
+        the remaining literal in the domain and propagates it (see NodeDomain.propagate()), 
+        repeating until no nogood applies (or max_rounds rounds). 
+        Returns False if the domain is found to be empty. 
+        """
+        if not self.nogoods:
+            return True
+        if self._literals is None:
+            self._build_literals()
+        literals = self._literals
+        sizes = literals['sizes']
+
+        for round_index in range(max_rounds):
+            implied, excluded = self._evaluate(domain)
+            implied_count = np.bincount(literals['owner'][implied], minlength=len(sizes))
+            if np.any(implied_count == sizes):
+                return False
+            excluded_count = np.bincount(literals['owner'][excluded], minlength=len(sizes))
+            unit = (implied_count == sizes - 1) & (excluded_count == 0)
+            if not np.any(unit):
+                return True
+
+            open_literals = np.flatnonzero(unit[literals['owner']] & ~implied)
+            for l in open_literals:
+                self._negate(domain, literals['kind'][l], literals['row'][l], literals['col'][l],
+                             literals['direction'][l], literals['threshold'][l])
+            self.fixings += len(open_literals)
+            if not domain.propagate():
+                return False
+        return True
+
+
+    @staticmethod
+    def _negate(domain, kind, row, col, direction, threshold):
+        """Tightens the domain to the negation of one literal."""
+        if kind == DecisionType.PERSON_DAY.value:
+            domain.x_low[row, col] = max(domain.x_low[row, col], 1 - direction)
+            domain.x_up[row, col] = min(domain.x_up[row, col], 1 - direction)
+        elif kind == DecisionType.SYNERGY_DAY.value:
+            domain.y_low[row, col] = max(domain.y_low[row, col], 1 - direction)
+            domain.y_up[row, col] = min(domain.y_up[row, col], 1 - direction)
+        elif direction == 1:
+            domain.dept_up[row, col] = min(domain.dept_up[row, col], threshold)
+        else:
+            domain.dept_low[row, col] = max(domain.dept_low[row, col], threshold + 1)
+
+
+class TranspositionTable(object):
+    """
+    Bounded table of the subproblems seen in the branch and bound tree, 
+    keyed by BnbNode.canonical_key(), with least-recently-used eviction. 
+    Each entry stores the best known upper bound on the subproblem's value
+    (the parent's LP value until the subproblem's own LP is solved; 
+    -inf if the LP was infeasible).
+
+    Fields:
+    max_entries - maximum number of stored subproblems (0 disables the table)
+    entries - OrderedDict of keys to bounds, least recently used first
+    evictions - number of entries evicted so far
+    """
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.evictions = 0
+
+
+    def __contains__(self, key):
+        return key in self.entries
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def lookup(self, key):
+        """
+        Returns the stored bound for key (marking it as recently used), or None if absent.
+        """
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+
+    def store(self, key, bound):
+        """
+        Stores the bound for key, evicting the least recently used entry if the table is full.
+        """
+        if self.max_entries <= 0:
+            return
+
+        self.entries[key] = bound
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
+    def shrink(self, max_entries):
+        """
+        Lowers max_entries, evicting the least recently used entries that no longer fit.
+        """
+        self.max_entries = max_entries
+        while len(self.entries) > max(max_entries, 0):
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
 class BnbNode(object):
     """
     Represents a node in the branch and bound tree.
@@ -125,12 +778,18 @@ class BnbNode(object):
                 The entry ``decisions[-1]`` is the Decision that 
                 distinguishes this node from its parent.
     lp - A PuLP problem encoding the LP relaxation
+    domain - NodeDomain of the variable bounds and department intervals at this node
+    domain_feasible - False if propagating the domain showed the node is infeasible
+    lp_status - PuLP status string of the node's last LP solve (None until branch() is called)
     """
     def __init__(self, parent, branching_options, new_decision=None):
         if parent is None:
             self.decisions = []
             self.lp = None
             self.depth = 0
+            self.cut_separator = None
+            self.domain = None
+            self.domain_feasible = True
         else:
             self.decisions = parent.decisions.copy()
             self.decisions.append(new_decision)
@@ -138,22 +797,42 @@ class BnbNode(object):
             self.lp = parent.lp.copy()
             self.lp = new_decision.add_constraint_to_problem(self.lp)
             self.depth = parent.depth + 1
+            self.cut_separator = parent.cut_separator
+
+            self.domain = parent.domain.copy()
+            new_decision.apply_to_domain(self.domain)
+            self.domain_feasible = self.domain.propagate()
 
         self.feasible_value = 0
         self.lp_value = 0
+        self.lp_solution = None
+        self.lp_status = None
+        self.parent_lp_value = math.inf if parent is None else parent.lp_value
         self.branching_options = branching_options.copy()
 
 
-    def branch(self):
+    def branch(self, incumbent_value=0, pseudo_costs=None):
         """
-        Randomly choose a decision on which to branch and
+        Choose a decision on which to branch (by pseudo_costs, see 
+        PseudoCosts.select(), or else randomly) and
         return children with the appropriate parameters. 
 
-        Returns an empty list if the current subproblem has an infeasible LP.
+        Returns an empty list if the current subproblem has an infeasible LP, 
+        or if reduced-cost fixing against incumbent_value shows that it 
+        contains no better solution.
         """
+        self.add_domain_fixings_to_lp()
+
         lp_solve_time = time.time()
         status = pulp_utils.solve_lp(self.lp)
+        if self.cut_separator is not None:
+            # Cuts stay in self.lp, so children (which copy its constraints) inherit them
+            for round_index in range(MAX_CUT_ROUNDS):
+                if status != 'Optimal' or self.cut_separator(self.lp) == 0:
+                    break
+                status = pulp_utils.solve_lp(self.lp)
         lp_solve_time = time.time() - lp_solve_time
+        self.lp_status = status
         if status in ['Infeasible', 'Unbounded', 'Not Solved']:
             return [], lp_solve_time
 
@@ -162,35 +841,29 @@ class BnbNode(object):
 
         # Otherwise, status == 'Optimal', so we can check for a feasible integer solution and branch
         self.lp_value = pl.value(self.lp.objective)
+        self.lp_solution = pulp_utils.extract_solution(self.lp)
 
+        # Rounding the LP solution is left to the solver's HeuristicManager
         if pulp_utils.is_integral(self.lp):
             self.feasible_value = self.lp_value
-            self.feasible_solution = pulp_utils.extract_solution(self.lp)
-        else:
-            # Try rounding LP solution in hopes of feasible integer solution
-            for var in self.lp.variables():
-                var.varValue = 0 if var.varValue <= 0.5 else 1
-
-            feasible = True
-            for constraint_name in self.lp.constraints:
-                constraint = self.lp.constraints[constraint_name]
-                value = pl.value(constraint)
-
-                violated = ((value > 0 and constraint.sense == pl.LpConstraintLE) or 
-                            (value < 0 and constraint.sense == pl.LpConstraintGE))
-                if violated:
-                    # print('Violated constraint:\n\t{0}'.format(constraint))
-                    feasible = False
-                    break
-
-            if feasible:
-                self.lp_value = pl.value(self.lp.objective)
-                self.feasible_value = self.lp_value
-                self.feasible_solution = pulp_utils.extract_solution(self.lp)
+            self.feasible_solution = self.lp_solution
+
+        # Reduced-cost fixing: children inherit the tightened domain
+        fixings = reduced_cost_fixings(self.lp_value, max(incumbent_value, self.feasible_value), 
+                                       [(var.name, var.varValue, var.dj) for var in self.lp.variables()])
+        fixings = {name: value for name, value in fixings.items() if name in self.lp_solution and not self.domain.is_fixed(name)}
+        for var_name, value in fixings.items():
+            self.domain.fix_variable(var_name, value)
+        if fixings and not self.domain.propagate():
+            return [], lp_solve_time
 
         children = []
 
-        branching_option = random.choice(self.branching_options)
+        open_options = [option for option in self.branching_options if not option.is_decided(self.domain)]
+        if not open_options:
+            return children, lp_solve_time
+
+        branching_option = pseudo_costs.select(open_options) if pseudo_costs is not None else random.choice(open_options)
         new_branching_options = self.branching_options.copy()
         new_branching_options.remove(branching_option)
 
@@ -226,10 +899,132 @@ class BnbNode(object):
         return children, lp_solve_time
 
 
+    def spill_state(self):
+        """
+        Returns a picklable description of this open node, without its LP, 
+        for storing it out of memory (see from_spill_state()). 
+        """
+        return {'decisions': self.decisions, 'branching_options': self.branching_options, 'depth': self.depth,
+                'domain': self.domain.bounds(), 'domain_feasible': self.domain_feasible,
+                'parent_lp_value': self.parent_lp_value}
+
+
+    @staticmethod
+    def from_spill_state(state, root, arrays):
+        """
+        Rebuilds an open node from spill_state(), re-adding its branching 
+        decisions to a copy of the root's LP (cuts found below the root are
+        separated again) and restoring its domain over the given ProblemArrays. 
+        """
+        node = BnbNode(None, state['branching_options'])
+        node.decisions = state['decisions']
+        node.depth = state['depth']
+        node.cut_separator = root.cut_separator
+        node.lp = root.lp.copy()
+        for decision in node.decisions:
+            node.lp = decision.add_constraint_to_problem(node.lp)
+        node.domain = NodeDomain.from_bounds(arrays, state['domain'])
+        node.domain_feasible = state['domain_feasible']
+        node.parent_lp_value = state['parent_lp_value']
+        return node
+
+
+    @staticmethod
+    def from_decisions(decisions, root, arrays, parent_lp_value=math.inf):
+        """
+        Rebuilds an open node from its list of decision tuples (see 
+        BranchingDecision.to_tuple()) by replaying them on the root: 
+        on a copy of its LP and of its domain over the given ProblemArrays, 
+        and on its branching options. 
+        """
+        node = BnbNode(None, root.branching_options)
+        node.decisions = [BranchingDecision.from_tuple(decision) for decision in decisions]
+        node.depth = len(node.decisions)
+        node.cut_separator = root.cut_separator
+        node.lp = root.lp.copy()
+        node.domain = root.domain.copy()
+        for decision in node.decisions:
+            node.lp = decision.add_constraint_to_problem(node.lp)
+            decision.apply_to_domain(node.domain)
+            option = decision.branching_option
+            node.branching_options = [other for other in node.branching_options if other.key() != option.key()]
+            if option.decision_type.value == DecisionType.DEPT_DAY.value:
+                if decision.direction == 0:
+                    half = BranchingOption(DecisionType.DEPT_DAY, option.entity_id, option.day, option.lower_bound, decision.threshold)
+                else:
+                    half = BranchingOption(DecisionType.DEPT_DAY, option.entity_id, option.day, decision.threshold + 1, option.upper_bound)
+                node.branching_options.append(half)
+        node.domain_feasible = node.domain.propagate()
+        node.parent_lp_value = parent_lp_value
+        return node
+
+
+    def canonical_key(self):
+        """
+        Returns a hashable key identifying the subproblem at this node 
+        independently of the order of its branching decisions: 
+        a digest of the propagated variable bounds and department intervals. 
+        """
+        return self.domain.key()
+
+
+    def add_domain_fixings_to_lp(self):
+        """
+        Adds a fixing constraint to self.lp for every variable fixed in 
+        self.domain that is not already fixed in the LP. 
+        Returns the number of constraints added. 
+        """
+        variables = self.lp.variablesDict()
+        num_added = 0
+        for var_name, value in self.domain.fixed_variables().items():
+            constraint_name = 'Fix_{0}'.format(var_name)
+            if var_name in variables and constraint_name not in self.lp.constraints:
+                self.lp += variables[var_name] == value, constraint_name
+                num_added += 1
+        return num_added
+
+
     def __str__(self):
         return 'Depth: {0:02d}'.format(self.depth)#\n\tDecisions: {1}'.format(self.depth, self.decisions)
 
 
+class PendingNode(object):
+    """
+    An open node reloaded from the spill file, kept as its spill state 
+    (see BnbNode.spill_state()) until it is popped and rebuilt into a 
+    BnbNode. A node resumed from a checkpoint has only its decisions and 
+    its parent's LP value, and is rebuilt by replaying the decisions. 
+
+    Fields:
+    state - the spill state
+    decisions - the node's list of BranchingDecision objects
+    parent_lp_value - the LP value of the node's parent
+    """
+    def __init__(self, state):
+        self.state = state
+        self.decisions = state['decisions']
+        self.parent_lp_value = state['parent_lp_value']
+
+
+    def spill_state(self):
+        return self.state
+
+
+    def rebuild(self, root, arrays):
+        """Returns the BnbNode, with its LP and domain, below the given root."""
+        if 'domain' in self.state:
+            return BnbNode.from_spill_state(self.state, root, arrays)
+        return BnbNode.from_decisions([decision.to_tuple() for decision in self.decisions], root, arrays,
+                                      self.parent_lp_value)
+
+
+    @staticmethod
+    def from_decisions(decisions, parent_lp_value):
+        """Returns the pending node for a checkpoint's decision tuples."""
+        return PendingNode({'decisions': [BranchingDecision.from_tuple(decision) for decision in decisions],
+                            'parent_lp_value': parent_lp_value})
+
+
 class BranchingOption(object):
     """
     Represents a branching option. 
@@ -252,6 +1047,22 @@ class BranchingOption(object):
         self.upper_bound = upper_bound
 
 
+    def is_decided(self, domain):
+        """
+        Returns True iff branching on this option can no longer split the given NodeDomain.
+        """
+        if self.decision_type.value == DecisionType.PERSON_DAY.value:
+            return domain.is_fixed('{0}_{1}_{2}'.format(pulp_utils.SCHEDULE_VAR_PREFIX, self.entity_id, self.day))
+        elif self.decision_type.value == DecisionType.SYNERGY_DAY.value:
+            return domain.is_fixed('{0}_{1}_{2}'.format(pulp_utils.SYNERGY_VAR_PREFIX, self.entity_id, self.day))
+        return domain.is_dept_day_fixed(self.entity_id, self.day)
+
+
+    def key(self):
+        """Returns a tuple identifying this option (including its department bounds)."""
+        return (self.decision_type.value, self.entity_id, self.day, self.lower_bound, self.upper_bound)
+
+
     def __str__(self):
         return '{0}: id={1}, day={2}'.format(self.decision_type, self.entity_id, self.day)
 
@@ -273,6 +1084,36 @@ class BranchingDecision(object):
         self.threshold = threshold
 
 
+    def to_tuple(self):
+        """Returns a compact picklable tuple describing this decision (see from_tuple())."""
+        return self.branching_option.key() + (self.direction, self.threshold)
+
+
+    @staticmethod
+    def from_tuple(decision):
+        decision_type, entity_id, day, lower_bound, upper_bound, direction, threshold = decision
+        return BranchingDecision(BranchingOption(DecisionType(decision_type), entity_id, day, lower_bound, upper_bound),
+                                 direction, threshold)
+
+
+    def apply_to_domain(self, domain):
+        """
+        Applies this branching decision to the given NodeDomain. 
+        """
+        option = self.branching_option
+        if option.decision_type.value == DecisionType.PERSON_DAY.value:
+            domain.fix_person_day(option.entity_id, option.day, self.direction)
+        elif option.decision_type.value == DecisionType.SYNERGY_DAY.value:
+            domain.fix_synergy_day(option.entity_id, option.day, self.direction)
+        elif option.decision_type.value == DecisionType.DEPT_DAY.value:
+            if self.direction == 0:
+                domain.restrict_dept_day(option.entity_id, option.day, up=self.threshold)
+            else:
+                domain.restrict_dept_day(option.entity_id, option.day, low=self.threshold + 1)
+        else:
+            raise Exception('Unrecognized or unimplemented decision type: {0}'.format(option.decision_type))
+
+
     def add_constraint_to_problem(self, problem):
         """
         Converts this branching decision to a PuLP LpConstraint object
@@ -339,9 +1180,11 @@ if __name__ == '__main__':
     time_limit = 30
 
     bnb_solver = SimpleBnbSolver(people, set_constraints, time_limit=time_limit)
+    metrics = bnb_solver.enable_metrics()
     schedule = bnb_solver.solve()
 
     print('Status:', bnb_solver.status)
+    print(metrics)
 
     # import pdb; pdb.set_trace()
 
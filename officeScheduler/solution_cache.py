@@ -0,0 +1,206 @@
+# Cache of solved instances, keyed by a canonical hash of the instance
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+from officeScheduler.private_files import is_private_file, make_private_directory
+from officeScheduler.Schedule import Schedule
+from officeScheduler.Solver import Solver, SolverStatus
+
+# Statuses that don't depend on the time limit, so they are safe to reuse
+CACHEABLE_STATUSES = [SolverStatus.OPTIMAL, SolverStatus.INFEASIBLE, SolverStatus.UNBOUNDED]
+
+
+def instance_key(num_days, people, set_constraints):
+    """
+    Returns a hex digest identifying the instance, independent of the order
+    of the people, of the sets and of the members within each set.
+    Unbounded department upper bounds (-1) hash the same as the department size.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update('n={0}\n'.format(num_days).encode('utf8'))
+
+    for person in sorted(people, key=lambda person: person.uid):
+        availability = ''.join('1' if available else '0' for available in person.dateList[:num_days])
+        digest.update('P|{0}|{1}\n'.format(person.uid, availability).encode('utf8'))
+
+    set_lines = []
+    for set_constraint in set_constraints:
+        members = sorted(set_constraint.personList)
+        up_bound = set_constraint.up_bound if set_constraint.up_bound >= 0 else len(members)
+        set_lines.append('S|{0}|{1}|{2}|{3}|{4}\n'.format(set_constraint.sid, set_constraint.constraintType.value,
+                                                           set_constraint.low_bound, up_bound, ','.join(members)))
+    for line in sorted(set_lines):
+        digest.update(line.encode('utf8'))
+
+    return digest.hexdigest()
+
+
+class SolutionCache(object):
+    """
+    Two-tier cache of solver results: an in-memory LRU tier and an
+    optional on-disk tier (one pickle file per instance in a directory).
+    Entries store the status and each person's assignments by uid,
+    so a hit can be mapped onto the people in any order.
+
+    Since disk entries are unpickled, the directory is created private
+    (mode 0o700) and must be owned by the current user and not writable by
+    anyone else (private_files.UnsafeCacheDirectoryError otherwise); files
+    owned by other users are ignored, and unreadable ones are removed, as misses.
+
+    Fields:
+        max_entries - capacity of the in-memory tier
+        directory - directory of the on-disk tier (None for memory only)
+        hits, memory_hits, disk_hits, misses - lookup counts
+    """
+    def __init__(self, max_entries=1000, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is not None:
+            make_private_directory(directory)
+
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups answered from either tier (0 before any lookup)."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+    def lookup(self, key):
+        """
+        Returns the (status, {uid: assignments row}) entry stored under key, or None.
+        Disk hits are promoted to the in-memory tier.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.memory_hits += 1
+            return entry
+
+        if self.directory is not None:
+            entry = self._read(self._path(key))
+            if entry is not None:
+                self._store_in_memory(key, entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry
+
+        self.misses += 1
+        return None
+
+
+    def store(self, key, status, schedule):
+        """
+        Stores the status and schedule (None if there is no schedule) under key, in both tiers.
+        """
+        rows = None
+        if schedule is not None and schedule.assignments is not None:
+            rows = {person.uid: np.array(schedule.assignments[i, :]) for i, person in enumerate(schedule.people)}
+        entry = (status, rows)
+        self._store_in_memory(key, entry)
+
+        if self.directory is not None:
+            # Write then rename, so concurrent readers never see a partial file
+            path = self._path(key)
+            temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+            with open(temp_path, 'wb') as cacheFile:
+                pickle.dump((status.value, rows), cacheFile)
+            os.replace(temp_path, path)
+
+
+    def _read(self, path):
+        """Returns the entry stored in the file at path, or None (removing the file if it can't be read)."""
+        try:
+            with open(path, 'rb') as cacheFile:
+                if not is_private_file(cacheFile):
+                    return None # Not written by this user's solvers: never unpickle it
+                status_value, rows = pickle.load(cacheFile)
+                return (SolverStatus(status_value), rows)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+
+    def _store_in_memory(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{0}.pkl'.format(key))
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class CachedSolver(Solver):
+    """
+    Wraps another Solver with a SolutionCache. A hit returns the stored
+    schedule and status without running the wrapped solver; on a miss,
+    the wrapped solver runs and results with a certified status are stored.
+
+    Fields:
+        solver - the wrapped Solver instance
+        cache - the SolutionCache consulted before solving
+        cache_hit - True iff the last solve() was answered from the cache
+        key - the instance key of the last solve()
+    """
+    def __init__(self, solver, cache=None, cacheable_statuses=None):
+        super(CachedSolver, self).__init__(solver.people, solver.set_constraints, solver.time_limit)
+        self.solver = solver
+        self.cache = cache if cache is not None else SolutionCache()
+        self.cacheable_statuses = cacheable_statuses if cacheable_statuses is not None else CACHEABLE_STATUSES
+        self.num_days = len(self.people[0].dateList) if self.people else 0
+        self.cache_hit = False
+        self.key = None
+
+
+    def cancel(self):
+        super(CachedSolver, self).cancel()
+        self.solver.cancel()
+
+
+    def solve(self):
+        # The key must be computed before solving, since some backends normalize the bounds in place
+        self.key = instance_key(self.num_days, self.people, self.set_constraints)
+        entry = self.cache.lookup(self.key)
+        if entry is not None:
+            self.cache_hit = True
+            self.status, rows = entry
+            self.solution = None
+            if rows is not None:
+                self.solution = Schedule(people=self.people)
+                self.solution.n = self.num_days
+                self.solution.assignments = np.array([rows[person.uid] for person in self.people])
+            return self.solution
+
+        self.cache_hit = False
+        forward_progress = lambda event: self.report_progress(event.incumbent, event.bound)
+        self.solver.add_progress_listener(forward_progress)
+        try:
+            self.solution = self.solver.solve()
+        finally:
+            self.solver.remove_progress_listener(forward_progress)
+        self.status = self.solver.status
+
+        if self.status in self.cacheable_statuses:
+            self.cache.store(self.key, self.status, self.solution)
+        return self.solution